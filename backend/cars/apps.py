@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class CarsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'cars' 
\ No newline at end of file
+    name = 'cars'
+
+    def ready(self):
+        import cars.signals
@@ -0,0 +1,91 @@
+from collections import defaultdict
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from .models import Vehicle
+
+# Интервалы годов выпуска: (от, до) включительно, None - без границы
+YEAR_BUCKETS = (
+    (None, 1999),
+    (2000, 2009),
+    (2010, 2014),
+    (2015, 2019),
+    (2020, None),
+)
+
+# Поля с фиксированным набором значений и их подписи
+CHOICE_FACETS = {
+    'fuel_type': dict(Vehicle.FUEL_TYPES),
+    'transmission': dict(Vehicle.TRANSMISSION_TYPES),
+    'vehicle_type': dict(Vehicle.VEHICLE_TYPES),
+}
+
+def year_bucket_expression():
+    """Номер интервала YEAR_BUCKETS для года выпуска"""
+    whens = []
+    for index, (start, end) in enumerate(YEAR_BUCKETS):
+        condition = Q()
+        if start is not None:
+            condition &= Q(year__gte=start)
+        if end is not None:
+            condition &= Q(year__lte=end)
+        whens.append(When(condition, then=Value(index)))
+    return Case(*whens, output_field=IntegerField())
+
+def year_bucket_label(start, end):
+    if start is None:
+        return f'до {end}'
+    if end is None:
+        return f'{start} и новее'
+    return f'{start}-{end}'
+
+def compute_vehicle_facets(queryset):
+    """
+    Количество транспорта по значениям фасетов для отфильтрованного queryset.
+
+    Все фасеты считаются одним запросом: группировка идет по комбинации
+    марки, топлива, трансмиссии, типа и интервала годов, а суммы по
+    каждому фасету собираются из этих групп. Число групп ограничено
+    произведением количества значений и не зависит от размера каталога.
+    """
+    rows = (
+        queryset.order_by().prefetch_related(None)
+        .annotate(year_bucket=year_bucket_expression())
+        .values('brand_id', 'brand__name', *CHOICE_FACETS, 'year_bucket')
+        .annotate(total=Count('pk'))
+    )
+
+    total = 0
+    brands = {}
+    counts = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        total += row['total']
+        brand = brands.setdefault(row['brand_id'], {
+            'value': row['brand_id'],
+            'label': row['brand__name'],
+            'count': 0,
+        })
+        brand['count'] += row['total']
+        for field in CHOICE_FACETS:
+            counts[field][row[field]] += row['total']
+        counts['year'][row['year_bucket']] += row['total']
+
+    facets = {
+        'total': total,
+        'brand': sorted(brands.values(), key=lambda item: (-item['count'], item['label'])),
+    }
+    for field, labels in CHOICE_FACETS.items():
+        facets[field] = [
+            {'value': value, 'label': labels.get(value, value), 'count': count}
+            for value, count in sorted(counts[field].items(), key=lambda item: -item[1])
+        ]
+    facets['year'] = [
+        {
+            'from': start,
+            'to': end,
+            'label': year_bucket_label(start, end),
+            'count': counts['year'][index],
+        }
+        for index, (start, end) in enumerate(YEAR_BUCKETS)
+        if counts['year'].get(index)
+    ]
+    return facets
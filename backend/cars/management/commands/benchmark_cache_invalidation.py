@@ -0,0 +1,89 @@
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from core.decorators import (
+    CACHE_GENERATION_PREFIX, get_cache_generations, invalidate_cache_tags
+)
+
+BENCHMARK_PREFIX = 'view_cache_/benchmark/vehicles/'
+BENCHMARK_TAG = 'benchmark:vehicles'
+
+class Command(BaseCommand):
+    help = 'Сравнивает инвалидацию кэша через delete_pattern (SCAN) и через поколения тегов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keys',
+            type=int,
+            default=100000,
+            help='Количество закэшированных ключей'
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=5,
+            help='Количество повторов каждого замера'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки при заполнении кэша'
+        )
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, 'delete_pattern'):
+            raise CommandError('Бенчмарк требует django-redis (cache.delete_pattern)')
+
+        keys = options['keys']
+        rounds = options['rounds']
+        batch_size = options['batch_size']
+
+        self.stdout.write(f'Ключей в кэше: {keys}, повторов: {rounds}')
+
+        scan_timings = []
+        for _ in range(rounds):
+            self.populate(keys, batch_size)
+            started = time.perf_counter()
+            cache.delete_pattern(f'{BENCHMARK_PREFIX}*')
+            scan_timings.append(time.perf_counter() - started)
+
+        self.populate(keys, batch_size)
+        generation_timings = []
+        lookup_timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            invalidate_cache_tags(BENCHMARK_TAG)
+            generation_timings.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            get_cache_generations([BENCHMARK_TAG])
+            lookup_timings.append(time.perf_counter() - started)
+
+        cache.delete_pattern(f'{BENCHMARK_PREFIX}*')
+        cache.delete_many([f'{CACHE_GENERATION_PREFIX}{BENCHMARK_TAG}'])
+
+        self.report('delete_pattern (SCAN)', scan_timings)
+        self.report('invalidate_cache_tags', generation_timings)
+        self.report('get_cache_generations (чтение)', lookup_timings)
+
+        scan_avg = sum(scan_timings) / len(scan_timings)
+        generation_avg = sum(generation_timings) / len(generation_timings)
+        if generation_avg:
+            self.stdout.write(self.style.SUCCESS(
+                f'Ускорение инвалидации: x{scan_avg / generation_avg:.0f}'
+            ))
+
+    def populate(self, keys, batch_size):
+        payload = b'x' * 512
+        for start in range(0, keys, batch_size):
+            cache.set_many({
+                f'{BENCHMARK_PREFIX}_page={index}': payload
+                for index in range(start, min(start + batch_size, keys))
+            }, 600)
+
+    def report(self, label, timings):
+        avg_ms = sum(timings) / len(timings) * 1000
+        max_ms = max(timings) * 1000
+        self.stdout.write(f'{label}: среднее {avg_ms:.2f} мс, максимум {max_ms:.2f} мс')
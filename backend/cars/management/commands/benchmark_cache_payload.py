@@ -0,0 +1,75 @@
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django_redis import get_redis_connection
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from cars.models import Vehicle
+from cars.serializers import VehicleSerializer
+from core.decorators import pack_response, unpack_response
+
+BENCHMARK_KEY = 'view_cache_/benchmark/vehicles/payload'
+
+class Command(BaseCommand):
+    help = 'Сравнивает кэширование pickled Response и упакованного тела ответа'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=50,
+            help='Количество транспорта на странице'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=1000,
+            help='Количество чтений из кэша для каждого варианта'
+        )
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        self.iterations = options['iterations']
+
+        vehicles = list(
+            Vehicle.objects.select_related('brand', 'model', 'company')
+            .prefetch_related('images', 'features')[:page_size]
+        )
+        if not vehicles:
+            raise CommandError('Нет транспорта для бенчмарка, запустите generate_test_data')
+
+        response = Response(VehicleSerializer(vehicles, many=True).data)
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = 'application/json'
+        response.renderer_context = {}
+        response.render()
+
+        self.stdout.write(
+            f'Страница: {len(vehicles)} единиц транспорта, тело {len(response.content)} байт'
+        )
+
+        self.measure('Response (pickle)', response, lambda entry: entry)
+        self.measure('Тело + заголовки', pack_response(response), unpack_response)
+
+        cache.delete(BENCHMARK_KEY)
+
+    def measure(self, label, entry, restore):
+        cache.set(BENCHMARK_KEY, entry, 600)
+
+        started = time.perf_counter()
+        for _ in range(self.iterations):
+            restore(cache.get(BENCHMARK_KEY))
+        hit_us = (time.perf_counter() - started) / self.iterations * 1000000
+
+        memory = self.memory_usage(BENCHMARK_KEY)
+        memory_label = f'{memory} байт' if memory is not None else 'н/д'
+        self.stdout.write(f'{label}: попадание {hit_us:.1f} мкс, память ключа {memory_label}')
+
+    def memory_usage(self, key):
+        # MEMORY USAGE доступен только при работе с Redis через django-redis
+        try:
+            connection = get_redis_connection('default')
+        except NotImplementedError:
+            return None
+        return connection.memory_usage(cache.make_key(key))
@@ -0,0 +1,92 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from cars.models import Vehicle
+from cars.views import VehicleListView
+from core.pagination import KeysetPagination
+
+BENCHMARK_PAGES = (1, 10, 100, 1000, 5000)
+
+class Command(BaseCommand):
+    help = 'Сравнивает время выборки страницы при OFFSET- и keyset-пагинации'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=20,
+            help='Размер страницы'
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=5,
+            help='Количество повторов каждого замера'
+        )
+        parser.add_argument(
+            '--ordering',
+            default='-created_at',
+            help='Сортировка (одно из ordering_fields VehicleListView)'
+        )
+
+    def handle(self, *args, **options):
+        self.page_size = options['page_size']
+        self.rounds = options['rounds']
+        self.ordering = options['ordering']
+        self.factory = APIRequestFactory()
+        self.view = VehicleListView()
+
+        total = Vehicle.objects.count()
+        pages = [page for page in BENCHMARK_PAGES if (page - 1) * self.page_size < total]
+        if not pages:
+            raise CommandError('Нет транспорта для бенчмарка, запустите generate_test_data')
+
+        self.stdout.write(
+            f'Транспорта: {total}, размер страницы: {self.page_size}, сортировка: {self.ordering}'
+        )
+        for page in pages:
+            offset_ms = self.measure_offset(page)
+            keyset_ms = self.measure_keyset(page)
+            self.stdout.write(
+                f'Страница {page}: OFFSET {offset_ms:.2f} мс, keyset {keyset_ms:.2f} мс'
+            )
+
+    def make_request(self, **params):
+        params['ordering'] = self.ordering
+        return Request(self.factory.get('/api/cars/vehicles/', params))
+
+    def measure_offset(self, page):
+        paginator = PageNumberPagination()
+        paginator.page_size = self.page_size
+        queryset = Vehicle.objects.order_by(self.ordering, '-pk' if self.ordering.startswith('-') else 'pk')
+        request = self.make_request(page=page)
+        return self.timed(lambda: paginator.paginate_queryset(queryset, request, self.view))
+
+    def measure_keyset(self, page):
+        paginator = KeysetPagination()
+        paginator.page_size = self.page_size
+        cursor = self.cursor_for_page(paginator, page)
+        request = self.make_request(cursor=cursor or '')
+        return self.timed(lambda: paginator.paginate_queryset(Vehicle.objects.all(), request, self.view))
+
+    def cursor_for_page(self, paginator, page):
+        """Курсор, указывающий на последнюю запись предыдущей страницы"""
+        if page == 1:
+            return None
+        prefix = '-' if self.ordering.startswith('-') else ''
+        field_name = self.ordering.lstrip('-')
+        boundary = Vehicle.objects.order_by(self.ordering, f'{prefix}pk')[(page - 1) * self.page_size - 1]
+        paginator.ordering = self.ordering
+        paginator.field = Vehicle._meta.get_field(field_name)
+        return paginator.encode_cursor(boundary, False)
+
+    def timed(self, fetch):
+        timings = []
+        for _ in range(self.rounds):
+            started = time.perf_counter()
+            fetch()
+            timings.append(time.perf_counter() - started)
+        return sum(timings) / len(timings) * 1000
@@ -0,0 +1,119 @@
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from cars.models import Brand, Model, Vehicle
+from cars.search import VehicleSearchFilter, update_search_vector
+from cars.views import VehicleListView
+
+# Маркер сгенерированного транспорта для последующего удаления
+BENCHMARK_VIN_PREFIX = 'BENCH'
+BENCHMARK_QUERIES = ('toyota camry', 'дизель', 'кожаный салон', 'полный привод bmw', 'toyta')
+DESCRIPTION_WORDS = (
+    'один владелец', 'кожаный салон', 'полный привод', 'дизель', 'без ДТП',
+    'full service history', 'leather seats', 'sunroof', 'гаражное хранение', 'зимняя резина'
+)
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск транспорта через SearchFilter (ILIKE) и полнотекстовый VehicleSearchFilter'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--populate',
+            type=int,
+            default=0,
+            help='Сгенерировать указанное количество транспорта перед замером (например, 1000000)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Размер пачки bulk_create при генерации'
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=3,
+            help='Количество повторов каждого запроса'
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help='Удалить сгенерированный транспорт после замера'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Бенчмарк требует PostgreSQL')
+
+        self.factory = APIRequestFactory()
+        self.rounds = options['rounds']
+
+        if options['populate']:
+            self.populate(options['populate'], options['batch_size'])
+
+        total = Vehicle.objects.count()
+        if not total:
+            raise CommandError('Нет транспорта для бенчмарка, используйте --populate')
+        self.stdout.write(f'Транспорта: {total}')
+
+        for search in BENCHMARK_QUERIES:
+            ilike_ms, ilike_count = self.measure(filters.SearchFilter(), search)
+            fts_ms, fts_count = self.measure(VehicleSearchFilter(), search)
+            self.stdout.write(
+                f'"{search}": ILIKE {ilike_ms:.1f} мс ({ilike_count}), '
+                f'полнотекстовый {fts_ms:.1f} мс ({fts_count})'
+            )
+
+        if options['cleanup']:
+            deleted, _ = Vehicle.objects.filter(vin__startswith=BENCHMARK_VIN_PREFIX).delete()
+            self.stdout.write(f'Удалено сгенерированных объектов: {deleted}')
+
+    def populate(self, count, batch_size):
+        models = list(Model.objects.select_related('brand'))
+        if not models:
+            brand, _ = Brand.objects.get_or_create(name='Toyota')
+            model, _ = Model.objects.get_or_create(brand=brand, name='Camry')
+            models = [model]
+
+        offset = Vehicle.objects.filter(vin__startswith=BENCHMARK_VIN_PREFIX).count()
+        started = time.perf_counter()
+        for start in range(0, count, batch_size):
+            Vehicle.objects.bulk_create([
+                self.build_vehicle(offset + index, random.choice(models))
+                for index in range(start, min(start + batch_size, count))
+            ])
+        # bulk_create не отправляет post_save, вектор пересчитывается отдельно
+        update_search_vector(Vehicle.objects.filter(vin__startswith=BENCHMARK_VIN_PREFIX))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE cars_vehicle')
+        self.stdout.write(
+            f'Сгенерировано {count} объектов за {time.perf_counter() - started:.1f} с'
+        )
+
+    def build_vehicle(self, index, model):
+        return Vehicle(
+            brand_id=model.brand_id,
+            model=model,
+            year=random.randint(1995, 2024),
+            price=random.randint(100, 10000) * 1000,
+            description=', '.join(random.sample(DESCRIPTION_WORDS, 3)),
+            vin=f'{BENCHMARK_VIN_PREFIX}{index:012d}'
+        )
+
+    def measure(self, backend, search):
+        view = VehicleListView()
+        request = Request(self.factory.get('/api/cars/vehicles/', {'search': search}))
+        base = VehicleListView.queryset.all()
+
+        timings = []
+        for _ in range(self.rounds):
+            started = time.perf_counter()
+            queryset = backend.filter_queryset(request, base, view)
+            results = list(queryset[:20])
+            timings.append(time.perf_counter() - started)
+        return sum(timings) / len(timings) * 1000, len(results)
@@ -0,0 +1,172 @@
+import re
+import time
+from itertools import combinations
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from cars.models import Vehicle
+from cars.views import VehicleListView
+
+# Использование индексов в планах PostgreSQL и SQLite
+INDEX_PATTERN = re.compile(
+    r'Index(?: Only)? Scan(?: Backward)? (?:using|on) (\w+)|USING (?:COVERING )?INDEX (\w+)'
+)
+SEQ_SCAN_PATTERN = re.compile(r'Seq Scan on cars_vehicle\b|SCAN cars_vehicle\b(?! USING)')
+
+class Command(BaseCommand):
+    help = 'Прогоняет комбинации filterset_fields каталога и выводит планы EXPLAIN и время запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-fields',
+            type=int,
+            default=2,
+            help='Максимальное количество фильтров в одной комбинации'
+        )
+        parser.add_argument(
+            '--ordering',
+            action='append',
+            help='Сортировка для проверки (можно указать несколько раз), по умолчанию -created_at и price'
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=3,
+            help='Количество повторов каждого запроса'
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Выполнять EXPLAIN ANALYZE (только PostgreSQL)'
+        )
+        parser.add_argument(
+            '--plans',
+            action='store_true',
+            help='Печатать полный план запроса'
+        )
+        parser.add_argument(
+            '--compare-indexes',
+            action='store_true',
+            help='Повторять замеры без каждого использованного индекса: индекс удаляется '
+                 'внутри транзакции, которая затем откатывается. Удаление блокирует '
+                 'cars_vehicle до отката, запускать только на тестовой базе'
+        )
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        self.rounds = options['rounds']
+        self.analyze = options['analyze'] and connection.vendor == 'postgresql'
+        self.show_plans = options['plans']
+        self.compare_indexes = options['compare_indexes']
+        orderings = options['ordering'] or ['-created_at', 'price']
+
+        sample_values = self.get_sample_values()
+        if not sample_values:
+            raise CommandError('Нет транспорта для проверки, запустите generate_test_data')
+
+        fields = list(sample_values)
+        filter_sets = [()]
+        for size in range(1, options['max_fields'] + 1):
+            filter_sets.extend(combinations(fields, size))
+
+        self.stdout.write(
+            f'Комбинаций фильтров: {len(filter_sets)}, сортировок: {len(orderings)}, '
+            f'СУБД: {connection.vendor}'
+        )
+        unindexed = 0
+        for ordering in orderings:
+            for filter_set in filter_sets:
+                params = {field: sample_values[field] for field in filter_set}
+                params['ordering'] = ordering
+                if not self.report(params):
+                    unindexed += 1
+
+        if unindexed:
+            self.stdout.write(self.style.WARNING(f'Запросов без индекса: {unindexed}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Все запросы используют индексы'))
+
+    def get_sample_values(self):
+        """Самое частое значение каждого фильтра среди опубликованного транспорта"""
+        queryset = Vehicle.objects.filter(is_active=True, is_available=True)
+        values = {}
+        for field in VehicleListView.filterset_fields:
+            row = (
+                queryset.exclude(**{f'{field}__isnull': True})
+                .values(field).annotate(total=Count('pk')).order_by('-total').first()
+            )
+            if row:
+                values[field] = row[field]
+        return values
+
+    def get_queryset(self, params):
+        view = VehicleListView()
+        view.request = Request(self.factory.get('/api/cars/vehicles/', params))
+        view.args, view.kwargs, view.format_kwarg = (), {}, None
+        queryset = view.filter_queryset(view.get_queryset())
+        return queryset[:view.paginator.get_page_size(view.request) or 10]
+
+    def measure(self, params):
+        """Среднее время выполнения в мс, каждый повтор на новом QuerySet без кэша результатов"""
+        timings = []
+        for _ in range(self.rounds):
+            queryset = self.get_queryset(params)
+            started = time.perf_counter()
+            list(queryset)
+            timings.append(time.perf_counter() - started)
+        return sum(timings) / len(timings) * 1000
+
+    def explain(self, params):
+        queryset = self.get_queryset(params)
+        return queryset.explain(analyze=True) if self.analyze else queryset.explain()
+
+    def droppable_indexes(self):
+        """Обычные индексы cars_vehicle, без первичного ключа и ограничений уникальности"""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Vehicle._meta.db_table)
+        return {
+            name for name, info in constraints.items()
+            if info['index'] and not info['primary_key'] and not info['unique']
+        }
+
+    def report_without_index(self, params, index, avg_ms):
+        """Замер без индекса: DROP INDEX в транзакции с последующим откатом"""
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(index)}')
+            # SQLite переиспользует подготовленный EXPLAIN из кэша соединения со старым планом,
+            # поэтому запасной план показывается только для PostgreSQL
+            plan = self.explain(params) if connection.vendor == 'postgresql' else None
+            without_ms = self.measure(params)
+            transaction.set_rollback(True)
+
+        line = f'    без {index}: {without_ms:.2f} мс ({without_ms - avg_ms:+.2f} мс)'
+        if plan is not None:
+            fallback = sorted({name for match in INDEX_PATTERN.findall(plan) for name in match if name})
+            line += f", индексы: {', '.join(fallback) if fallback else 'нет'}"
+        self.stdout.write(line)
+
+    def report(self, params):
+        plan = self.explain(params)
+        avg_ms = self.measure(params)
+
+        indexes = sorted({name for match in INDEX_PATTERN.findall(plan) for name in match if name})
+        seq_scan = bool(SEQ_SCAN_PATTERN.search(plan))
+        label = ', '.join(f'{key}={value}' for key, value in params.items())
+        used = ', '.join(indexes) if indexes else 'нет'
+        line = f'{label}: {avg_ms:.2f} мс, индексы: {used}'
+        if seq_scan:
+            self.stdout.write(self.style.WARNING(f'{line}, Seq Scan по cars_vehicle'))
+        else:
+            self.stdout.write(line)
+        if self.show_plans:
+            self.stdout.write(plan)
+        if self.compare_indexes:
+            droppable = self.droppable_indexes()
+            for index in indexes:
+                if index in droppable:
+                    self.report_without_index(params, index, avg_ms)
+        return not seq_scan
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from cars.models import Vehicle
+from cars.search import update_search_vector
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковый вектор транспорта (после миграции или bulk_create)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Количество транспорта в одном UPDATE'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        bounds = Vehicle.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            self.stdout.write('Транспорт не найден')
+            return
+
+        updated = 0
+        # Пачки по диапазонам pk, чтобы не держать блокировку на всей таблице
+        for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+            updated += update_search_vector(
+                Vehicle.objects.filter(pk__gte=start, pk__lt=start + batch_size)
+            )
+        self.stdout.write(self.style.SUCCESS(f'Обновлено поисковых векторов: {updated}'))
@@ -1,4 +1,6 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -6,6 +8,8 @@ from django.core.exceptions import ValidationError
 import re
 from django.utils import timezone
 
+from core.mixins import ChangeTrackingMixin
+
 def validate_vin(value):
     """Валидация VIN номера"""
     if not value:
@@ -58,6 +62,10 @@ class Brand(models.Model):
         verbose_name = 'Марка'
         verbose_name_plural = 'Марки'
         ordering = ['name']
+        indexes = [
+            # Нечеткий поиск марки (pg_trgm)
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='brand_name_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -75,12 +83,19 @@ class Model(models.Model):
         verbose_name_plural = 'Модели'
         unique_together = ('brand', 'name')
         ordering = ['brand', 'name']
+        indexes = [
+            # Нечеткий поиск модели (pg_trgm)
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='model_name_trgm_idx'),
+        ]
 
     def __str__(self):
         return f"{self.brand.name} {self.name}"
 
-class Vehicle(models.Model):
+class Vehicle(ChangeTrackingMixin, models.Model):
     """Универсальная модель транспорта"""
+    # Поля счетчиков дашборда
+    tracked_fields = ['is_available', 'created_at']
+
     VEHICLE_TYPES = [
         ('car', 'Автомобиль'),
         ('motorcycle', 'Мотоцикл'),
@@ -131,6 +146,8 @@ class Vehicle(models.Model):
     company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, related_name='vehicles', null=True, blank=True, default=None, verbose_name='Компания')
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
     updated_at = models.DateTimeField('Дата обновления', auto_now=True)
+    # Поддерживается сигналами cars.signals, см. cars.search.build_search_vector
+    search_vector = SearchVectorField('Поисковый вектор', null=True, editable=False)
 
     class Meta:
         verbose_name = 'Транспорт'
@@ -146,6 +163,40 @@ class Vehicle(models.Model):
             models.Index(fields=['company']),
             models.Index(fields=['brand']),
             models.Index(fields=['model']),
+            # Составные индексы для keyset-пагинации по (поле сортировки, id)
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['year', 'id']),
+            models.Index(fields=['mileage', 'id']),
+            # Частичные индексы под каталог: VehicleListView всегда фильтрует
+            # is_active=True, is_available=True, поэтому индексируются только
+            # опубликованные объявления. Проверка: manage.py explain_vehicle_filters
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_active=True, is_available=True),
+                name='vehicle_listed_created_idx'
+            ),
+            models.Index(
+                fields=['vehicle_type', '-created_at'],
+                condition=models.Q(is_active=True, is_available=True),
+                name='vehicle_listed_type_idx'
+            ),
+            models.Index(
+                fields=['vehicle_type', 'brand', 'price'],
+                condition=models.Q(is_active=True, is_available=True),
+                name='vehicle_listed_type_brand_idx'
+            ),
+            models.Index(
+                fields=['brand', 'model', 'year'],
+                condition=models.Q(is_active=True, is_available=True),
+                name='vehicle_listed_brand_model_idx'
+            ),
+            models.Index(
+                fields=['year', 'price'],
+                condition=models.Q(is_active=True, is_available=True),
+                name='vehicle_listed_year_price_idx'
+            ),
+            GinIndex(fields=['search_vector'], name='vehicle_search_vector_idx'),
         ]
 
     def __str__(self):
@@ -0,0 +1,97 @@
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+)
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from .models import Brand, Model, Vehicle
+
+# Конфигурации словарей: объявления пишут по-русски, марки и модели - латиницей
+SEARCH_CONFIGS = ('russian', 'english')
+
+def build_search_vector():
+    """
+    Выражение tsvector для транспорта.
+
+    Марка и модель берутся подзапросами, так как UPDATE не допускает
+    JOIN. Название (марка и модель) получает вес A, описание - вес B.
+    """
+    brand_name = Subquery(Brand.objects.filter(pk=OuterRef('brand_id')).values('name')[:1])
+    model_name = Subquery(Model.objects.filter(pk=OuterRef('model_id')).values('name')[:1])
+
+    vector = None
+    for config in SEARCH_CONFIGS:
+        part = (
+            SearchVector(brand_name, model_name, config=config, weight='A') +
+            SearchVector('description', config=config, weight='B')
+        )
+        vector = part if vector is None else vector + part
+    return vector
+
+def update_search_vector(queryset=None):
+    """Пересчитывает поисковый вектор для транспорта из queryset"""
+    if connection.vendor != 'postgresql':
+        return 0
+    if queryset is None:
+        queryset = Vehicle.objects.all()
+    return queryset.update(search_vector=build_search_vector())
+
+def build_search_query(search_terms):
+    """Запрос websearch, объединяющий русскую и английскую конфигурации"""
+    query = None
+    for config in SEARCH_CONFIGS:
+        part = SearchQuery(search_terms, config=config, search_type='websearch')
+        query = part if query is None else query | part
+    return query
+
+class VehicleSearchFilter(filters.SearchFilter):
+    """
+    Полнотекстовый поиск транспорта для PostgreSQL.
+
+    Заменяет SearchFilter без изменения параметра запроса (search).
+    Ищет по search_vector через GIN-индекс и сортирует по релевантности,
+    если клиент не передал ordering. Если полнотекстовый поиск ничего не
+    нашел, выполняется нечеткий поиск по триграммам марки и модели
+    (оператор % из pg_trgm), чтобы находились запросы с опечатками.
+    На других СУБД работает как обычный SearchFilter.
+
+    Идентификаторы из exact_search_fields, перечисленные в search_fields
+    представления (например, VIN), ищутся точным совпадением.
+
+    Должен стоять после OrderingFilter, иначе сортировка по умолчанию
+    перекроет сортировку по релевантности.
+    """
+    exact_search_fields = ('vin',)
+
+    def filter_queryset(self, request, queryset, view):
+        if connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        search_terms = ' '.join(self.get_search_terms(request))
+        if not search_terms:
+            return queryset
+
+        query = build_search_query(search_terms)
+        condition = Q(search_vector=query)
+        for field in self.exact_search_fields:
+            if field in self.get_search_fields(view, request):
+                condition |= Q(**{f'{field}__iexact': search_terms})
+
+        matches = queryset.filter(condition)
+        if matches.exists():
+            matches = matches.annotate(search_rank=SearchRank(F('search_vector'), query))
+        else:
+            matches = queryset.filter(
+                Q(brand__name__trigram_similar=search_terms) |
+                Q(model__name__trigram_similar=search_terms)
+            ).annotate(search_rank=Greatest(
+                TrigramSimilarity('brand__name', search_terms),
+                TrigramSimilarity('model__name', search_terms)
+            ))
+
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return matches
+        return matches.order_by('-search_rank', '-created_at', '-pk')
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from .models import Brand, Model, Car, VehicleImage, VehicleFeature
 from .models import CarImage, CarFeature
 from companies.serializers import CompanySerializer
+from core.mixins import EagerLoadingSerializerMixin, MainImageSerializerMixin
 from .models import (
     Vehicle, Motorcycle, Boat, Aircraft,
     Auction, AuctionBid,
@@ -45,8 +46,12 @@ class VehicleFeatureSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'value', 'created_at')
         read_only_fields = ('id', 'created_at')
 
-class VehicleSerializer(serializers.ModelSerializer):
+class VehicleSerializer(EagerLoadingSerializerMixin, MainImageSerializerMixin, serializers.ModelSerializer):
     """Serializer for Vehicle model"""
+    select_related_fields = ('brand', 'model__brand', 'company')
+    prefetch_related_fields = ('images', 'features', 'company__images')
+    main_image_serializer_class = VehicleImageSerializer
+
     brand = BrandSerializer(read_only=True)
     model = ModelSerializer(read_only=True)
     images = VehicleImageSerializer(many=True, read_only=True)
@@ -68,12 +73,6 @@ class VehicleSerializer(serializers.ModelSerializer):
         from companies.serializers import CompanyListSerializer
         return CompanyListSerializer(obj.company).data if obj.company else None
 
-    def get_main_image(self, obj):
-        image = obj.images.filter(is_main=True).first()
-        if image:
-            return VehicleImageSerializer(image).data
-        return None
-
 class VehicleCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating Vehicle"""
     brand_id = serializers.PrimaryKeyRelatedField(
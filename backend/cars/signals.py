@@ -0,0 +1,31 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Brand, Model, Vehicle
+from .search import update_search_vector
+
+# Поля, от которых зависит поисковый вектор транспорта
+SEARCH_VECTOR_FIELDS = {'brand', 'model', 'description'}
+
+
+@receiver(post_save, sender=Vehicle)
+def update_vehicle_search_vector(sender, instance, update_fields=None, **kwargs):
+    """Обновление поискового вектора транспорта"""
+    if update_fields is not None and not SEARCH_VECTOR_FIELDS & set(update_fields):
+        return
+    # QuerySet.update не отправляет post_save, рекурсии нет
+    update_search_vector(Vehicle.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Brand)
+def update_brand_search_vectors(sender, instance, created, **kwargs):
+    """Обновление поисковых векторов транспорта при переименовании марки"""
+    if not created:
+        update_search_vector(Vehicle.objects.filter(brand=instance))
+
+
+@receiver(post_save, sender=Model)
+def update_model_search_vectors(sender, instance, created, **kwargs):
+    """Обновление поисковых векторов транспорта при переименовании модели"""
+    if not created:
+        update_search_vector(Vehicle.objects.filter(model=instance))
@@ -5,11 +5,17 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from decimal import Decimal
 from django.utils import timezone
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from datetime import timedelta
 
+from .views import invalidate_vehicle_cache
 from .models import (
     Vehicle, Car, Motorcycle, Boat, Aircraft, Brand, Model,
-    Auction, AuctionLot, AuctionBid,
+    VehicleImage, VehicleFeature,
+    Auction, AuctionBid,
     LeasingCompany, LeasingProgram, LeasingApplication,
     InsuranceCompany, InsuranceType, InsurancePolicy
 )
@@ -123,13 +129,14 @@ class AuctionModelTest(TestCase):
         self.assertEqual(auction.status, 'scheduled')
         self.assertFalse(auction.is_active)
         
-    def test_auction_lot_creation(self):
-        """Тест создания лота аукциона"""
+    def test_auction_vehicle_link(self):
+        """Тест связи аукциона с транспортом (вместо удаленных лотов)"""
         auction = Auction.objects.create(
             title='Аукцион Toyota Camry',
             description='Продажа автомобиля',
             auction_type='english',
             status='active',
+            vehicle=self.vehicle,
             start_date=timezone.now() - timedelta(hours=1),
             end_date=timezone.now() + timedelta(days=6),
             min_bid=Decimal('100000.00'),
@@ -138,17 +145,9 @@ class AuctionModelTest(TestCase):
             created_by=self.user
         )
         
-        lot = AuctionLot.objects.create(
-            auction=auction,
-            vehicle=self.vehicle,
-            lot_number=1,
-            starting_price=Decimal('100000.00'),
-            current_price=Decimal('100000.00')
-        )
-        
-        self.assertEqual(lot.lot_number, 1)
-        self.assertEqual(lot.vehicle, self.vehicle)
-        self.assertFalse(lot.is_sold)
+        self.assertEqual(auction.vehicle, self.vehicle)
+        self.assertEqual(list(self.vehicle.auctions.all()), [auction])
+        self.assertTrue(auction.is_active)
 
 class LeasingModelTest(TestCase):
     """Тесты для моделей лизинга"""
@@ -388,4 +387,143 @@ class AuctionAPITest(APITestCase):
         
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Auction.objects.count(), 1)
-        self.assertEqual(Auction.objects.first().title, 'Аукцион Toyota Camry') 
\ No newline at end of file
+        self.assertEqual(Auction.objects.first().title, 'Аукцион Toyota Camry')
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class VehicleQueryCountTest(APITestCase):
+    """Тесты количества запросов при сериализации транспорта"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.company = Company.objects.create(
+            name='Test Company',
+            owner=self.user,
+            city='Moscow'
+        )
+        self.brand = Brand.objects.create(name='Toyota')
+        self.model = Model.objects.create(brand=self.brand, name='Camry')
+
+    def create_vehicles(self, count):
+        for index in range(count):
+            vehicle = Vehicle.objects.create(
+                vehicle_type='car',
+                brand=self.brand,
+                model=self.model,
+                year=2020,
+                company=self.company
+            )
+            VehicleImage.objects.create(vehicle=vehicle, image=f'vehicles/{index}.jpg', is_main=True)
+            VehicleFeature.objects.create(vehicle=vehicle, name='Цвет салона', value='Черный')
+
+    def count_list_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('vehicle-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        """Тест: количество запросов списка не зависит от числа транспорта на странице"""
+        self.create_vehicles(2)
+        small_page_queries = self.count_list_queries()
+
+        self.create_vehicles(8)
+        full_page_queries = self.count_list_queries()
+
+        self.assertEqual(small_page_queries, full_page_queries)
+
+class VehicleKeysetPaginationTest(APITestCase):
+    """Тесты keyset-пагинации списка транспорта"""
+
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name='Toyota')
+        model = Model.objects.create(brand=brand, name='Camry')
+        # Повторяющиеся цены проверяют разрешение равенства по id
+        for index in range(25):
+            Vehicle.objects.create(
+                vehicle_type='car',
+                brand=brand,
+                model=model,
+                price=Decimal(1000000 + (index % 5) * 100000)
+            )
+
+    def fetch(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_cursor_walks_all_vehicles_without_duplicates(self):
+        """Тест: проход по курсорам возвращает каждый транспорт ровно один раз в порядке сортировки"""
+        data = self.fetch(reverse('vehicle-list'), {'cursor': '', 'ordering': '-price'})
+        pages = [data]
+        while data['next']:
+            data = self.fetch(data['next'])
+            pages.append(data)
+
+        ids = [item['id'] for page in pages for item in page['results']]
+        expected = list(Vehicle.objects.order_by('-price', '-pk').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertGreater(len(pages), 1)
+
+        previous = self.fetch(pages[-1]['previous'])
+        self.assertEqual(
+            [item['id'] for item in previous['results']],
+            [item['id'] for item in pages[-2]['results']]
+        )
+
+    def test_invalid_cursor_returns_not_found(self):
+        """Тест: поврежденный курсор возвращает 404"""
+        response = self.client.get(reverse('vehicle-list'), {'cursor': 'broken'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class VehicleFacetsTest(APITestCase):
+    """Тесты фасетов каталога транспорта"""
+
+    def setUp(self):
+        cache.clear()
+        self.toyota = Brand.objects.create(name='Toyota')
+        self.bmw = Brand.objects.create(name='BMW')
+        camry = Model.objects.create(brand=self.toyota, name='Camry')
+        x5 = Model.objects.create(brand=self.bmw, name='X5')
+        for year in (1998, 2012, 2021):
+            Vehicle.objects.create(brand=self.toyota, model=camry, year=year, fuel_type='petrol')
+        Vehicle.objects.create(brand=self.bmw, model=x5, year=2021, fuel_type='diesel', transmission='automatic')
+        Vehicle.objects.create(brand=self.bmw, model=x5, year=2021, is_available=False)
+
+    def test_facet_counts_in_single_query(self):
+        """Тест: все фасеты считаются одним запросом по опубликованному транспорту"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('vehicle-facets'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(response.data['total'], 4)
+        self.assertEqual(
+            [(item['label'], item['count']) for item in response.data['brand']],
+            [('Toyota', 3), ('BMW', 1)]
+        )
+        self.assertEqual(
+            {item['value']: item['count'] for item in response.data['fuel_type']},
+            {'petrol': 3, 'diesel': 1}
+        )
+        self.assertEqual(
+            [(item['from'], item['to'], item['count']) for item in response.data['year']],
+            [(None, 1999, 1), (2010, 2014, 1), (2020, None, 2)]
+        )
+
+    def test_facets_follow_list_filters_and_invalidation(self):
+        """Тест: фасеты учитывают фильтры списка и сбрасываются вместе с ним"""
+        url = reverse('vehicle-facets')
+        self.assertEqual(self.client.get(url, {'fuel_type': 'diesel'}).json()['total'], 1)
+
+        Vehicle.objects.filter(fuel_type='diesel').update(fuel_type='petrol')
+        self.assertEqual(self.client.get(url, {'fuel_type': 'diesel'}).json()['total'], 1)
+
+        invalidate_vehicle_cache()
+        self.assertEqual(self.client.get(url, {'fuel_type': 'diesel'}).json()['total'], 0)
@@ -17,6 +17,7 @@ urlpatterns = [
     
     # Vehicle URLs
     path('vehicles/', views.VehicleListView.as_view(), name='vehicle-list'),
+    path('vehicles/facets/', views.VehicleFacetsView.as_view(), name='vehicle-facets'),
     path('vehicles/<int:pk>/', views.VehicleDetailView.as_view(), name='vehicle-detail'),
     path('vehicles/create/', views.VehicleCreateView.as_view(), name='vehicle-create'),
     path('vehicles/<int:pk>/update/', views.VehicleUpdateView.as_view(), name='vehicle-update'),
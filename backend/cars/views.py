@@ -1,14 +1,19 @@
 from rest_framework import generics, status, permissions, filters, viewsets
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.cache import cache
-from core.decorators import cache_response
+from core.decorators import cache_response, invalidate_cache_tags
+from core.mixins import EagerLoadingMixin
+from core.pagination import CatalogPagination
 from core.services import NotificationService
 from .models import (
     Brand, Model, Vehicle, Motorcycle, Boat, Aircraft,
     VehicleImage, VehicleFeature
 )
+from .facets import compute_vehicle_facets
+from .search import VehicleSearchFilter
 from .serializers import (
     BrandSerializer,
     ModelSerializer,
@@ -25,28 +30,55 @@ from .serializers import (
 )
 from companies.models import Company
 
-class VehicleListView(generics.ListAPIView):
+# Теги кэша транспорта: общий тег списков и тег конкретного транспорта
+VEHICLE_LIST_CACHE_TAG = 'vehicles'
+VEHICLE_CACHE_TAG = 'vehicle:{pk}'
+
+def invalidate_vehicle_cache(vehicle_id=None):
+    """Инвалидирует кэш списков транспорта и, при необходимости, деталей"""
+    tags = [VEHICLE_LIST_CACHE_TAG]
+    if vehicle_id is not None:
+        tags.append(VEHICLE_CACHE_TAG.format(pk=vehicle_id))
+    invalidate_cache_tags(*tags)
+
+class VehicleListView(EagerLoadingMixin, generics.ListAPIView):
     """Список транспорта"""
     queryset = Vehicle.objects.filter(is_active=True, is_available=True)
     serializer_class = VehicleSerializer
     permission_classes = (permissions.AllowAny,)
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, VehicleSearchFilter]
+    pagination_class = CatalogPagination
     filterset_fields = ['vehicle_type', 'brand', 'model', 'year', 'transmission', 'fuel_type', 'company']
     search_fields = ['brand__name', 'model__name', 'description']
     ordering_fields = ['price', 'year', 'mileage', 'created_at']
     ordering = ['-created_at']
 
-    @cache_response(timeout=300)  # Кэшируем на 5 минут
+    @cache_response(timeout=300, tags=[VEHICLE_LIST_CACHE_TAG])  # Кэшируем на 5 минут
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
-class VehicleDetailView(generics.RetrieveAPIView):
+class VehicleFacetsView(generics.GenericAPIView):
+    """Количество транспорта по фасетам каталога для текущих фильтров"""
+    queryset = VehicleListView.queryset
+    permission_classes = (permissions.AllowAny,)
+    filter_backends = [DjangoFilterBackend, VehicleSearchFilter]
+    filterset_fields = VehicleListView.filterset_fields
+    search_fields = VehicleListView.search_fields
+    pagination_class = None
+
+    # Тот же тег, что и у списка: фасеты сбрасываются вместе с ним
+    @cache_response(timeout=300, tags=[VEHICLE_LIST_CACHE_TAG])
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(compute_vehicle_facets(queryset))
+
+class VehicleDetailView(EagerLoadingMixin, generics.RetrieveAPIView):
     """Детали транспорта"""
     queryset = Vehicle.objects.filter(is_active=True)
     serializer_class = VehicleSerializer
     permission_classes = (permissions.AllowAny,)
 
-    @cache_response(timeout=300)  # Кэшируем на 5 минут
+    @cache_response(timeout=300, tags=[VEHICLE_CACHE_TAG])  # Кэшируем на 5 минут
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
@@ -60,7 +92,7 @@ class VehicleCreateView(generics.CreateAPIView):
         company = Company.objects.get(user=self.request.user)
         serializer.save(company=company)
         # Очищаем кэш списка транспорта
-        cache.delete_pattern("view_cache_/api/vehicles/*")
+        invalidate_vehicle_cache()
 
 class VehicleUpdateView(generics.UpdateAPIView):
     """Обновление транспорта"""
@@ -74,8 +106,7 @@ class VehicleUpdateView(generics.UpdateAPIView):
     def perform_update(self, serializer):
         serializer.save()
         # Очищаем кэш для обновленного транспорта
-        cache.delete_pattern(f"view_cache_/api/vehicles/{self.kwargs['pk']}/*")
-        cache.delete_pattern("view_cache_/api/vehicles/*")
+        invalidate_vehicle_cache(self.kwargs['pk'])
 
 class VehicleDeleteView(generics.DestroyAPIView):
     """Удаление транспорта"""
@@ -88,8 +119,7 @@ class VehicleDeleteView(generics.DestroyAPIView):
     def perform_destroy(self, instance):
         instance.delete()
         # Очищаем кэш для удаленного транспорта
-        cache.delete_pattern(f"view_cache_/api/vehicles/{self.kwargs['pk']}/*")
-        cache.delete_pattern("view_cache_/api/vehicles/*")
+        invalidate_vehicle_cache(self.kwargs['pk'])
 
 class VehicleImageListView(generics.ListCreateAPIView):
     """Список изображений транспорта"""
@@ -112,7 +142,7 @@ class VehicleImageListView(generics.ListCreateAPIView):
             raise permissions.PermissionDenied("Вы не можете добавлять изображения к чужому транспорту")
         serializer.save(vehicle=vehicle)
         # Очищаем кэш для транспорта
-        cache.delete_pattern(f"view_cache_/api/vehicles/{vehicle_id}/*")
+        invalidate_vehicle_cache(vehicle_id)
 
 class VehicleImageDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Детали изображения транспорта"""
@@ -138,12 +168,12 @@ class VehicleImageDetailView(generics.RetrieveUpdateDestroyAPIView):
     def perform_update(self, serializer):
         serializer.save()
         # Очищаем кэш для транспорта
-        cache.delete_pattern(f"view_cache_/api/vehicles/{self.kwargs['vehicle_id']}/*")
+        invalidate_vehicle_cache(self.kwargs['vehicle_id'])
 
     def perform_destroy(self, instance):
         instance.delete()
         # Очищаем кэш для транспорта
-        cache.delete_pattern(f"view_cache_/api/vehicles/{self.kwargs['vehicle_id']}/*")
+        invalidate_vehicle_cache(self.kwargs['vehicle_id'])
 
 class VehicleAvailabilityView(APIView):
     """Изменение статуса доступности транспорта"""
@@ -160,8 +190,7 @@ class VehicleAvailabilityView(APIView):
             # Отправляем уведомление об изменении статуса
             NotificationService.notify_vehicle_status(vehicle.company.user, vehicle)
             # Очищаем кэш для транспорта
-            cache.delete_pattern(f"view_cache_/api/vehicles/{pk}/*")
-            cache.delete_pattern("view_cache_/api/vehicles/*")
+            invalidate_vehicle_cache(pk)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except Vehicle.DoesNotExist:
             return Response(
@@ -188,11 +217,12 @@ class ModelViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'created_at']
 
-class VehicleViewSet(viewsets.ModelViewSet):
+class VehicleViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     """ViewSet for Vehicle model"""
     queryset = Vehicle.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = CatalogPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, VehicleSearchFilter]
     filterset_fields = ['vehicle_type', 'brand', 'model', 'year', 'is_available', 'company']
     search_fields = ['brand__name', 'model__name', 'description', 'vin']
     ordering_fields = ['price', 'year', 'mileage', 'created_at']
@@ -211,16 +241,26 @@ class VehicleViewSet(viewsets.ModelViewSet):
             serializer.save(company=company)
         else:
             serializer.save()
+        # Очищаем кэш
+        invalidate_vehicle_cache()
 
     def perform_update(self, serializer):
         serializer.save()
         # Очищаем кэш
-        cache.delete_pattern("view_cache_/api/vehicles/*")
+        invalidate_vehicle_cache(serializer.instance.pk)
 
     def perform_destroy(self, instance):
+        vehicle_id = instance.pk
         instance.delete()
         # Очищаем кэш
-        cache.delete_pattern("view_cache_/api/vehicles/*")
+        invalidate_vehicle_cache(vehicle_id)
+
+    @action(detail=False, methods=['get'])
+    @cache_response(timeout=300, tags=[VEHICLE_LIST_CACHE_TAG])
+    def facets(self, request, *args, **kwargs):
+        """Количество транспорта по фасетам для текущих фильтров"""
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(compute_vehicle_facets(queryset))
 
 # ============================================================================
 # VEHICLE VIEWSETS
@@ -4,8 +4,13 @@ from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
-class Company(models.Model):
+from core.mixins import ChangeTrackingMixin
+
+class Company(ChangeTrackingMixin, models.Model):
     """Модель компании"""
+    # Поля счетчиков дашборда
+    tracked_fields = ['is_verified', 'created_at']
+
     owner = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='owned_companies', null=True, blank=True, default=None, verbose_name='Владелец')
     name = models.CharField('Название', max_length=200, default='Неизвестно')
     description = models.TextField('Описание', default='Без описания')
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Company, Review, CompanyImage, CompanyFeature, CompanySchedule
 from users.serializers import UserProfileSerializer
+from core.mixins import MainImageSerializerMixin
 
 class ReviewSerializer(serializers.ModelSerializer):
     """Сериализатор для отзывов"""
@@ -54,8 +55,9 @@ class CompanyScheduleSerializer(serializers.ModelSerializer):
                  'is_closed', 'created_at', 'updated_at')
         read_only_fields = ('id', 'created_at', 'updated_at')
 
-class CompanyListSerializer(serializers.ModelSerializer):
+class CompanyListSerializer(MainImageSerializerMixin, serializers.ModelSerializer):
     """Serializer for Company model (list view)"""
+    main_image_serializer_class = CompanyImageSerializer
     main_image = serializers.SerializerMethodField()
 
     class Meta:
@@ -64,12 +66,6 @@ class CompanyListSerializer(serializers.ModelSerializer):
                  'is_verified', 'rating', 'main_image', 'created_at')
         read_only_fields = ('id', 'created_at')
 
-    def get_main_image(self, obj):
-        image = obj.images.filter(is_main=True).first()
-        if image:
-            return CompanyImageSerializer(image).data
-        return None
-
 class CompanyDetailSerializer(serializers.ModelSerializer):
     """Serializer for Company model (detail view)"""
     owner = serializers.SerializerMethodField()
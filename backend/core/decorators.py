@@ -1,37 +1,295 @@
+import hashlib
+import time
+import uuid
+import zlib
 from functools import wraps
 from django.core.cache import cache
 from django.conf import settings
+from django.db.models import Count, Max
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
 
-def cache_response(timeout=None):
+# Префикс ключей со счетчиками поколений тегов
+CACHE_GENERATION_PREFIX = 'cache_gen_'
+# Префикс блокировок пересчета закэшированных ответов
+CACHE_LOCK_PREFIX = 'cache_lock_'
+# Интервал опроса кэша при ожидании чужого пересчета (секунды)
+CACHE_LOCK_POLL_INTERVAL = 0.05
+# Заголовки, которые сохраняются вместе с телом закэшированного ответа
+CACHED_RESPONSE_HEADERS = ('Content-Type', 'Content-Language', 'Vary', 'Allow', 'ETag')
+
+def _generation_key(tag):
+    return f"{CACHE_GENERATION_PREFIX}{tag}"
+
+def _initial_generation():
+    # Начальное значение зависит от времени: если счетчик будет вытеснен
+    # из Redis, новое поколение не совпадет со старыми ключами.
+    return int(time.time() * 1000)
+
+def get_cache_generations(tags):
+    """
+    Возвращает текущие поколения для списка тегов одним запросом к кэшу.
+
+    Отсутствующие счетчики инициализируются через cache.add, поэтому
+    конкурентные воркеры получают одно и то же значение.
+    """
+    if not tags:
+        return {}
+
+    keys = {tag: _generation_key(tag) for tag in tags}
+    stored = cache.get_many(list(keys.values()))
+
+    generations = {}
+    for tag, key in keys.items():
+        generation = stored.get(key)
+        if generation is None:
+            cache.add(key, _initial_generation(), None)
+            generation = cache.get(key)
+        generations[tag] = generation
+    return generations
+
+def invalidate_cache_tags(*tags):
+    """
+    Инвалидирует все закэшированные ответы, помеченные указанными тегами.
+
+    Вместо удаления ключей по шаблону (SCAN по всему keyspace) увеличивает
+    счетчик поколения тега: старые ключи просто перестают запрашиваться
+    и истекают по TTL. Стоимость - O(1) на тег.
+    """
+    for tag in tags:
+        key = _generation_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Счетчика еще нет - создаем его сразу в новом поколении
+            cache.add(key, _initial_generation(), None)
+            cache.incr(key)
+
+def _etag_matches(request, etag):
+    # If-None-Match использует слабое сравнение (RFC 9110, 13.1.2)
+    if not etag:
+        return False
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag.removeprefix('W/') in (
+        candidate.removeprefix('W/') for candidate in etags
+    )
+
+def _not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+def pack_response(response):
+    """
+    Упаковывает отрендеренный ответ в компактную запись для кэша.
+
+    Вместо pickle всего объекта Response (рендерер, контекст, запрос)
+    сохраняются только статус, минимальный набор заголовков и тело.
+    Успешный ответ получает сильный ETag по хэшу тела.
+    Тело больше CACHE_COMPRESS_MIN_SIZE байт сжимается zlib.
+    """
+    body = response.content
+    if response.status_code == 200 and not response.has_header('ETag'):
+        response['ETag'] = quote_etag(hashlib.md5(body).hexdigest())
+
+    compressed = False
+    min_size = getattr(settings, 'CACHE_COMPRESS_MIN_SIZE', 1024)
+    if min_size is not None and len(body) >= min_size:
+        packed = zlib.compress(body, getattr(settings, 'CACHE_COMPRESS_LEVEL', 6))
+        if len(packed) < len(body):
+            body, compressed = packed, True
+
+    headers = tuple(
+        (header, response[header])
+        for header in CACHED_RESPONSE_HEADERS
+        if response.has_header(header)
+    )
+    return response.status_code, headers, body, compressed
+
+def packed_etag(packed):
+    """Возвращает ETag упакованного ответа без распаковки тела"""
+    for header, value in packed[1]:
+        if header == 'ETag':
+            return value
+    return None
+
+def unpack_response(packed):
+    """Восстанавливает легковесный HttpResponse из записи pack_response"""
+    status_code, headers, body, compressed = packed
+    if compressed:
+        body = zlib.decompress(body)
+    response = HttpResponse(body, status=status_code)
+    for header, value in headers:
+        response[header] = value
+    return response
+
+def _cached_response(request, packed):
+    etag = packed_etag(packed)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    return unpack_response(packed)
+
+def _acquire_lock(lock_key, lock_ttl):
+    """Захватывает блокировку пересчета; возвращает токен владельца или None"""
+    token = uuid.uuid4().hex
+    return token if cache.add(lock_key, token, lock_ttl) else None
+
+def _release_lock(lock_key, token):
+    # Блокировка могла истечь и достаться другому воркеру: снимаем только свою
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+def _wait_for_cache(cache_key, lock_key, wait_timeout):
+    # Ждем, пока воркер-владелец блокировки положит ответ в кэш. Если
+    # блокировка снята, а ответа нет (ошибка или статус не 200), ждать нечего
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        time.sleep(CACHE_LOCK_POLL_INTERVAL)
+        values = cache.get_many([cache_key, lock_key])
+        if cache_key in values:
+            return values[cache_key]
+        if lock_key not in values:
+            return None
+    return None
+
+def cache_response(timeout=None, tags=None, stale_timeout=None, lock_timeout=None):
     """
     Декоратор для кэширования ответов представлений.
-    
+
+    Закэшированные ответы несут ETag, и на запрос с совпадающим
+    If-None-Match возвращается 304 без распаковки тела.
+
+    Защищает от "эффекта стада" при истечении кэша: после мягкого TTL
+    (timeout) ответ пересчитывает только один воркер, захвативший
+    блокировку, а остальные в течение stale_timeout отдают устаревший ответ.
+    При полном промахе конкурирующие воркеры ждут результат владельца
+    блокировки не дольше lock_timeout; если владелец завершился ошибкой
+    или ответом со статусом не 200, ожидание прекращается сразу. Такие
+    ответы не кэшируются.
+
     Args:
         timeout (int): Время жизни кэша в секундах. Если не указано,
                       используется значение CACHE_TTL из настроек.
+        tags (list): Теги кэша. Поддерживают подстановку kwargs представления,
+                     например ('vehicles', 'vehicle:{pk}'). Текущие поколения
+                     тегов входят в ключ, поэтому invalidate_cache_tags()
+                     инвалидирует ответы без удаления ключей.
+        stale_timeout (int): Сколько секунд после timeout можно отдавать
+                      устаревший ответ. По умолчанию CACHE_STALE_TTL.
+        lock_timeout (int): Время жизни блокировки пересчета в секундах.
+                      По умолчанию CACHE_LOCK_TIMEOUT.
     """
     def decorator(view_func):
         @wraps(view_func)
         def _wrapped_view(view_instance, request, *args, **kwargs):
             # Генерируем ключ кэша на основе URL и параметров запроса
             cache_key = f"view_cache_{request.path}_{request.GET.urlencode()}"
-            
-            # Проверяем кэш
-            response = cache.get(cache_key)
-            if response is not None:
-                return response
-            
-            # Если нет в кэше, выполняем представление
-            response = view_func(view_instance, request, *args, **kwargs)
-            
-            # Рендерим ответ перед кэшированием
-            if hasattr(response, 'render'):
-                response.render()
-            
-            # Кэшируем ответ
+
+            if tags:
+                resolved_tags = [tag.format(**kwargs) for tag in tags]
+                generations = get_cache_generations(resolved_tags)
+                cache_key += '_' + '.'.join(
+                    f"{tag}:{generations[tag]}" for tag in resolved_tags
+                )
+
             cache_timeout = timeout or getattr(settings, 'CACHE_TTL', 60 * 15)
-            cache.set(cache_key, response, cache_timeout)
-            
+            stale_ttl = stale_timeout
+            if stale_ttl is None:
+                stale_ttl = getattr(settings, 'CACHE_STALE_TTL', 60)
+            lock_ttl = lock_timeout or getattr(settings, 'CACHE_LOCK_TIMEOUT', 30)
+            lock_key = f"{CACHE_LOCK_PREFIX}{cache_key}"
+
+            # Проверяем кэш: запись хранит момент мягкого истечения
+            entry = cache.get(cache_key)
+            if entry is not None:
+                fresh_until, packed = entry
+                if time.time() < fresh_until:
+                    return _cached_response(request, packed)
+                # Ответ устарел: пересчитывает только владелец блокировки
+                lock_token = _acquire_lock(lock_key, lock_ttl)
+                if lock_token is None:
+                    return _cached_response(request, packed)
+            else:
+                lock_token = _acquire_lock(lock_key, lock_ttl)
+                if lock_token is None:
+                    entry = _wait_for_cache(cache_key, lock_key, lock_ttl)
+                    if entry is not None:
+                        return _cached_response(request, entry[1])
+
+            try:
+                # Выполняем представление
+                response = view_func(view_instance, request, *args, **kwargs)
+
+                # DRF назначает рендерер в finalize_response, который dispatch
+                # вызывает уже после обработчика, поэтому финализируем здесь
+                if hasattr(view_instance, 'finalize_response'):
+                    response = view_instance.finalize_response(
+                        request, response, *args, **kwargs
+                    )
+
+                # Рендерим ответ перед кэшированием
+                if hasattr(response, 'render'):
+                    response.render()
+
+                # Кэшируем тело ответа на мягкий TTL плюс окно устаревания;
+                # ошибки не кэшируются, их пересчитает следующий запрос
+                if not response.streaming and response.status_code == 200:
+                    cache.set(
+                        cache_key,
+                        (time.time() + cache_timeout, pack_response(response)),
+                        cache_timeout + stale_ttl
+                    )
+            finally:
+                # Снятая блокировка без ответа останавливает ожидающих
+                if lock_token is not None:
+                    _release_lock(lock_key, lock_token)
+
+            if _etag_matches(request, response.get('ETag')):
+                return _not_modified(response['ETag'])
+            return response
+        return _wrapped_view
+    return decorator
+
+def queryset_etag_response(timestamp_field='updated_at'):
+    """
+    Декоратор условных GET-запросов для некэшируемых представлений DRF.
+
+    ETag вычисляется одним агрегирующим запросом (максимум timestamp_field
+    и количество строк) по отфильтрованному queryset представления, а для
+    детальных запросов - по queryset, суженному до запрошенного объекта.
+    При совпадении с If-None-Match возвращается 304 без сериализации.
+
+    Args:
+        timestamp_field (str): Поле с датой последнего изменения записи.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(view_instance, request, *args, **kwargs):
+            queryset = view_instance.filter_queryset(view_instance.get_queryset())
+            lookup_url_kwarg = view_instance.lookup_url_kwarg or view_instance.lookup_field
+            if lookup_url_kwarg in kwargs:
+                queryset = queryset.filter(
+                    **{view_instance.lookup_field: kwargs[lookup_url_kwarg]}
+                )
+
+            state = queryset.order_by().aggregate(
+                last_modified=Max(timestamp_field),
+                total=Count('pk')
+            )
+            fingerprint = (
+                f"{request.get_full_path()}|{state['last_modified']}|{state['total']}"
+            )
+            etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+
+            if _etag_matches(request, etag):
+                return _not_modified(etag)
+
+            response = view_func(view_instance, request, *args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = etag
             return response
         return _wrapped_view
     return decorator
@@ -0,0 +1,108 @@
+class EagerLoadingSerializerMixin:
+    """
+    План предзагрузки связанных объектов, объявленный в сериализаторе.
+
+    Сериализатор перечисляет связи, к которым обращаются его вложенные
+    сериализаторы и методы, а представление применяет их к queryset
+    через EagerLoadingMixin. Так количество запросов не зависит от
+    размера страницы.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+class MainImageSerializerMixin:
+    """
+    Поле main_image: главное изображение из связи images.
+
+    Предзагруженные изображения перебираются без запроса, иначе
+    выполняется один запрос с LIMIT 1.
+    """
+    main_image_serializer_class = None
+
+    def get_main_image(self, obj):
+        if 'images' in getattr(obj, '_prefetched_objects_cache', {}):
+            image = next((image for image in obj.images.all() if image.is_main), None)
+        else:
+            image = obj.images.filter(is_main=True).first()
+        if image:
+            return self.main_image_serializer_class(image).data
+        return None
+
+class EagerLoadingMixin:
+    """Применяет к queryset представления план предзагрузки его сериализатора"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+class ChangeTrackingMixin:
+    """
+    Отслеживание изменений полей модели без повторного чтения из базы.
+
+    Значения полей tracked_fields запоминаются при загрузке объекта из базы
+    (from_db) и после каждого сохранения. get_changes() сравнивает их с
+    текущими значениями в памяти, а save() перед записью кладет разницу в
+    saved_changes, чтобы обработчики pre_save/post_save не перечитывали строку.
+    Для внешних ключей сравниваются id. Поля, не загруженные из-за
+    defer()/only(), не отслеживаются, refresh_from_db() обновляет запомненные значения.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_tracked()
+        return instance
+
+    def _tracked_attnames(self):
+        return {name: self._meta.get_field(name).attname for name in self.tracked_fields}
+
+    def _remember_tracked(self, names=None):
+        loaded = getattr(self, '_tracked_values', {})
+        for name, attname in self._tracked_attnames().items():
+            if (names is None or name in names) and attname in self.__dict__:
+                loaded[name] = self.__dict__[attname]
+        self._tracked_values = loaded
+
+    def get_loaded_values(self):
+        """Значения отслеживаемых полей на момент загрузки или последнего сохранения"""
+        return dict(getattr(self, '_tracked_values', {}))
+
+    def get_changes(self):
+        """Измененные поля: {поле: (старое значение, новое значение)}"""
+        loaded = getattr(self, '_tracked_values', {})
+        changes = {}
+        for name, attname in self._tracked_attnames().items():
+            if name in loaded and attname in self.__dict__ and loaded[name] != self.__dict__[attname]:
+                changes[name] = (loaded[name], self.__dict__[attname])
+        return changes
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        names = None
+        if update_fields is not None:
+            names = {self._meta.get_field(name).name for name in update_fields}
+        changes = self.get_changes()
+        self.saved_changes = {
+            name: change for name, change in changes.items() if names is None or name in names
+        }
+        super().save(*args, **kwargs)
+        self._remember_tracked(names)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        names = None
+        if fields is not None:
+            names = {self._meta.get_field(name).name for name in fields}
+        self._remember_tracked(names)
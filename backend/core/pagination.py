@@ -0,0 +1,140 @@
+import base64
+import json
+from collections import OrderedDict
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация по паре (поле сортировки, pk).
+
+    Следующая страница выбирается условием
+    (field, pk) < (last_field, last_pk) вместо OFFSET, поэтому время ответа
+    не зависит от глубины страницы при наличии индекса (field, id).
+    Сортировать можно по ordering_fields представления, кроме полей,
+    допускающих NULL.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = api_settings.ORDERING_PARAM
+    page_size = api_settings.PAGE_SIZE
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.field_name = self.ordering.lstrip('-')
+        self.field = queryset.model._meta.get_field(self.field_name)
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+        descending = self.ordering.startswith('-') != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field_name}', f'{prefix}pk')
+
+        if cursor:
+            try:
+                value = self.field.to_python(cursor['v'])
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field_name}__{lookup}': value}) |
+                Q(**{self.field_name: value, f'pk__{lookup}': cursor['id']})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        self.next_cursor = self.encode_cursor(results[-1], False) if has_next and results else None
+        self.previous_cursor = self.encode_cursor(results[0], True) if has_previous and results else None
+        return results
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_query_param, '')
+        ordering = ordering.split(',')[0].strip()
+        if ordering.lstrip('-') in self.get_keyset_fields(queryset, view):
+            return ordering
+        return self.default_ordering
+
+    def get_keyset_fields(self, queryset, view):
+        fields = []
+        for name in getattr(view, 'ordering_fields', None) or ():
+            try:
+                field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            # NULL не сравнивается операторами < и >, такие поля не подходят
+            if not field.null:
+                fields.append(name)
+        return fields
+
+    def encode_cursor(self, obj, reverse):
+        payload = {
+            'o': self.ordering,
+            'v': self.field.value_to_string(obj),
+            'id': obj.pk,
+            'r': int(reverse),
+        }
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if cursor['o'] != self.ordering:
+                raise ValueError('ordering mismatch')
+            cursor['id'] = int(cursor['id'])
+            cursor['r'] = bool(cursor['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_link(self.next_cursor)),
+            ('previous', self.get_link(self.previous_cursor)),
+            ('results', data)
+        ]))
+
+class CatalogPagination(PageNumberPagination):
+    """
+    Постраничная пагинация каталога с keyset-режимом.
+
+    По умолчанию работает как PageNumberPagination. Если в запросе есть
+    параметр cursor (в том числе пустой для первой страницы), используется
+    KeysetPagination.
+    """
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_pagination_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
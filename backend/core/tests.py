@@ -0,0 +1,194 @@
+import threading
+import time
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+
+from .decorators import cache_response, pack_response, unpack_response
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'core-tests',
+    }
+}
+
+class CountingView:
+    """Представление, считающее количество пересчетов ответа"""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    @cache_response(timeout=1, stale_timeout=60, lock_timeout=5)
+    def get(self, request, *args, **kwargs):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        time.sleep(self.delay)
+        return HttpResponse(f'response {calls}')
+
+class UnavailableView(CountingView):
+    """Представление, отвечающее ошибкой 503"""
+
+    @cache_response(timeout=60, lock_timeout=5)
+    def get(self, request, *args, **kwargs):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return HttpResponse('unavailable', status=503)
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheResponseStampedeTest(SimpleTestCase):
+    """Тесты защиты cache_response от одновременного пересчета"""
+
+    workers = 20
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/api/cars/vehicles/')
+
+    def run_concurrently(self, view):
+        barrier = threading.Barrier(self.workers)
+        responses = []
+
+        def worker():
+            barrier.wait()
+            responses.append(view.get(self.request))
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_cold_miss_is_computed_once(self):
+        """Тест: при пустом кэше ответ вычисляется одним воркером"""
+        view = CountingView(delay=0.2)
+
+        responses = self.run_concurrently(view)
+
+        self.assertEqual(view.calls, 1)
+        self.assertEqual({r.content for r in responses}, {b'response 1'})
+
+    def test_expired_entry_is_recomputed_once(self):
+        """Тест: после мягкого TTL пересчет выполняется один раз, остальные получают устаревший ответ"""
+        view = CountingView(delay=0.2)
+        view.get(self.request)
+        time.sleep(1.1)
+
+        responses = self.run_concurrently(view)
+
+        self.assertEqual(view.calls, 2)
+        contents = [r.content for r in responses]
+        self.assertEqual(contents.count(b'response 2'), 1)
+        self.assertEqual(contents.count(b'response 1'), self.workers - 1)
+        self.assertEqual(view.get(self.request).content, b'response 2')
+
+    def test_error_response_releases_waiters_and_is_not_cached(self):
+        """Тест: ответ не 200 не кэшируется, ожидающие не ждут весь lock_timeout"""
+        view = UnavailableView(delay=0.2)
+
+        started = time.monotonic()
+        responses = self.run_concurrently(view)
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual({r.status_code for r in responses}, {503})
+        calls = view.calls
+        view.get(self.request)
+        self.assertEqual(view.calls, calls + 1)
+
+@override_settings(CACHE_COMPRESS_MIN_SIZE=1024)
+class PackResponseTest(SimpleTestCase):
+    """Тесты упаковки ответов для кэша"""
+
+    def test_large_body_is_compressed_and_restored(self):
+        """Тест: большое тело сжимается, статус и заголовки восстанавливаются"""
+        body = b'{"results": [' + b'{"brand": "Toyota"},' * 500 + b'{}]}'
+        response = HttpResponse(body, status=200, content_type='application/json')
+        response['Vary'] = 'Accept'
+        response['X-Debug'] = 'not cached'
+
+        packed = pack_response(response)
+        restored = unpack_response(packed)
+
+        self.assertTrue(packed[3])
+        self.assertLess(len(packed[2]), len(body))
+        self.assertEqual(restored.content, body)
+        self.assertEqual(restored.status_code, 200)
+        self.assertEqual(restored['Content-Type'], 'application/json')
+        self.assertEqual(restored['Vary'], 'Accept')
+        self.assertFalse(restored.has_header('X-Debug'))
+
+    def test_small_body_is_not_compressed(self):
+        """Тест: маленькое тело хранится как есть"""
+        packed = pack_response(HttpResponse(b'{}', status=201))
+
+        self.assertFalse(packed[3])
+        self.assertEqual(unpack_response(packed).status_code, 201)
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheResponseConditionalTest(SimpleTestCase):
+    """Тесты условных GET-запросов к закэшированным ответам"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def test_matching_etag_returns_not_modified(self):
+        """Тест: совпадающий If-None-Match возвращает 304 без тела"""
+        view = CountingView()
+        response = view.get(self.factory.get('/api/news/'))
+        etag = response['ETag']
+
+        conditional = view.get(self.factory.get('/api/news/', HTTP_IF_NONE_MATCH=etag))
+
+        self.assertEqual(conditional.status_code, 304)
+        self.assertEqual(conditional['ETag'], etag)
+        self.assertEqual(conditional.content, b'')
+        self.assertEqual(view.calls, 1)
+
+    def test_stale_etag_returns_full_body(self):
+        """Тест: устаревший ETag возвращает полный ответ"""
+        view = CountingView()
+        view.get(self.factory.get('/api/news/'))
+
+        response = view.get(self.factory.get('/api/news/', HTTP_IF_NONE_MATCH='"outdated"'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'response 1')
+
+class ChangeTrackingMixinTest(SimpleTestCase):
+    """Тесты отслеживания изменений полей без обращения к базе"""
+
+    def load_task(self, **values):
+        from erp.models import ProjectTask
+
+        # from_db ожидает значения в порядке полей модели
+        values['id'] = 1
+        field_names = [field.attname for field in ProjectTask._meta.concrete_fields if field.attname in values]
+        return ProjectTask.from_db('default', field_names, [values[name] for name in field_names])
+
+    def test_loaded_values_are_compared_in_memory(self):
+        """Тест: изменения полей определяются по значениям, загруженным из базы"""
+        task = self.load_task(title='Старое', priority='medium', column_id=1)
+        task.title = 'Новое'
+        task.column_id = 2
+
+        self.assertEqual(task.get_changes(), {'title': ('Старое', 'Новое'), 'column': (1, 2)})
+
+    def test_unchanged_and_new_objects_have_no_changes(self):
+        """Тест: без изменений и у нового объекта разницы нет"""
+        from erp.models import ProjectTask
+
+        self.assertEqual(self.load_task(title='Задача', priority='high').get_changes(), {})
+        self.assertEqual(ProjectTask(title='Новая').get_changes(), {})
+
+    def test_deferred_fields_are_not_tracked(self):
+        """Тест: поля, не загруженные из базы, не отслеживаются"""
+        task = self.load_task(title='Задача')
+        task.priority = 'high'
+
+        self.assertEqual(task.get_changes(), {})
@@ -3,4 +3,10 @@ from django.apps import AppConfig
 
 class ErpConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'erp' 
\ No newline at end of file
+    name = 'erp' 
+
+    def ready(self):
+        # Отметка дней для пересчета снимков отчетов
+        import erp.snapshots
+        # История задач и задачи по событиям ERP
+        import erp.signals
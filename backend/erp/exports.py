@@ -0,0 +1,221 @@
+import csv
+import json
+import os
+import tempfile
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.db.models.query import QuerySet
+from django.utils import timezone
+from .models import Sale, ServiceOrder, Financial, ReportJob
+from .reports import ERPReportGenerator
+
+EXPORT_CHUNK_SIZE = 2000
+# Задание в running дольше этого срока считается брошенным упавшим воркером
+REPORT_JOB_TIMEOUT = timedelta(minutes=30)
+REPORT_JOB_MAX_ATTEMPTS = 3
+
+# Построчные выгрузки: модель, поле даты для периода и колонки (поле, заголовок)
+RowExport = namedtuple('RowExport', 'model date_field columns')
+
+ROW_EXPORTS = {
+    'sales': RowExport(Sale, 'sale_date', [
+        ('id', 'ID'),
+        ('sale_date', 'Дата продажи'),
+        ('company__name', 'Компания'),
+        ('car_id', 'Автомобиль'),
+        ('customer__username', 'Клиент'),
+        ('status', 'Статус'),
+        ('sale_price', 'Цена'),
+        ('commission', 'Комиссия'),
+    ]),
+    'service': RowExport(ServiceOrder, 'created_at', [
+        ('id', 'ID'),
+        ('created_at', 'Дата заказа'),
+        ('company__name', 'Компания'),
+        ('car_id', 'Автомобиль'),
+        ('customer__username', 'Клиент'),
+        ('status', 'Статус'),
+        ('scheduled_date', 'Запланирован на'),
+        ('completed_date', 'Завершен'),
+        ('total_price', 'Сумма'),
+    ]),
+    'financial': RowExport(Financial, 'date', [
+        ('id', 'ID'),
+        ('date', 'Дата'),
+        ('company__name', 'Компания'),
+        ('operation_type', 'Тип операции'),
+        ('category', 'Категория'),
+        ('amount', 'Сумма'),
+        ('description', 'Описание'),
+        ('created_by__username', 'Автор'),
+    ]),
+}
+
+REPORT_METHODS = {
+    'sales': 'get_sales_report',
+    'service': 'get_service_report',
+    'financial': 'get_financial_report',
+    'inventory': 'get_inventory_report',
+    'projects': 'get_project_report',
+    'comprehensive': 'get_comprehensive_report',
+}
+
+
+def export_queryset(job):
+    """
+    Строки построчной выгрузки задания в виде кортежей значений.
+
+    Пользователь получает только операции своих компаний (персонал - все).
+    Сортировка по дате и id, чтобы выгрузка была стабильной.
+    """
+    export = ROW_EXPORTS[job.report_type]
+    queryset = export.model.objects.all()
+    if not job.user.is_staff:
+        queryset = queryset.filter(company__owner=job.user)
+    if job.company_id:
+        queryset = queryset.filter(company_id=job.company_id)
+    if job.start_date:
+        queryset = queryset.filter(**{f'{export.date_field}__gte': job.start_date})
+    if job.end_date:
+        queryset = queryset.filter(**{f'{export.date_field}__lte': job.end_date})
+    return queryset.order_by(export.date_field, 'id').values_list(*[field for field, _ in export.columns])
+
+
+def iter_rows(job):
+    """
+    Потоковое чтение строк выгрузки.
+
+    QuerySet.iterator() на PostgreSQL читает через серверный курсор порциями
+    по EXPORT_CHUNK_SIZE, поэтому память не растет с размером выгрузки.
+    """
+    return export_queryset(job).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def cell_value(value):
+    """Значение ячейки: даты в локальном времени без tzinfo (XLSX его не поддерживает)"""
+    if isinstance(value, datetime):
+        return timezone.localtime(value).replace(tzinfo=None) if timezone.is_aware(value) else value
+    return value
+
+
+def write_csv(job, output):
+    """Построчная выгрузка в CSV, возвращает количество строк"""
+    writer = csv.writer(output)
+    writer.writerow([title for _, title in ROW_EXPORTS[job.report_type].columns])
+    count = 0
+    for row in iter_rows(job):
+        writer.writerow([cell_value(value) for value in row])
+        count += 1
+    return count
+
+
+def write_xlsx(job, path):
+    """
+    Построчная выгрузка в XLSX, возвращает количество строк.
+
+    Книга в режиме write_only пишет строки сразу во временный файл
+    и не держит лист в памяти.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=job.get_report_type_display())
+    sheet.append([title for _, title in ROW_EXPORTS[job.report_type].columns])
+    count = 0
+    for row in iter_rows(job):
+        sheet.append([float(value) if isinstance(value, Decimal) else cell_value(value) for value in row])
+        count += 1
+    workbook.save(path)
+    return count
+
+
+def materialize(report):
+    """Выполняет ленивые QuerySet отчета для сериализации в JSON"""
+    if isinstance(report, dict):
+        return {key: materialize(value) for key, value in report.items()}
+    if isinstance(report, (QuerySet, list)):
+        return [materialize(item) for item in report]
+    return report
+
+
+def write_json(job, output):
+    """
+    Отчет ERPReportGenerator в JSON, возвращает 1.
+
+    Генератор фильтрует только по компании, поэтому пользователь без прав
+    персонала получает отчет лишь по своей компании.
+    """
+    if not job.user.is_staff and (job.company_id is None or job.company.owner_id != job.user_id):
+        raise PermissionError('Нет доступа к отчету по этой компании')
+    generator = ERPReportGenerator(company=job.company_id, start_date=job.start_date, end_date=job.end_date)
+    report = getattr(generator, REPORT_METHODS[job.report_type])()
+    json.dump(materialize(report), output, cls=DjangoJSONEncoder, ensure_ascii=False)
+    return 1
+
+
+def claim_job(job_id):
+    """Переводит задание в running; False, если его уже взял другой воркер"""
+    return ReportJob.objects.filter(pk=job_id, status='pending').update(
+        status='running', started_at=timezone.now(), attempts=F('attempts') + 1
+    ) == 1
+
+
+def recover_stale_jobs(now=None):
+    """
+    Возврат в очередь заданий, оставшихся в running после падения воркера
+    или не дошедших до воркера в pending дольше REPORT_JOB_TIMEOUT.
+
+    Задание, упавшее REPORT_JOB_MAX_ATTEMPTS раз, помечается failed.
+    Возвращает id заданий, которые нужно поставить в очередь заново.
+    """
+    now = now or timezone.now()
+    stale = now - REPORT_JOB_TIMEOUT
+    running = ReportJob.objects.filter(status='running', started_at__lt=stale)
+    running.filter(attempts__gte=REPORT_JOB_MAX_ATTEMPTS).update(
+        status='failed', error='Формирование прервано: превышено число попыток', finished_at=now
+    )
+    running.update(status='pending')
+    return list(ReportJob.objects.filter(
+        Q(started_at__lt=stale) | Q(started_at__isnull=True, created_at__lt=stale),
+        status='pending'
+    ).values_list('pk', flat=True))
+
+
+def build_report_job(job):
+    """
+    Формирует файл задания и сохраняет его в хранилище (FileField).
+
+    Файл пишется во временный файл на диске, а не в память, затем
+    передается в хранилище. Ошибка сохраняется в задании со статусом failed.
+    """
+    suffix = f'.{job.export_format}'
+    filename = f'{job.report_type}_{job.pk}{suffix}'
+    handle, path = tempfile.mkstemp(suffix=suffix)
+    os.close(handle)
+    try:
+        if job.export_format == 'xlsx':
+            row_count = write_xlsx(job, path)
+        else:
+            # BOM, чтобы Excel открывал CSV с кириллицей без выбора кодировки
+            encoding = 'utf-8-sig' if job.export_format == 'csv' else 'utf-8'
+            with open(path, 'w', encoding=encoding, newline='') as output:
+                if job.export_format == 'csv':
+                    row_count = write_csv(job, output)
+                else:
+                    row_count = write_json(job, output)
+        with open(path, 'rb') as artifact:
+            job.file.save(filename, File(artifact), save=False)
+        job.status = 'completed'
+        job.row_count = row_count
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+    finally:
+        os.remove(path)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'file', 'row_count', 'error', 'finished_at'])
+    return job
@@ -0,0 +1,154 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from cars.models import Car
+from companies.models import Company
+from erp.models import Sale
+from erp.reports import ERPReportGenerator
+from erp.snapshots import refresh_snapshots
+
+User = get_user_model()
+
+# Маркер сгенерированных продаж для последующего удаления
+BENCHMARK_NOTE = 'benchmark_erp_reports'
+BENCHMARK_PERIODS = (7, 30, 90, 365)
+
+
+def evaluate(report):
+    """Выполняет ленивые QuerySet отчета, чтобы замер включал все запросы"""
+    if isinstance(report, dict):
+        return {key: evaluate(value) for key, value in report.items()}
+    if isinstance(report, QuerySet):
+        return list(report)
+    return report
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время отчетов ERP по сырым таблицам и по дневным снимкам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--populate',
+            type=int,
+            default=0,
+            help='Сгенерировать указанное количество продаж перед замером (например, 5000000)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=730,
+            help='На сколько дней назад распределять сгенерированные продажи'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Размер пачки bulk_create при генерации'
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=3,
+            help='Количество повторов каждого отчета'
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help='Удалить сгенерированные продажи после замера'
+        )
+
+    def handle(self, *args, **options):
+        self.rounds = options['rounds']
+
+        if options['populate']:
+            self.populate(options['populate'], options['days'], options['batch_size'])
+
+        total = Sale.objects.count()
+        if not total:
+            raise CommandError('Нет продаж для бенчмарка, используйте --populate')
+        self.stdout.write(f'Продаж: {total}')
+
+        started = time.perf_counter()
+        refresh_snapshots(full=True)
+        self.stdout.write(f'Полное построение снимков: {time.perf_counter() - started:.1f} с')
+
+        # Инкрементальное обновление после изменения части продаж за сегодня
+        touched = list(Sale.objects.order_by('-sale_date').values_list('id', flat=True)[:1000])
+        Sale.objects.filter(id__in=touched).update(status='completed', updated_at=timezone.now())
+        started = time.perf_counter()
+        refresh_snapshots()
+        self.stdout.write(
+            f'Инкрементальное обновление ({len(touched)} измененных продаж): '
+            f'{(time.perf_counter() - started) * 1000:.1f} мс'
+        )
+
+        company = Sale.objects.values_list('company_id', flat=True).first()
+        now = timezone.now()
+        for days in BENCHMARK_PERIODS:
+            for company_id in (None, company):
+                generator_kwargs = {
+                    'company': company_id,
+                    'start_date': now - timedelta(days=days),
+                    'end_date': now,
+                }
+                raw_ms = self.measure(ERPReportGenerator(use_snapshots=False, **generator_kwargs))
+                snapshot_ms = self.measure(ERPReportGenerator(use_snapshots=True, **generator_kwargs))
+                scope = f'компания {company_id}' if company_id else 'все компании'
+                self.stdout.write(
+                    f'{days} дн., {scope}: по сырым данным {raw_ms:.1f} мс, '
+                    f'по снимкам {snapshot_ms:.1f} мс (x{raw_ms / snapshot_ms:.1f})'
+                )
+
+        if options['cleanup']:
+            deleted, _ = Sale.objects.filter(notes=BENCHMARK_NOTE).delete()
+            refresh_snapshots(full=True)
+            self.stdout.write(f'Удалено сгенерированных объектов: {deleted}')
+
+    def measure(self, generator):
+        """Лучшее время отчета по продажам за несколько повторов, мс"""
+        timings = []
+        for _ in range(self.rounds):
+            started = time.perf_counter()
+            evaluate(generator.get_sales_report())
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings)
+
+    def populate(self, count, days, batch_size):
+        companies = list(Company.objects.values_list('id', flat=True)[:20])
+        cars = list(Car.objects.values_list('id', flat=True)[:500])
+        customers = list(User.objects.values_list('id', flat=True)[:1000])
+        if not (companies and cars and customers):
+            raise CommandError('Для генерации нужны компании, автомобили и пользователи')
+
+        # sale_date заполняется auto_now_add, на время генерации отключаем
+        sale_date = Sale._meta.get_field('sale_date')
+        sale_date.auto_now_add = False
+        statuses = ['pending', 'completed', 'completed', 'completed', 'cancelled', 'refunded']
+        now = timezone.now()
+        created = 0
+        try:
+            while created < count:
+                batch = []
+                for _ in range(min(batch_size, count - created)):
+                    price = Decimal(random.randint(300, 9000) * 1000)
+                    batch.append(Sale(
+                        company_id=random.choice(companies),
+                        car_id=random.choice(cars),
+                        customer_id=random.choice(customers),
+                        sale_price=price,
+                        commission=price * Decimal('0.03'),
+                        sale_date=now - timedelta(seconds=random.randint(0, days * 86400)),
+                        status=random.choice(statuses),
+                        notes=BENCHMARK_NOTE,
+                    ))
+                Sale.objects.bulk_create(batch)
+                created += len(batch)
+                self.stdout.write(f'Создано продаж: {created}/{count}')
+        finally:
+            sale_date.auto_now_add = True
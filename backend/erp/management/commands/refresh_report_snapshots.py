@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from erp.snapshots import refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Обновляет дневные снимки отчетов ERP'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Построить снимки заново по всем данным'
+        )
+
+    def handle(self, *args, **options):
+        refreshed = refresh_snapshots(full=options['full'])
+        for fact, ranges in refreshed.items():
+            self.stdout.write(f'{fact}: пересчитано отрезков дней: {ranges}')
@@ -7,6 +7,7 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from cars.models import Car
 from companies.models import Company
+from core.mixins import ChangeTrackingMixin
 
 User = get_user_model()
 
@@ -55,9 +56,33 @@ PRIORITY_CHOICES = [
     ('urgent', 'Срочный'),
 ]
 
+REPORT_TYPES = [
+    ('sales', 'Продажи'),
+    ('service', 'Сервис'),
+    ('financial', 'Финансы'),
+    ('inventory', 'Инвентарь'),
+    ('projects', 'Проекты'),
+    ('comprehensive', 'Комплексный'),
+]
+
+EXPORT_FORMATS = [
+    ('json', 'JSON'),
+    ('csv', 'CSV'),
+    ('xlsx', 'XLSX'),
+]
+
+REPORT_JOB_STATUS = [
+    ('pending', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('completed', 'Готов'),
+    ('failed', 'Ошибка'),
+]
+
 # ERP Core Models
-class Inventory(models.Model):
+class Inventory(ChangeTrackingMixin, models.Model):
     """Управление складом"""
+    tracked_fields = ['status', 'quantity', 'selling_price', 'location']
+
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='inventory_items')
     car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='inventory_items')
     quantity = models.PositiveIntegerField(default=1)
@@ -84,8 +109,10 @@ class Inventory(models.Model):
             return ((self.selling_price - self.cost_price) / self.cost_price) * 100
         return 0
 
-class Sale(models.Model):
+class Sale(ChangeTrackingMixin, models.Model):
     """Продажи"""
+    tracked_fields = ['status', 'sale_price', 'commission', 'sale_date', 'company']
+
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='sales')
     car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='sales')
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='purchases')
@@ -100,6 +127,10 @@ class Sale(models.Model):
     class Meta:
         verbose_name = 'Продажа'
         verbose_name_plural = 'Продажи'
+        indexes = [
+            models.Index(fields=['company', 'sale_date']),
+            models.Index(fields=['updated_at']),
+        ]
 
     def __str__(self):
         return f"Продажа {self.car} - {self.customer.username}"
@@ -128,8 +159,10 @@ class Service(models.Model):
     def __str__(self):
         return f"{self.name} - {self.company.name}"
 
-class ServiceOrder(models.Model):
+class ServiceOrder(ChangeTrackingMixin, models.Model):
     """Заказы на обслуживание"""
+    tracked_fields = ['status', 'total_price', 'scheduled_date', 'created_at', 'company']
+
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='service_orders')
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='service_orders')
     car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='service_orders')
@@ -145,6 +178,10 @@ class ServiceOrder(models.Model):
     class Meta:
         verbose_name = 'Заказ на обслуживание'
         verbose_name_plural = 'Заказы на обслуживание'
+        indexes = [
+            models.Index(fields=['company', 'created_at']),
+            models.Index(fields=['updated_at']),
+        ]
 
     def __str__(self):
         return f"Заказ {self.id} - {self.car}"
@@ -169,8 +206,10 @@ class ServiceOrderItem(models.Model):
     def __str__(self):
         return f"{self.service.name} x{self.quantity}"
 
-class Financial(models.Model):
+class Financial(ChangeTrackingMixin, models.Model):
     """Финансовые операции"""
+    tracked_fields = ['date', 'company']
+
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='financial_operations')
     operation_type = models.CharField(max_length=20, choices=OPERATION_TYPES)
     amount = models.DecimalField(max_digits=15, decimal_places=2)
@@ -185,10 +224,134 @@ class Financial(models.Model):
         verbose_name = 'Финансовая операция'
         verbose_name_plural = 'Финансовые операции'
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['company', 'date']),
+            models.Index(fields=['updated_at']),
+        ]
 
     def __str__(self):
         return f"{self.get_operation_type_display()} - {self.amount} ({self.company.name})"
 
+# Daily report snapshots (see erp.snapshots)
+class SaleDailySnapshot(models.Model):
+    """Дневные агрегаты продаж компании по статусу и модели автомобиля"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='sale_snapshots')
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=SALE_STATUS)
+    car_model = models.ForeignKey('cars.Model', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    sale_count = models.PositiveIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    commission_sum = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Снимок продаж за день'
+        verbose_name_plural = 'Снимки продаж за день'
+        indexes = [
+            models.Index(fields=['company', 'date']),
+            models.Index(fields=['date']),
+        ]
+
+class ServiceOrderDailySnapshot(models.Model):
+    """Дневные агрегаты заказов на обслуживание компании по статусу"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='service_order_snapshots')
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=ORDER_STATUS)
+    order_count = models.PositiveIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Снимок заказов за день'
+        verbose_name_plural = 'Снимки заказов за день'
+        indexes = [
+            models.Index(fields=['company', 'date']),
+            models.Index(fields=['date']),
+        ]
+
+class ServiceUsageDailySnapshot(models.Model):
+    """Дневные агрегаты заказов компании по услугам"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='service_usage_snapshots')
+    date = models.DateField()
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    order_count = models.PositiveIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Снимок услуг за день'
+        verbose_name_plural = 'Снимки услуг за день'
+        indexes = [
+            models.Index(fields=['company', 'date']),
+            models.Index(fields=['date']),
+        ]
+
+class FinancialDailySnapshot(models.Model):
+    """Дневные агрегаты финансовых операций компании по типу и категории"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='financial_snapshots')
+    date = models.DateField()
+    operation_type = models.CharField(max_length=20, choices=OPERATION_TYPES)
+    category = models.CharField(max_length=100)
+    operation_count = models.PositiveIntegerField(default=0)
+    amount_sum = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Снимок финансов за день'
+        verbose_name_plural = 'Снимки финансов за день'
+        indexes = [
+            models.Index(fields=['company', 'date']),
+            models.Index(fields=['date']),
+        ]
+
+class ReportSnapshotState(models.Model):
+    """Состояние обновления снимков: строки, измененные до refreshed_until, уже учтены"""
+    fact = models.CharField(max_length=20, unique=True)
+    refreshed_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Состояние снимков отчетов'
+        verbose_name_plural = 'Состояния снимков отчетов'
+
+    def __str__(self):
+        return f"{self.fact}: {self.refreshed_until}"
+
+class ReportSnapshotDirtyDay(models.Model):
+    """День компании, который нужно пересчитать (удаление строк не меняет updated_at)"""
+    fact = models.CharField(max_length=20)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+
+    class Meta:
+        verbose_name = 'День для пересчета снимков'
+        verbose_name_plural = 'Дни для пересчета снимков'
+        unique_together = ['fact', 'company', 'date']
+
+class ReportJob(models.Model):
+    """Фоновое формирование отчета или выгрузки (см. erp.exports)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_jobs')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True, related_name='report_jobs')
+    report_type = models.CharField(max_length=20, choices=REPORT_TYPES)
+    export_format = models.CharField(max_length=10, choices=EXPORT_FORMATS, default='json')
+    start_date = models.DateTimeField(null=True, blank=True)
+    end_date = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=REPORT_JOB_STATUS, default='pending')
+    file = models.FileField(upload_to='report_exports/%Y/%m/', blank=True)
+    row_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Задание на отчет'
+        verbose_name_plural = 'Задания на отчеты'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_report_type_display()} ({self.get_export_format_display()}) - {self.get_status_display()}"
+
 # Trello-like Project Management Models
 class TaskLabel(models.Model):
     """Метки для задач"""
@@ -224,8 +387,11 @@ class ProjectColumn(models.Model):
     def __str__(self):
         return f"{self.name} ({self.board.name})"
 
-class ProjectBoard(models.Model):
+class ProjectBoard(ChangeTrackingMixin, models.Model):
     """Доски проектов"""
+    # Поля счетчиков дашборда
+    tracked_fields = ['is_archived']
+
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='project_boards')
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -244,8 +410,10 @@ class ProjectBoard(models.Model):
     def __str__(self):
         return f"{self.name} ({self.company.name})"
 
-class ProjectTask(models.Model):
+class ProjectTask(ChangeTrackingMixin, models.Model):
     """Задачи проектов (связанные с ERP)"""
+    tracked_fields = ['title', 'description', 'priority', 'due_date', 'assignee', 'column', 'is_archived']
+
     column = models.ForeignKey(ProjectColumn, on_delete=models.CASCADE, related_name='tasks')
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -270,6 +438,9 @@ class ProjectTask(models.Model):
         verbose_name = 'Задача проекта'
         verbose_name_plural = 'Задачи проектов'
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['column', 'order']),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.column.board.name}"
@@ -0,0 +1,115 @@
+from django.db import transaction
+from .models import ProjectColumn, ProjectTask, TaskHistory
+
+# Позиции задач в колонке идут с шагом ORDER_STEP: вставка между соседями
+# берет середину промежутка и меняет одну строку, перенумерация колонки
+# нужна только когда промежуток исчерпан
+ORDER_STEP = 1024
+
+
+def _renumber(column, tasks, exclude=None):
+    """
+    Перенумерация колонки с шагом ORDER_STEP одним UPDATE ... CASE.
+
+    Задача exclude получает позицию, но не записывается: ее сохраняет
+    вызывающий код через save().
+    """
+    for index, task in enumerate(tasks):
+        task.order = (index + 1) * ORDER_STEP
+        task.column = column
+    ProjectTask.objects.bulk_update(
+        [task for task in tasks if task is not exclude], ['order', 'column'], batch_size=1000
+    )
+
+
+def _position_between(previous_order, next_order):
+    """Позиция между соседями или None, если свободного места нет"""
+    if previous_order is None and next_order is None:
+        return ORDER_STEP
+    if next_order is None:
+        return previous_order + ORDER_STEP
+    low = previous_order if previous_order is not None else 0
+    if next_order - low > 1:
+        return (low + next_order) // 2
+    return None
+
+
+def move_task(task, column, index, user):
+    """
+    Перемещение задачи на позицию index (с нуля) в колонке column.
+
+    Обычно обновляется одна строка: задача получает позицию между новыми
+    соседями. Строка колонки блокируется, поэтому параллельные перемещения
+    в одной колонке не получают одинаковых позиций. Соседи перенумеровываются
+    через bulk_update, а сама задача сохраняется через save(), чтобы
+    сработали сигналы смены колонки: завершение связанной продажи или
+    заказа, уведомления, события интеграции и счетчики.
+    """
+    with transaction.atomic():
+        ProjectColumn.objects.select_for_update().filter(pk=column.pk).first()
+        siblings = ProjectTask.objects.filter(column=column).exclude(pk=task.pk).order_by('order', 'id')
+        index = max(index, 0)
+        neighbours = list(siblings.values_list('order', flat=True)[max(index - 1, 0):index + 1])
+        if index == 0:
+            previous_order, next_order = None, (neighbours[0] if neighbours else None)
+        else:
+            previous_order = neighbours[0] if neighbours else None
+            next_order = neighbours[1] if len(neighbours) > 1 else None
+            if previous_order is None:
+                # Позиция за концом колонки - ставим последней
+                previous_order = siblings.values_list('order', flat=True).last()
+
+        old_column_id, old_order = task.column_id, task.order
+        new_order = _position_between(previous_order, next_order)
+        if new_order is None:
+            tasks = list(siblings.only('id', 'order', 'column'))
+            tasks.insert(index, task)
+            _renumber(column, tasks, exclude=task)
+        else:
+            task.column = column
+            task.order = new_order
+        task.save(update_fields=['column', 'order', 'updated_at'])
+
+        # Смену колонки записывает в историю сигнал create_task_history
+        if old_column_id == column.pk:
+            TaskHistory.objects.create(
+                task=task,
+                user=user,
+                action='moved',
+                details={
+                    'from_column': old_column_id,
+                    'to_column': column.pk,
+                    'from_order': old_order,
+                    'to_order': task.order,
+                }
+            )
+    return task
+
+
+def reorder_column(column, task_ids, user):
+    """
+    Порядок задач колонки по списку task_ids.
+
+    Одна выборка, один UPDATE ... CASE для всех задач и один INSERT истории
+    для задач, сменивших позицию. Задачи колонки, не попавшие в список,
+    идут после перечисленных в прежнем порядке. Чужие id игнорируются.
+    """
+    with transaction.atomic():
+        ProjectColumn.objects.select_for_update().filter(pk=column.pk).first()
+        tasks = list(ProjectTask.objects.filter(column=column).only('id', 'order', 'column').order_by('order', 'id'))
+        positions = {task_id: index for index, task_id in enumerate(task_ids)}
+        old_positions = {task.pk: index for index, task in enumerate(tasks)}
+        tasks.sort(key=lambda task: positions.get(task.pk, len(positions)))
+        _renumber(column, tasks)
+
+        TaskHistory.objects.bulk_create([
+            TaskHistory(
+                task=task,
+                user=user,
+                action='reordered',
+                details={'column': column.pk, 'from_index': old_positions[task.pk], 'to_index': index}
+            )
+            for index, task in enumerate(tasks)
+            if old_positions[task.pk] != index
+        ])
+    return tasks
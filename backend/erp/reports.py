@@ -5,31 +5,66 @@ from datetime import timedelta, datetime
 from decimal import Decimal
 from .models import (
     Sale, ServiceOrder, Financial, Inventory, 
-    ProjectBoard, ProjectTask, Service
+    ProjectBoard, ProjectTask, Service,
+    SaleDailySnapshot, ServiceOrderDailySnapshot, ServiceUsageDailySnapshot, FinancialDailySnapshot
 )
+from .snapshots import day_start, snapshot_days, snapshots_enabled
 
 class ERPReportGenerator:
     """Генератор отчетов для ERP системы"""
     
-    def __init__(self, company=None, start_date=None, end_date=None):
+    def __init__(self, company=None, start_date=None, end_date=None, use_snapshots=True):
         self.company = company
         self.start_date = start_date or (timezone.now() - timedelta(days=30))
         self.end_date = end_date or timezone.now()
+        # Дневные снимки (erp.snapshots) вместо агрегации сырых таблиц
+        self.use_snapshots = use_snapshots
+    
+    def _snapshots(self, fact, model):
+        """Строки снимков за период или None, если отчет строится по сырым данным"""
+        if not (self.use_snapshots and snapshots_enabled(fact)):
+            return None
+        queryset = model.objects.filter(date__range=snapshot_days(self.start_date, self.end_date))
+        if self.company:
+            queryset = queryset.filter(company=self.company)
+        return queryset.order_by()
+    
+    def _period_filter(self, date_field, snapshots):
+        """
+        Фильтр сырых данных по периоду. В отчете по снимкам границы - те же
+        целые дни, что и у снимков, иначе разделы из сырых данных (топ
+        клиентов) не сходились бы с итогами.
+        """
+        if snapshots is None:
+            return {f'{date_field}__range': (self.start_date, self.end_date)}
+        first_day, last_day = snapshot_days(self.start_date, self.end_date)
+        return {
+            f'{date_field}__gte': day_start(first_day),
+            f'{date_field}__lt': day_start(last_day + timedelta(days=1)),
+        }
     
     def get_sales_report(self):
         """Отчет по продажам"""
-        queryset = Sale.objects.filter(
-            sale_date__range=(self.start_date, self.end_date)
-        )
+        snapshots = self._snapshots('sales', SaleDailySnapshot)
+        queryset = Sale.objects.filter(**self._period_filter('sale_date', snapshots))
         
         if self.company:
             queryset = queryset.filter(company=self.company)
         
-        # Общая статистика
-        total_sales = queryset.count()
-        total_revenue = queryset.aggregate(total=Sum('sale_price'))['total'] or Decimal('0')
-        total_commission = queryset.aggregate(total=Sum('commission'))['total'] or Decimal('0')
-        avg_sale_price = queryset.aggregate(avg=Avg('sale_price'))['avg'] or Decimal('0')
+        if snapshots is not None:
+            return self._get_sales_report_from_snapshots(snapshots, queryset)
+        
+        # Общая статистика за один проход
+        totals = queryset.aggregate(
+            total_sales=Count('id'),
+            total_revenue=Sum('sale_price'),
+            total_commission=Sum('commission'),
+            avg_sale_price=Avg('sale_price')
+        )
+        total_sales = totals['total_sales']
+        total_revenue = totals['total_revenue'] or Decimal('0')
+        total_commission = totals['total_commission'] or Decimal('0')
+        avg_sale_price = totals['avg_sale_price'] or Decimal('0')
         
         # Статистика по статусам
         status_stats = queryset.values('status').annotate(
@@ -47,16 +82,70 @@ class ERPReportGenerator:
         ).order_by('date')
         
         # Топ автомобилей по продажам
-        top_cars = queryset.values('car__model__brand__name', 'car__model__name').annotate(
+        top_cars = queryset.values('car__vehicle__model__brand__name', 'car__vehicle__model__name').annotate(
             sales_count=Count('id'),
             total_revenue=Sum('sale_price')
         ).order_by('-sales_count')[:10]
         
-        # Топ клиентов
-        top_customers = queryset.values('customer__username', 'customer__email').annotate(
+        return {
+            'period': {
+                'start': self.start_date,
+                'end': self.end_date
+            },
+            'summary': {
+                'total_sales': total_sales,
+                'total_revenue': total_revenue,
+                'total_commission': total_commission,
+                'avg_sale_price': avg_sale_price,
+                'net_revenue': total_revenue - total_commission
+            },
+            'status_stats': status_stats,
+            'daily_stats': daily_stats,
+            'top_cars': top_cars,
+            'top_customers': self._get_top_sale_customers(queryset)
+        }
+    
+    def _get_top_sale_customers(self, queryset):
+        """Топ клиентов: в снимки не входит, считается по сырым данным"""
+        return queryset.values('customer__username', 'customer__email').annotate(
             purchases_count=Count('id'),
             total_spent=Sum('sale_price')
         ).order_by('-total_spent')[:10]
+    
+    def _get_sales_report_from_snapshots(self, snapshots, queryset):
+        """Отчет по продажам из дневных снимков"""
+        totals = snapshots.aggregate(
+            total_sales=Sum('sale_count'),
+            total_revenue=Sum('price_sum'),
+            total_commission=Sum('commission_sum')
+        )
+        total_sales = totals['total_sales'] or 0
+        total_revenue = totals['total_revenue'] or Decimal('0')
+        total_commission = totals['total_commission'] or Decimal('0')
+        
+        status_stats = snapshots.values('status').annotate(
+            count=Sum('sale_count'),
+            revenue=Sum('price_sum')
+        )
+        
+        daily_stats = snapshots.values('date').annotate(
+            sales_count=Sum('sale_count'),
+            revenue=Sum('price_sum'),
+            commission=Sum('commission_sum')
+        ).order_by('date')
+        
+        top_cars = [
+            {
+                'car__vehicle__model__brand__name': row['car_model__brand__name'],
+                'car__vehicle__model__name': row['car_model__name'],
+                'sales_count': row['sales_count'],
+                'total_revenue': row['total_revenue']
+            }
+            for row in snapshots.values('car_model__brand__name', 'car_model__name').annotate(
+                sales_count=Sum('sale_count'),
+                total_revenue=Sum('price_sum')
+            ).order_by('-sales_count')[:10]
+        ]
         
         return {
             'period': {
@@ -67,29 +156,37 @@ class ERPReportGenerator:
                 'total_sales': total_sales,
                 'total_revenue': total_revenue,
                 'total_commission': total_commission,
-                'avg_sale_price': avg_sale_price,
+                'avg_sale_price': total_revenue / total_sales if total_sales else Decimal('0'),
                 'net_revenue': total_revenue - total_commission
             },
             'status_stats': status_stats,
             'daily_stats': daily_stats,
             'top_cars': top_cars,
-            'top_customers': top_customers
+            'top_customers': self._get_top_sale_customers(queryset)
         }
     
     def get_service_report(self):
         """Отчет по сервисным услугам"""
-        queryset = ServiceOrder.objects.filter(
-            created_at__range=(self.start_date, self.end_date)
-        )
+        snapshots = self._snapshots('service', ServiceOrderDailySnapshot)
+        queryset = ServiceOrder.objects.filter(**self._period_filter('created_at', snapshots))
         
         if self.company:
             queryset = queryset.filter(company=self.company)
         
-        # Общая статистика
-        total_orders = queryset.count()
-        completed_orders = queryset.filter(status='completed').count()
-        total_revenue = queryset.aggregate(total=Sum('total_price'))['total'] or Decimal('0')
-        avg_order_price = queryset.aggregate(avg=Avg('total_price'))['avg'] or Decimal('0')
+        if snapshots is not None:
+            return self._get_service_report_from_snapshots(snapshots, queryset)
+        
+        # Общая статистика за один проход
+        totals = queryset.aggregate(
+            total_orders=Count('id'),
+            completed_orders=Count('id', filter=Q(status='completed')),
+            total_revenue=Sum('total_price'),
+            avg_order_price=Avg('total_price')
+        )
+        total_orders = totals['total_orders']
+        completed_orders = totals['completed_orders']
+        total_revenue = totals['total_revenue'] or Decimal('0')
+        avg_order_price = totals['avg_order_price'] or Decimal('0')
         
         # Статистика по статусам
         status_stats = queryset.values('status').annotate(
@@ -111,11 +208,68 @@ class ERPReportGenerator:
             revenue=Sum('total_price')
         ).order_by('date')
         
-        # Топ клиентов по сервису
-        top_customers = queryset.values('customer__username', 'customer__email').annotate(
+        return {
+            'period': {
+                'start': self.start_date,
+                'end': self.end_date
+            },
+            'summary': {
+                'total_orders': total_orders,
+                'completed_orders': completed_orders,
+                'completion_rate': (completed_orders / total_orders * 100) if total_orders > 0 else 0,
+                'total_revenue': total_revenue,
+                'avg_order_price': avg_order_price
+            },
+            'status_stats': status_stats,
+            'service_stats': service_stats,
+            'daily_stats': daily_stats,
+            'top_customers': self._get_top_service_customers(queryset)
+        }
+    
+    def _get_top_service_customers(self, queryset):
+        """Топ клиентов по сервису: в снимки не входит, считается по сырым данным"""
+        return queryset.values('customer__username', 'customer__email').annotate(
             orders_count=Count('id'),
             total_spent=Sum('total_price')
         ).order_by('-total_spent')[:10]
+    
+    def _get_service_report_from_snapshots(self, snapshots, queryset):
+        """Отчет по сервисным услугам из дневных снимков"""
+        totals = snapshots.aggregate(
+            total_orders=Sum('order_count'),
+            completed_orders=Sum('order_count', filter=Q(status='completed')),
+            total_revenue=Sum('price_sum')
+        )
+        total_orders = totals['total_orders'] or 0
+        completed_orders = totals['completed_orders'] or 0
+        total_revenue = totals['total_revenue'] or Decimal('0')
+        
+        status_stats = snapshots.values('status').annotate(
+            count=Sum('order_count'),
+            revenue=Sum('price_sum')
+        )
+        
+        usage = ServiceUsageDailySnapshot.objects.filter(
+            date__range=snapshot_days(self.start_date, self.end_date)
+        )
+        if self.company:
+            usage = usage.filter(company=self.company)
+        service_stats = [
+            {
+                'services__name': row['service__name'],
+                'orders_count': row['orders_count'],
+                'total_revenue': row['total_revenue']
+            }
+            for row in usage.values('service__name').annotate(
+                orders_count=Sum('order_count'),
+                total_revenue=Sum('price_sum')
+            ).order_by('-total_revenue')
+        ]
+        
+        daily_stats = snapshots.values('date').annotate(
+            orders_count=Sum('order_count'),
+            revenue=Sum('price_sum')
+        ).order_by('date')
         
         return {
             'period': {
@@ -127,16 +281,20 @@ class ERPReportGenerator:
                 'completed_orders': completed_orders,
                 'completion_rate': (completed_orders / total_orders * 100) if total_orders > 0 else 0,
                 'total_revenue': total_revenue,
-                'avg_order_price': avg_order_price
+                'avg_order_price': total_revenue / total_orders if total_orders else Decimal('0')
             },
             'status_stats': status_stats,
             'service_stats': service_stats,
             'daily_stats': daily_stats,
-            'top_customers': top_customers
+            'top_customers': self._get_top_service_customers(queryset)
         }
     
     def get_financial_report(self):
         """Финансовый отчет"""
+        snapshots = self._snapshots('financial', FinancialDailySnapshot)
+        if snapshots is not None:
+            return self._get_financial_report_from_snapshots(snapshots)
+        
         queryset = Financial.objects.filter(
             date__range=(self.start_date, self.end_date)
         )
@@ -144,8 +302,13 @@ class ERPReportGenerator:
         if self.company:
             queryset = queryset.filter(company=self.company)
         
-        # Общая статистика
-        total_operations = queryset.count()
+        # Общая статистика, доходы и расходы за один проход
+        totals = queryset.aggregate(
+            total_operations=Count('id'),
+            income=Sum('amount', filter=Q(operation_type='income')),
+            expenses=Sum('amount', filter=Q(operation_type='expense'))
+        )
+        total_operations = totals['total_operations']
         
         # Статистика по типам операций
         operation_stats = queryset.values('operation_type').annotate(
@@ -153,9 +316,8 @@ class ERPReportGenerator:
             total_amount=Sum('amount')
         )
         
-        # Доходы и расходы
-        income = queryset.filter(operation_type='income').aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        expenses = queryset.filter(operation_type='expense').aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        income = totals['income'] or Decimal('0')
+        expenses = totals['expenses'] or Decimal('0')
         net_income = income - expenses
         
         # Статистика по категориям
@@ -164,14 +326,14 @@ class ERPReportGenerator:
             total_amount=Sum('amount')
         ).order_by('-total_amount')
         
-        # Статистика по дням
+        # Статистика по дням (аннотация 'date' конфликтует с полем модели)
         daily_stats = queryset.annotate(
-            date=TruncDate('date')
-        ).values('date').annotate(
+            day=TruncDate('date')
+        ).values('day').annotate(
             operations_count=Count('id'),
             income=Sum('amount', filter=Q(operation_type='income')),
             expenses=Sum('amount', filter=Q(operation_type='expense'))
-        ).order_by('date')
+        ).order_by('day')
         
         return {
             'period': {
@@ -190,6 +352,50 @@ class ERPReportGenerator:
             'daily_stats': daily_stats
         }
     
+    def _get_financial_report_from_snapshots(self, snapshots):
+        """Финансовый отчет из дневных снимков"""
+        totals = snapshots.aggregate(
+            total_operations=Sum('operation_count'),
+            income=Sum('amount_sum', filter=Q(operation_type='income')),
+            expenses=Sum('amount_sum', filter=Q(operation_type='expense'))
+        )
+        income = totals['income'] or Decimal('0')
+        expenses = totals['expenses'] or Decimal('0')
+        net_income = income - expenses
+        
+        operation_stats = snapshots.values('operation_type').annotate(
+            count=Sum('operation_count'),
+            total_amount=Sum('amount_sum')
+        )
+        
+        category_stats = snapshots.values('category').annotate(
+            count=Sum('operation_count'),
+            total_amount=Sum('amount_sum')
+        ).order_by('-total_amount')
+        
+        daily_stats = snapshots.values(day=F('date')).annotate(
+            operations_count=Sum('operation_count'),
+            income=Sum('amount_sum', filter=Q(operation_type='income')),
+            expenses=Sum('amount_sum', filter=Q(operation_type='expense'))
+        ).order_by('day')
+        
+        return {
+            'period': {
+                'start': self.start_date,
+                'end': self.end_date
+            },
+            'summary': {
+                'total_operations': totals['total_operations'] or 0,
+                'total_income': income,
+                'total_expenses': expenses,
+                'net_income': net_income,
+                'profit_margin': (net_income / income * 100) if income > 0 else 0
+            },
+            'operation_stats': operation_stats,
+            'category_stats': category_stats,
+            'daily_stats': daily_stats
+        }
+    
     def get_inventory_report(self):
         """Отчет по инвентарю"""
         queryset = Inventory.objects.all()
@@ -212,7 +418,7 @@ class ERPReportGenerator:
         )
         
         # Топ автомобилей по стоимости
-        top_cars = queryset.values('car__model__brand__name', 'car__model__name').annotate(
+        top_cars = queryset.values('car__vehicle__model__brand__name', 'car__vehicle__model__name').annotate(
             items_count=Count('id'),
             total_quantity=Sum('quantity'),
             total_cost=Sum(F('cost_price') * F('quantity')),
@@ -221,7 +427,7 @@ class ERPReportGenerator:
         
         # Автомобили с низким запасом
         low_stock = queryset.filter(quantity__lte=2).values(
-            'car__model__brand__name', 'car__model__name', 'quantity', 'status'
+            'car__vehicle__model__brand__name', 'car__vehicle__model__name', 'quantity', 'status'
         )
         
         return {
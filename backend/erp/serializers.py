@@ -1,13 +1,15 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.urls import reverse
 from django.utils import timezone
 from .models import (
     Project, ProjectMember, Board, Column, Task, TaskLabel, 
     TaskLabelAssignment, TaskComment, TaskAttachment, TaskHistory,
     Sprint, SprintTask, TimeEntry,
     Inventory, Sale, Service, ServiceOrder, ServiceOrderItem, Financial,
-    ProjectBoard, ProjectColumn, ProjectTask, TaskComment, TaskAttachment, TaskHistory, TaskLabel
+    ProjectBoard, ProjectColumn, ProjectTask, TaskComment, TaskAttachment, TaskHistory, TaskLabel,
+    ReportJob
 )
 from cars.models import (
     Auction, AuctionBid,
@@ -519,10 +521,47 @@ class TaskHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = TaskHistory
         fields = [
-            'id', 'task', 'user', 'action', 'old_value', 'new_value', 'created_at'
+            'id', 'task', 'user', 'action', 'details', 'created_at'
         ]
 
 # Dashboard and Report Serializers
+class ReportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'report_type', 'export_format', 'company', 'start_date', 'end_date',
+            'status', 'row_count', 'error', 'download_url', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = ['status', 'row_count', 'error', 'created_at', 'started_at', 'finished_at']
+
+    def get_download_url(self, obj):
+        if obj.status != 'completed':
+            return None
+        request = self.context.get('request')
+        url = reverse('reportjob-download', kwargs={'pk': obj.pk})
+        return request.build_absolute_uri(url) if request else url
+
+    def validate(self, attrs):
+        from .exports import ROW_EXPORTS
+
+        if attrs.get('export_format', 'json') != 'json' and attrs['report_type'] not in ROW_EXPORTS:
+            raise serializers.ValidationError({
+                'export_format': f'CSV/XLSX доступны только для выгрузок: {", ".join(ROW_EXPORTS)}'
+            })
+        start_date, end_date = attrs.get('start_date'), attrs.get('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise serializers.ValidationError({'end_date': 'Дата окончания раньше даты начала'})
+        user = self.context['request'].user
+        company = attrs.get('company')
+        if company and not user.is_staff and company.owner_id != user.id:
+            raise serializers.ValidationError({'company': 'Нет доступа к компании'})
+        # Отчеты ERPReportGenerator без компании охватывают все компании
+        if not company and not user.is_staff and attrs.get('export_format', 'json') == 'json':
+            raise serializers.ValidationError({'company': 'Укажите компанию для отчета'})
+        return attrs
+
 class DashboardStatsSerializer(serializers.Serializer):
     total_inventory = serializers.IntegerField()
     available_inventory = serializers.IntegerField()
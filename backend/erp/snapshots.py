@@ -0,0 +1,240 @@
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from itertools import chain, islice
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import (
+    Sale, ServiceOrder, ServiceOrderItem, Financial,
+    SaleDailySnapshot, ServiceOrderDailySnapshot, ServiceUsageDailySnapshot, FinancialDailySnapshot,
+    ReportSnapshotState, ReportSnapshotDirtyDay
+)
+
+# Строки, измененные незадолго до прошлого обновления, перечитываются:
+# транзакции, начатые раньше, могли зафиксироваться уже после него
+REFRESH_OVERLAP = timedelta(minutes=5)
+BATCH_SIZE = 1000
+
+# Как сырая таблица сворачивается в дневную таблицу снимков: поля и
+# выражения группировки (кроме компании и дня) и агрегаты
+SnapshotTable = namedtuple('SnapshotTable', 'model fields expressions aggregates')
+SnapshotSpec = namedtuple('SnapshotSpec', 'model date_field tables')
+
+SNAPSHOT_SPECS = {
+    'sales': SnapshotSpec(Sale, 'sale_date', [
+        SnapshotTable(
+            SaleDailySnapshot, ['status'], {'car_model_id': F('car__vehicle__model')},
+            {'sale_count': Count('id'), 'price_sum': Sum('sale_price'), 'commission_sum': Sum('commission')}
+        ),
+    ]),
+    'service': SnapshotSpec(ServiceOrder, 'created_at', [
+        SnapshotTable(
+            ServiceOrderDailySnapshot, ['status'], {},
+            {'order_count': Count('id'), 'price_sum': Sum('total_price')}
+        ),
+        SnapshotTable(
+            ServiceUsageDailySnapshot, [], {'service_id': F('services')},
+            {'order_count': Count('id'), 'price_sum': Sum('total_price')}
+        ),
+    ]),
+    'financial': SnapshotSpec(Financial, 'date', [
+        SnapshotTable(
+            FinancialDailySnapshot, ['operation_type', 'category'], {},
+            {'operation_count': Count('id'), 'amount_sum': Sum('amount')}
+        ),
+    ]),
+}
+
+FACT_BY_MODEL = {spec.model: fact for fact, spec in SNAPSHOT_SPECS.items()}
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def snapshot_days(start_date, end_date):
+    """
+    Дни, которыми снимки отвечают на период [start_date, end_date].
+
+    Снимки хранят целые дни, поэтому неполные дни на границах периода
+    учитываются целиком; конец периода ровно в полночь следующий день
+    не захватывает.
+    """
+    first_day = timezone.localdate(start_date)
+    last_day = timezone.localdate(end_date - timedelta(microseconds=1)) if end_date > start_date else first_day
+    return first_day, max(first_day, last_day)
+
+
+def snapshots_enabled(fact):
+    """Снимки включены (ERP_REPORT_SNAPSHOTS) и построены хотя бы один раз"""
+    if not getattr(settings, 'ERP_REPORT_SNAPSHOTS', True):
+        return False
+    return ReportSnapshotState.objects.filter(fact=fact, refreshed_until__isnull=False).exists()
+
+
+def mark_days_dirty(fact, days):
+    """Отмечает дни [(компания, дата или время)] для пересчета"""
+    ReportSnapshotDirtyDay.objects.bulk_create([
+        ReportSnapshotDirtyDay(fact=fact, company_id=company_id, date=timezone.localdate(value))
+        for company_id, value in days if value is not None
+    ], ignore_conflicts=True)
+
+
+def mark_dirty(instance):
+    """Отмечает день объекта для пересчета: удаление не оставляет следа в updated_at"""
+    fact = FACT_BY_MODEL[type(instance)]
+    mark_days_dirty(fact, [(instance.company_id, getattr(instance, SNAPSHOT_SPECS[fact].date_field))])
+
+
+def day_ranges(days):
+    """Непрерывные отрезки из набора дней"""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day - ranges[-1][1] == timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [tuple(day_range) for day_range in ranges]
+
+
+def rebuild_days(fact, first_day, last_day, company_id=None):
+    """
+    Пересчитывает снимки за дни [first_day, last_day] по сырой таблице.
+
+    Старые строки снимков за эти дни удаляются и строятся заново одним
+    GROUP BY на таблицу, поэтому повторный пересчет безопасен.
+    Возвращает количество созданных строк снимков.
+    """
+    spec = SNAPSHOT_SPECS[fact]
+    raw = spec.model.objects.filter(**{
+        f'{spec.date_field}__gte': day_start(first_day),
+        f'{spec.date_field}__lt': day_start(last_day + timedelta(days=1)),
+    })
+    if company_id is not None:
+        raw = raw.filter(company_id=company_id)
+    raw = raw.annotate(day=TruncDate(spec.date_field)).order_by()
+
+    created = 0
+    for table in spec.tables:
+        snapshots = table.model.objects.filter(date__range=(first_day, last_day))
+        if company_id is not None:
+            snapshots = snapshots.filter(company_id=company_id)
+        snapshots.delete()
+
+        names = [*table.fields, *table.expressions, *table.aggregates]
+        rows = raw.values('company_id', 'day', *table.fields, **table.expressions).annotate(**table.aggregates)
+        objects = (
+            table.model(company_id=row['company_id'], date=row['day'], **{name: row[name] for name in names})
+            for row in rows.iterator(chunk_size=BATCH_SIZE)
+        )
+        while True:
+            batch = list(islice(objects, BATCH_SIZE))
+            if not batch:
+                break
+            table.model.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+def changed_days(fact, since):
+    """
+    Дни компаний, которые нужно пересчитать: измененные с момента since
+    строки и отмеченные mark_dirty. Отметки снимаются.
+    """
+    spec = SNAPSHOT_SPECS[fact]
+    changed = spec.model.objects.filter(updated_at__gte=since).annotate(
+        day=TruncDate(spec.date_field)
+    ).values_list('company_id', 'day').distinct().order_by()
+
+    dirty = list(ReportSnapshotDirtyDay.objects.filter(fact=fact).values_list('id', 'company_id', 'date'))
+    ReportSnapshotDirtyDay.objects.filter(id__in=[row[0] for row in dirty]).delete()
+
+    days = {}
+    for company_id, day in chain(changed, ((company_id, day) for _, company_id, day in dirty)):
+        days.setdefault(company_id, set()).add(day)
+    return days
+
+
+def refresh_snapshots(full=False):
+    """
+    Инкрементальное обновление дневных снимков отчетов.
+
+    Пересчитываются только дни компаний, в которых с прошлого обновления
+    менялись, добавлялись или удалялись строки. С full=True (или при первом
+    запуске) снимки строятся заново целиком. Строка состояния блокируется,
+    поэтому параллельные запуски ждут друг друга. Возвращает количество
+    пересчитанных отрезков дней по каждому типу снимков.
+    """
+    refreshed = {}
+    for fact, spec in SNAPSHOT_SPECS.items():
+        ReportSnapshotState.objects.get_or_create(fact=fact)
+        with transaction.atomic():
+            state = ReportSnapshotState.objects.select_for_update().get(fact=fact)
+            now = timezone.now()
+            if full or state.refreshed_until is None:
+                for table in spec.tables:
+                    table.model.objects.all().delete()
+                ReportSnapshotDirtyDay.objects.filter(fact=fact).delete()
+                bounds = spec.model.objects.aggregate(first=Min(spec.date_field), last=Max(spec.date_field))
+                ranges = []
+                if bounds['first'] is not None:
+                    ranges.append((None, timezone.localdate(bounds['first']), timezone.localdate(bounds['last'])))
+            else:
+                ranges = [
+                    (company_id, first_day, last_day)
+                    for company_id, days in changed_days(fact, state.refreshed_until - REFRESH_OVERLAP).items()
+                    for first_day, last_day in day_ranges(days)
+                ]
+
+            for company_id, first_day, last_day in ranges:
+                rebuild_days(fact, first_day, last_day, company_id=company_id)
+            state.refreshed_until = now
+            state.save(update_fields=['refreshed_until', 'updated_at'])
+        refreshed[fact] = len(ranges)
+    return refreshed
+
+
+@receiver(post_delete, sender=Sale)
+@receiver(post_delete, sender=ServiceOrder)
+@receiver(post_delete, sender=Financial)
+def mark_deleted_day_dirty(sender, instance, **kwargs):
+    """Удаленная строка исчезает из выборки по updated_at, день отмечается явно"""
+    mark_dirty(instance)
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_save, sender=ServiceOrder)
+@receiver(post_save, sender=Financial)
+def mark_moved_day_dirty(sender, instance, created, **kwargs):
+    """
+    Строка, перенесенная на другой день или в другую компанию, уходит из
+    снимка прежнего дня, но по updated_at находится только новый день.
+    Отмечаются оба: новый - на случай сохранения без updated_at.
+    """
+    if created:
+        return
+    fact = FACT_BY_MODEL[sender]
+    date_field = SNAPSHOT_SPECS[fact].date_field
+    changes = getattr(instance, 'saved_changes', {})
+    if date_field not in changes and 'company' not in changes:
+        return
+    old_date = changes.get(date_field, (getattr(instance, date_field),))[0]
+    old_company_id = changes.get('company', (instance.company_id,))[0]
+    mark_days_dirty(fact, [
+        (old_company_id, old_date),
+        (instance.company_id, getattr(instance, date_field)),
+    ])
+
+
+@receiver([post_save, post_delete], sender=ServiceOrderItem)
+def mark_service_order_day_dirty(sender, instance, **kwargs):
+    """Изменение состава услуг не меняет updated_at заказа"""
+    try:
+        mark_dirty(instance.service_order)
+    except ServiceOrder.DoesNotExist:
+        # Заказ удаляется каскадом, его день уже отмечен
+        pass
@@ -0,0 +1,37 @@
+import logging
+from celery import shared_task
+
+from .exports import build_report_job, claim_job, recover_stale_jobs
+from .models import ReportJob
+from .snapshots import refresh_snapshots
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def refresh_report_snapshots(full=False):
+    """Инкрементальное обновление дневных снимков отчетов ERP"""
+    refreshed = refresh_snapshots(full=full)
+    logger.info(f'Снимки отчетов ERP обновлены: {refreshed}')
+    return refreshed
+
+
+@shared_task(ignore_result=True)
+def build_report(job_id):
+    """Формирование отчета или выгрузки по заданию ReportJob"""
+    if not claim_job(job_id):
+        return None
+    job = build_report_job(ReportJob.objects.select_related('user').get(pk=job_id))
+    logger.info(f'Задание на отчет {job_id}: {job.status}, строк: {job.row_count}')
+    return job.status
+
+
+@shared_task(ignore_result=True)
+def recover_report_jobs():
+    """Повторный запуск заданий на отчеты, брошенных упавшими воркерами"""
+    job_ids = recover_stale_jobs()
+    for job_id in job_ids:
+        build_report.delay(job_id)
+    if job_ids:
+        logger.warning(f'Задания на отчеты поставлены повторно: {job_ids}')
+    return len(job_ids)
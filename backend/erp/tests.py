@@ -0,0 +1,196 @@
+import io
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from cars.models import Car
+from companies.models import Company
+from .exports import REPORT_JOB_MAX_ATTEMPTS, REPORT_JOB_TIMEOUT, recover_stale_jobs, write_json
+from .models import Sale, Inventory, ProjectBoard, ProjectColumn, ProjectTask, TaskHistory, ReportJob, ReportSnapshotDirtyDay
+from .ordering import move_task, ORDER_STEP
+
+User = get_user_model()
+
+
+class MoveTaskTest(TestCase):
+    """Тесты перемещения задач между колонками"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='manager',
+            email='manager@example.com',
+            password='testpass123'
+        )
+        self.company = Company.objects.create(name='Test Company', owner=self.user)
+        board = ProjectBoard.objects.create(
+            company=self.company,
+            name='Продажи',
+            board_type='sales',
+            created_by=self.user
+        )
+        self.in_progress = ProjectColumn.objects.create(board=board, name='В работе', order=1)
+        self.done = ProjectColumn.objects.create(board=board, name='Завершено', order=2)
+        self.sale = Sale.objects.create(
+            company=self.company,
+            car=Car.objects.create(),
+            customer=self.user,
+            sale_price=Decimal('1000000.00')
+        )
+        self.task = ProjectTask.objects.create(
+            column=self.in_progress,
+            title='Оформить продажу',
+            order=ORDER_STEP,
+            related_sale=self.sale,
+            created_by=self.user
+        )
+
+    def test_move_to_done_column_completes_sale(self):
+        """Перемещение в колонку "Завершено" завершает связанную продажу"""
+        move_task(self.task, self.done, 0, self.user)
+
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.status, 'completed')
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.column, self.done)
+        self.assertTrue(TaskHistory.objects.filter(task=self.task, action='moved').exists())
+
+    def test_move_with_renumbering_keeps_sibling_order(self):
+        """Если между соседями нет места, колонка перенумеровывается"""
+        first = ProjectTask.objects.create(column=self.done, title='Первая', order=1, created_by=self.user)
+        second = ProjectTask.objects.create(column=self.done, title='Вторая', order=2, created_by=self.user)
+
+        move_task(self.task, self.done, 1, self.user)
+
+        ordered = list(ProjectTask.objects.filter(column=self.done).order_by('order').values_list('pk', flat=True))
+        self.assertEqual(ordered, [first.pk, self.task.pk, second.pk])
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.status, 'completed')
+
+
+class ReportJobTest(TestCase):
+    """Тесты заданий на отчеты"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='owner',
+            email='owner@example.com',
+            password='testpass123'
+        )
+
+    def test_report_without_company_is_denied_for_non_staff(self):
+        """Отчет без компании не охватывает чужие компании"""
+        job = ReportJob.objects.create(user=self.user, report_type='sales', export_format='json')
+
+        with self.assertRaises(PermissionError):
+            write_json(job, io.StringIO())
+
+    def test_recover_stale_jobs(self):
+        """Брошенные задания возвращаются в очередь, исчерпавшие попытки - failed"""
+        started_at = timezone.now() - REPORT_JOB_TIMEOUT - timedelta(minutes=1)
+        stale = ReportJob.objects.create(
+            user=self.user, report_type='sales', status='running', started_at=started_at, attempts=1
+        )
+        exhausted = ReportJob.objects.create(
+            user=self.user, report_type='sales', status='running', started_at=started_at,
+            attempts=REPORT_JOB_MAX_ATTEMPTS
+        )
+        fresh = ReportJob.objects.create(
+            user=self.user, report_type='sales', status='running', started_at=timezone.now(), attempts=1
+        )
+
+        self.assertEqual(recover_stale_jobs(), [stale.pk])
+        stale.refresh_from_db()
+        exhausted.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, 'pending')
+        self.assertEqual(exhausted.status, 'failed')
+        self.assertEqual(fresh.status, 'running')
+
+
+class SnapshotDirtyDaysTest(TestCase):
+    """Тесты отметки дней снимков для пересчета"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='seller',
+            email='seller@example.com',
+            password='testpass123'
+        )
+        self.company = Company.objects.create(name='Test Company', owner=self.user)
+
+    def test_moved_sale_marks_old_and_new_day(self):
+        """Перенос продажи на другой день отмечает прежний и новый день"""
+        old_date = timezone.now() - timedelta(days=10)
+        sale = Sale.objects.create(
+            company=self.company,
+            car=Car.objects.create(),
+            customer=self.user,
+            sale_price=Decimal('1000000.00')
+        )
+        # sale_date заполняется при создании, прежняя дата задается отдельно
+        Sale.objects.filter(pk=sale.pk).update(sale_date=old_date)
+        sale = Sale.objects.get(pk=sale.pk)
+        sale.sale_date = timezone.now()
+        sale.save()
+
+        days = set(ReportSnapshotDirtyDay.objects.filter(fact='sales').values_list('company_id', 'date'))
+        self.assertEqual(days, {
+            (self.company.pk, timezone.localdate(old_date)),
+            (self.company.pk, timezone.localdate()),
+        })
+
+
+class InventoryTaskTest(TestCase):
+    """Тесты задач по изменению статуса инвентаря"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='storekeeper',
+            email='storekeeper@example.com',
+            password='testpass123'
+        )
+        self.company = Company.objects.create(name='Test Company', owner=self.user)
+        self.inventory = Inventory.objects.create(
+            company=self.company,
+            car=Car.objects.create(),
+            cost_price=Decimal('900000.00'),
+            selling_price=Decimal('1000000.00')
+        )
+
+    def test_maintenance_task_without_staff_users(self):
+        """Задача на обслуживание создается от имени создателя доски, даже без сотрудников"""
+        board = ProjectBoard.objects.create(
+            company=self.company,
+            name='Склад',
+            board_type='inventory',
+            created_by=self.user
+        )
+        self.assertFalse(User.objects.filter(is_staff=True).exists())
+
+        self.inventory.status = 'maintenance'
+        self.inventory.save()
+
+        task = ProjectTask.objects.get(column__board=board)
+        self.assertEqual(task.created_by, self.user)
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.status, 'maintenance')
+
+    def test_task_error_does_not_block_inventory_save(self):
+        """Ошибка при создании задачи не мешает сохранению инвентаря"""
+        ProjectBoard.objects.create(
+            company=self.company,
+            name='Склад',
+            board_type='inventory',
+            created_by=self.user
+        )
+
+        with self.assertLogs('erp.signals', level='ERROR'):
+            with mock.patch.object(ProjectTask.objects, 'create', side_effect=ValueError('ошибка')):
+                self.inventory.status = 'maintenance'
+                self.inventory.save()
+
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.status, 'maintenance')
@@ -27,6 +27,7 @@ router.register(r'task-history', views.TaskHistoryViewSet, basename='taskhistory
 # Dashboard and Reports
 router.register(r'dashboard', views.DashboardViewSet, basename='dashboard')
 router.register(r'reports', views.ReportViewSet, basename='reports')
+router.register(r'report-jobs', views.ReportJobViewSet, basename='reportjob')
 
 urlpatterns = [
     path('api/erp/', include(router.urls)),
@@ -1,4 +1,5 @@
-from rest_framework import viewsets, status, filters
+import os
+from rest_framework import viewsets, status, filters, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
@@ -8,10 +9,13 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 import pytz
 from django.core.cache import cache
+from django.db import transaction
+from django.http import FileResponse
 
 from .models import (
     Inventory, Sale, Service, ServiceOrder, ServiceOrderItem, Financial,
-    ProjectBoard, ProjectColumn, ProjectTask, TaskComment, TaskAttachment, TaskHistory, TaskLabel
+    ProjectBoard, ProjectColumn, ProjectTask, TaskComment, TaskAttachment, TaskHistory, TaskLabel,
+    ReportJob
 )
 from cars.models import (
     Auction, AuctionBid,
@@ -24,6 +28,7 @@ from .serializers import (
     ProjectBoardSerializer, ProjectColumnSerializer, ProjectTaskSerializer,
     TaskCommentSerializer, TaskAttachmentSerializer, TaskHistorySerializer,
     DashboardStatsSerializer, SalesReportSerializer, FinancialReportSerializer, TaskReportSerializer,
+    ReportJobSerializer,
     AuctionSerializer,
     AuctionCreateSerializer,
     AuctionUpdateSerializer,
@@ -40,6 +45,8 @@ User = get_user_model()
 
 
 from .reports import ERPReportGenerator, DashboardMetrics
+from .tasks import build_report
+from .ordering import move_task, reorder_column
 from companies.models import Company
 
 # ERP Views
@@ -263,13 +270,7 @@ class ProjectColumnViewSet(viewsets.ModelViewSet):
         column = self.get_object()
         task_ids = request.data.get('task_ids', [])
         
-        for index, task_id in enumerate(task_ids):
-            try:
-                task = ProjectTask.objects.get(id=task_id, column=column)
-                task.order = index
-                task.save()
-            except ProjectTask.DoesNotExist:
-                pass
+        reorder_column(column, task_ids, request.user)
         
         return Response({'status': 'success'})
 
@@ -300,16 +301,7 @@ class ProjectTaskViewSet(viewsets.ModelViewSet):
                 id=column_id,
                 board__company__members=request.user
             )
-            task.column = new_column
-            task.order = order
-            task.save()
-            
-            # Обновляем порядок остальных задач
-            tasks = ProjectTask.objects.filter(column=new_column).exclude(id=task.id)
-            for index, t in enumerate(tasks):
-                if t.order >= order:
-                    t.order = index + 1
-                    t.save()
+            move_task(task, new_column, int(order), request.user)
             
             serializer = self.get_serializer(task)
             return Response(serializer.data)
@@ -539,6 +531,38 @@ class ReportViewSet(viewsets.ViewSet):
         report = generator.get_comprehensive_report()
         return Response(report)
 
+class ReportJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                       mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    API фонового формирования отчетов.
+
+    POST ставит задание в очередь Celery и сразу возвращает его (202),
+    GET по id показывает статус, download отдает готовый файл потоком.
+    """
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ReportJob.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = serializer.save(user=request.user)
+        transaction.on_commit(lambda: build_report.delay(job.pk))
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Скачивание готового файла отчета"""
+        job = self.get_object()
+        if job.status != 'completed' or not job.file:
+            return Response(
+                {'error': 'Отчет еще не готов', 'status': job.status},
+                status=status.HTTP_409_CONFLICT
+            )
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name))
+
 class DashboardViewSet(viewsets.ViewSet):
     """API для дашборда"""
     permission_classes = [IsAuthenticated]
@@ -0,0 +1,70 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from integration import outbox
+from integration.models import SystemEvent, SystemMetric, IntegrationLog
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает синхронную запись событий и метрик с outbox и замеряет доставку'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=5000,
+            help='Количество имитируемых сохранений'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=outbox.OUTBOX_BATCH_SIZE,
+            help='Размер пачки доставки'
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        # Все записи бенчмарка откатываются
+        with transaction.atomic():
+            sync_ms = self.measure(count, self.write_synchronously)
+            outbox_ms = self.measure(count, self.write_to_outbox)
+            self.stdout.write(
+                f'Запись в обработчике сигнала на одно сохранение: синхронно {sync_ms:.3f} мс, '
+                f'через outbox {outbox_ms:.3f} мс (x{sync_ms / outbox_ms:.1f})'
+            )
+
+            started = time.perf_counter()
+            delivered = outbox.drain_outbox(batch_size=options['batch_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Доставка: {delivered} сообщений за {elapsed * 1000:.0f} мс '
+                f'({delivered / elapsed:.0f} сообщений/с)'
+            )
+            transaction.set_rollback(True)
+
+    def measure(self, count, write):
+        """Среднее время записи на одно сохранение, мс"""
+        started = time.perf_counter()
+        for index in range(count):
+            write(index)
+        return (time.perf_counter() - started) * 1000 / count
+
+    def write_synchronously(self, index):
+        """Прежний путь: событие, пересчет COUNT(*) и метрика с логом в каждом сохранении"""
+        SystemEvent.objects.bulk_create([SystemEvent(
+            event_type='data_updated', description=f'Бенчмарк {index}', severity='low'
+        )])
+        metric = SystemMetric(metric_type='users', name='total_users', value=User.objects.count(), unit='users')
+        SystemMetric.objects.bulk_create([metric])
+        IntegrationLog.objects.bulk_create([IntegrationLog(
+            component='metrics', action='metric_created', status='success',
+            message=f'Создана метрика: {metric.name} = {metric.value} users'
+        )])
+
+    def write_to_outbox(self, index):
+        outbox.record_event(event_type='data_updated', description=f'Бенчмарк {index}', severity='low')
+        outbox.refresh_metric(metric_type='users', name='total_users', model=User, unit='users')
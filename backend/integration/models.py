@@ -30,6 +30,7 @@ class SystemMetric(models.Model):
         indexes = [
             models.Index(fields=['metric_type', 'timestamp']),
             models.Index(fields=['name', 'timestamp']),
+            models.Index(fields=['timestamp']),
         ]
     
     def __str__(self):
@@ -284,4 +285,88 @@ class IntegrationLog(models.Model):
         ]
     
     def __str__(self):
-        return f"{self.component} - {self.action}: {self.status}" 
\ No newline at end of file
+        return f"{self.component} - {self.action}: {self.status}" 
+
+class OutboxMessage(models.Model):
+    """
+    Исходящее сообщение для событий, метрик и логов интеграции.
+
+    Пишется обработчиками сигналов в той же транзакции, что и изменение
+    данных, и переносится в SystemEvent/SystemMetric/IntegrationLog
+    фоновой задачей. Непустой dedup_key схлопывает ожидающие сообщения:
+    например, один пересчет метрики на пачку изменений. Недоставленные
+    сообщения остаются в таблице с failed_at и текстом ошибки.
+    """
+    kind = models.CharField(max_length=20, choices=[
+        ('event', _('Событие')),
+        ('metric', _('Метрика')),
+        ('log', _('Лог')),
+    ], verbose_name=_('Тип'))
+    payload = models.JSONField(default=dict, verbose_name=_('Данные'))
+    dedup_key = models.CharField(max_length=255, unique=True, blank=True, null=True, verbose_name=_('Ключ дедупликации'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Создано'))
+    # Сообщение, которое не удалось доставить, откладывается и больше не выбирается
+    failed_at = models.DateTimeField(blank=True, null=True, verbose_name=_('Ошибка доставки'))
+    error = models.TextField(blank=True, verbose_name=_('Ошибка'))
+
+    class Meta:
+        verbose_name = _('Исходящее сообщение')
+        verbose_name_plural = _('Исходящие сообщения')
+        db_table = 'integration_outbox'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}"
+
+
+METRIC_RESOLUTIONS = [
+    ('1m', _('1 минута')),
+    ('1h', _('1 час')),
+    ('1d', _('1 день')),
+]
+
+
+class SystemMetricRollup(models.Model):
+    """Агрегат системной метрики за интервал (минута, час или день)"""
+    resolution = models.CharField(max_length=2, choices=METRIC_RESOLUTIONS, verbose_name=_('Разрешение'))
+    bucket = models.DateTimeField(verbose_name=_('Начало интервала'))
+    metric_type = models.CharField(max_length=50, verbose_name=_('Тип метрики'))
+    name = models.CharField(max_length=100, verbose_name=_('Название'))
+    unit = models.CharField(max_length=20, blank=True, null=True, verbose_name=_('Единица измерения'))
+    count = models.PositiveIntegerField(verbose_name=_('Количество замеров'))
+    sum = models.FloatField(verbose_name=_('Сумма'))
+    min = models.FloatField(verbose_name=_('Минимум'))
+    max = models.FloatField(verbose_name=_('Максимум'))
+
+    class Meta:
+        verbose_name = _('Агрегат метрики')
+        verbose_name_plural = _('Агрегаты метрик')
+        db_table = 'system_metric_rollups'
+        ordering = ['resolution', 'bucket']
+        unique_together = ['resolution', 'metric_type', 'name', 'bucket']
+        indexes = [
+            models.Index(fields=['resolution', 'bucket']),
+            models.Index(fields=['resolution', 'name', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.resolution}] {self.bucket}"
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else 0
+
+
+class MetricRollupState(models.Model):
+    """Граница, до которой построены агрегаты метрик разрешения"""
+    resolution = models.CharField(max_length=2, choices=METRIC_RESOLUTIONS, unique=True, verbose_name=_('Разрешение'))
+    rolled_until = models.DateTimeField(blank=True, null=True, verbose_name=_('Построено до'))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Обновлено'))
+
+    class Meta:
+        verbose_name = _('Состояние агрегатов метрик')
+        verbose_name_plural = _('Состояния агрегатов метрик')
+        db_table = 'metric_rollup_states'
+
+    def __str__(self):
+        return f"{self.resolution}: {self.rolled_until}"
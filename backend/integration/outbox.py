@@ -0,0 +1,229 @@
+import logging
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from .models import OutboxMessage, SystemEvent, SystemMetric, IntegrationLog
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 1000
+
+# Метрики, которые пересчитываются после доставки событий и логов
+SYSTEM_EVENTS_METRIC = {
+    'metric_type': 'events', 'name': 'total_system_events',
+    'model': 'integration.SystemEvent', 'field': None, 'unit': 'events',
+}
+INTEGRATION_LOGS_METRIC = {
+    'metric_type': 'logs', 'name': 'total_integration_logs',
+    'model': 'integration.IntegrationLog', 'field': None, 'unit': 'logs',
+}
+
+
+def publish(kind, payload, dedup_key=None):
+    """
+    Запись сообщения в outbox в текущей транзакции.
+
+    Сообщение с dedup_key, для которого уже есть ожидающее сообщение,
+    не записывается.
+    """
+    OutboxMessage.objects.bulk_create(
+        [OutboxMessage(kind=kind, payload=payload, dedup_key=dedup_key)],
+        ignore_conflicts=dedup_key is not None
+    )
+
+
+def record_event(event_type, description, user=None, severity='medium', metadata=None):
+    """Событие SystemEvent через outbox"""
+    publish('event', {
+        'event_type': event_type,
+        'description': description,
+        'user_id': user.pk if user is not None else None,
+        'severity': severity,
+        'metadata': metadata or {},
+    })
+
+
+def refresh_metric(metric_type, name, model, unit, field=None):
+    """
+    Пересчет метрики-итога по модели через outbox.
+
+    Метрика - количество строк модели или сумма поля field. Значение
+    считается при доставке, поэтому ожидающий пересчет одной метрики
+    всегда один, сколько бы изменений его ни запросили.
+    """
+    publish('metric', {
+        'metric_type': metric_type,
+        'name': name,
+        'model': model._meta.label,
+        'field': field,
+        'unit': unit,
+    }, dedup_key=f'metric:{name}')
+
+
+def log_action(component, action, status, message, details=None):
+    """Запись IntegrationLog через outbox"""
+    publish('log', {
+        'component': component,
+        'action': action,
+        'status': status,
+        'message': message,
+        'details': details or {},
+    })
+
+
+def metric_value(spec):
+    model = apps.get_model(spec['model'])
+    aggregate = Sum(spec['field']) if spec['field'] else Count('pk')
+    return model.objects.aggregate(value=aggregate)['value'] or 0
+
+
+def clear_missing_users(messages):
+    """
+    Пользователь мог быть удален, пока сообщение ждало доставки: ссылка на
+    него обнуляется, как при on_delete=SET_NULL.
+    """
+    user_ids = {message.payload.get('user_id') for message in messages} - {None}
+    if not user_ids:
+        return
+    existing = set(get_user_model().objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    for message in messages:
+        if message.payload.get('user_id') is not None and message.payload['user_id'] not in existing:
+            message.payload['user_id'] = None
+
+
+def write_messages(messages):
+    """
+    Запись событий и логов сообщений.
+
+    Возвращает метрики из сообщений и метрики-итоги по записанным строкам.
+    Внешние ключи проверяются сразу, а не при фиксации транзакции, чтобы
+    ошибка откатывала только точку сохранения.
+    """
+    events = [SystemEvent(**message.payload) for message in messages if message.kind == 'event']
+    logs = [IntegrationLog(**message.payload) for message in messages if message.kind == 'log']
+    metrics = {message.payload['name']: message.payload for message in messages if message.kind == 'metric'}
+    SystemEvent.objects.bulk_create(events)
+    IntegrationLog.objects.bulk_create(logs)
+    connection.check_constraints(table_names=[SystemEvent._meta.db_table, IntegrationLog._meta.db_table])
+
+    totals = {}
+    if events:
+        totals[SYSTEM_EVENTS_METRIC['name']] = SYSTEM_EVENTS_METRIC
+    if logs:
+        totals[INTEGRATION_LOGS_METRIC['name']] = INTEGRATION_LOGS_METRIC
+    return metrics, totals
+
+
+def write_metrics(metrics):
+    """Пересчет метрик и запись их значений"""
+    metric_rows = [
+        SystemMetric(
+            metric_type=spec['metric_type'],
+            name=spec['name'],
+            value=float(metric_value(spec)),
+            unit=spec['unit']
+        )
+        for spec in metrics.values()
+    ]
+    SystemMetric.objects.bulk_create(metric_rows)
+    # Каждая записанная метрика логируется, как при синхронной записи
+    IntegrationLog.objects.bulk_create([
+        IntegrationLog(
+            component='metrics',
+            action='metric_created',
+            status='success',
+            message=f'Создана метрика: {metric.name} = {metric.value} {metric.unit or ""}',
+            details={
+                'metric_type': metric.metric_type,
+                'name': metric.name,
+                'value': metric.value,
+                'unit': metric.unit,
+            }
+        )
+        for metric in metric_rows
+    ])
+
+
+def deliver_each(messages):
+    """
+    Доставка сообщений по одному, каждое в своей точке сохранения.
+
+    Возвращает недоставленные сообщения с ошибками; метрики-итоги
+    пересчитываются один раз для всех доставленных.
+    """
+    failed = []
+    all_totals = {}
+    for message in messages:
+        try:
+            with transaction.atomic():
+                metrics, totals = write_messages([message])
+                write_metrics(metrics)
+        except Exception as e:
+            failed.append((message, e))
+        else:
+            all_totals.update(totals)
+    write_metrics(all_totals)
+    return failed
+
+
+def deliver_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Доставка одной пачки сообщений outbox.
+
+    Строки пишутся через bulk_create (без сигналов, поэтому доставка не
+    порождает новых сообщений), а доставленные сообщения удаляются в той же
+    транзакции. Если воркер упадет, транзакция откатится и пачка будет
+    доставлена повторно, дублей при этом не появится. Заблокированные
+    сообщения пропускаются (skip_locked), так что несколько воркеров
+    разбирают очередь параллельно.
+
+    Если пачка не записывается целиком, сообщения доставляются по одному,
+    а сообщение с ошибкой откладывается (failed_at) и не блокирует очередь.
+    Возвращает количество выбранных сообщений.
+    """
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(failed_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not messages:
+            return 0
+
+        clear_missing_users(messages)
+        failed = []
+        try:
+            with transaction.atomic():
+                metrics, totals = write_messages(messages)
+                write_metrics({**totals, **metrics})
+        except Exception:
+            failed = deliver_each(messages)
+
+        now = timezone.now()
+        for message, error in failed:
+            # dedup_key снимается, чтобы не блокировать новые сообщения с тем же ключом
+            OutboxMessage.objects.filter(pk=message.pk).update(
+                failed_at=now, error=f'{type(error).__name__}: {error}', dedup_key=None
+            )
+        failed_ids = {message.pk for message, error in failed}
+        OutboxMessage.objects.filter(
+            id__in=[message.id for message in messages if message.id not in failed_ids]
+        ).delete()
+    if failed:
+        logger.error(f'Отложены сообщения outbox с ошибкой доставки: {sorted(failed_ids)}')
+    return len(messages)
+
+
+def drain_outbox(batch_size=OUTBOX_BATCH_SIZE, max_batches=None):
+    """Доставка пачек, пока outbox не опустеет; возвращает количество сообщений"""
+    delivered = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        count = deliver_batch(batch_size)
+        delivered += count
+        batches += 1
+        if count < batch_size:
+            break
+    return delivered
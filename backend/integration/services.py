@@ -10,6 +10,7 @@ from .models import (
     SystemMetric, SystemEvent, IntegrationConfig, DataSync,
     CacheEntry, HealthCheck, SystemAlert, IntegrationLog
 )
+from . import timeseries
 
 logger = logging.getLogger(__name__)
 
@@ -35,13 +36,19 @@ class MetricsService:
     
     @staticmethod
     def get_metrics(metric_type=None, hours=24):
-        """Получить метрики за период"""
-        queryset = SystemMetric.objects.filter(
-            timestamp__gte=timezone.now() - timedelta(hours=hours)
-        )
-        if metric_type:
-            queryset = queryset.filter(metric_type=metric_type)
-        return queryset.order_by('-timestamp')
+        """
+        Получить метрики за период: (разрешение, точки).
+
+        Сырые замеры хранятся RAW_RETENTION, поэтому окно читается в
+        разрешении, которое еще хранится для его начала.
+        """
+        now = timezone.now()
+        return timeseries.get_series(now - timedelta(hours=hours), now, metric_type=metric_type)
+    
+    @staticmethod
+    def get_series(start, end, metric_type=None, name=None):
+        """Ряд метрик за окно в разрешении, подобранном по длине окна"""
+        return timeseries.get_series(start, end, metric_type=metric_type, name=name)
     
     @staticmethod
     def get_performance_metrics():
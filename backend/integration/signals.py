@@ -4,7 +4,12 @@ from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.utils import timezone
 from .models import SystemEvent, SystemMetric, IntegrationLog
-from .services import EventService, MetricsService, IntegrationLogService
+from . import outbox
+
+# События, метрики и логи пишутся в outbox в транзакции изменения данных,
+# а в SystemEvent/SystemMetric/IntegrationLog их переносит задача
+# integration.tasks.deliver_outbox. Пересчет метрики-итога выполняется
+# при доставке, а не в каждом сохранении.
 
 
 # Сигналы для пользователей
@@ -12,7 +17,7 @@ from .services import EventService, MetricsService, IntegrationLogService
 def user_created_updated(sender, instance, created, **kwargs):
     """Событие при создании/обновлении пользователя"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='data_created',
             description=f'Создан новый пользователь: {instance.username}',
             user=instance,
@@ -20,14 +25,14 @@ def user_created_updated(sender, instance, created, **kwargs):
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='users',
             name='total_users',
-            value=get_user_model().objects.count(),
+            model=get_user_model(),
             unit='users'
         )
     else:
-        EventService.record_event(
+        outbox.record_event(
             event_type='data_updated',
             description=f'Обновлен пользователь: {instance.username}',
             user=instance,
@@ -38,7 +43,7 @@ def user_created_updated(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=get_user_model())
 def user_deleted(sender, instance, **kwargs):
     """Событие при удалении пользователя"""
-    EventService.record_event(
+    outbox.record_event(
         event_type='data_deleted',
         description=f'Удален пользователь: {instance.username}',
         severity='medium'
@@ -50,7 +55,7 @@ def user_deleted(sender, instance, **kwargs):
 def project_created_updated(sender, instance, created, **kwargs):
     """Событие при создании/обновлении проекта"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='erp_action',
             description=f'Создан новый проект: {instance.name}',
             user=getattr(instance, 'created_by', None),
@@ -58,14 +63,14 @@ def project_created_updated(sender, instance, created, **kwargs):
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='erp',
             name='total_projects',
-            value=sender.objects.count(),
+            model=sender,
             unit='projects'
         )
     else:
-        EventService.record_event(
+        outbox.record_event(
             event_type='erp_action',
             description=f'Обновлен проект: {instance.name}',
             user=getattr(instance, 'updated_by', None),
@@ -77,7 +82,7 @@ def project_created_updated(sender, instance, created, **kwargs):
 def task_created_updated(sender, instance, created, **kwargs):
     """Событие при создании/обновлении задачи"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='erp_action',
             description=f'Создана новая задача: {instance.title}',
             user=getattr(instance, 'assigned_to', None),
@@ -85,14 +90,14 @@ def task_created_updated(sender, instance, created, **kwargs):
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='erp',
             name='total_tasks',
-            value=sender.objects.count(),
+            model=sender,
             unit='tasks'
         )
     else:
-        EventService.record_event(
+        outbox.record_event(
             event_type='erp_action',
             description=f'Обновлена задача: {instance.title}',
             user=getattr(instance, 'updated_by', None),
@@ -104,28 +109,28 @@ def task_created_updated(sender, instance, created, **kwargs):
 def sale_created_updated(sender, instance, created, **kwargs):
     """Событие при создании/обновлении продажи"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='erp_action',
-            description=f'Создана новая продажа: {instance.customer_name} - {instance.amount}',
+            description=f'Создана новая продажа: {instance.customer} - {instance.sale_price}',
             user=getattr(instance, 'created_by', None),
             severity='high'
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='erp',
             name='total_sales',
-            value=sender.objects.count(),
+            model=sender,
             unit='sales'
         )
         
         # Метрика по сумме продаж
-        total_amount = sender.objects.aggregate(total=models.Sum('amount'))['total'] or 0
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='erp',
             name='total_sales_amount',
-            value=total_amount,
-            unit='currency'
+            model=sender,
+            unit='currency',
+            field='sale_price'
         )
 
 
@@ -134,17 +139,17 @@ def sale_created_updated(sender, instance, created, **kwargs):
 def telegram_user_created_updated(sender, instance, created, **kwargs):
     """Событие при создании/обновлении пользователя Telegram"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='telegram_command',
             description=f'Новый пользователь Telegram: {instance.username}',
             severity='low'
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='telegram',
             name='total_telegram_users',
-            value=sender.objects.count(),
+            model=sender,
             unit='users'
         )
 
@@ -153,17 +158,17 @@ def telegram_user_created_updated(sender, instance, created, **kwargs):
 def telegram_message_created(sender, instance, created, **kwargs):
     """Событие при создании сообщения Telegram"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='telegram_command',
-            description=f'Новое сообщение Telegram от {instance.user.username}',
+            description=f'Новое сообщение Telegram от {instance.from_user.username}',
             severity='low'
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='telegram',
             name='total_telegram_messages',
-            value=sender.objects.count(),
+            model=sender,
             unit='messages'
         )
 
@@ -173,7 +178,7 @@ def telegram_message_created(sender, instance, created, **kwargs):
 # def admin_action_created(sender, instance, created, **kwargs):
 #     """Событие при создании действия админки"""
 #     if created:
-#         EventService.record_event(
+#         outbox.record_event(
 #             event_type='admin_action',
 #             description=f'Действие админки: {instance.action_type} - {instance.description}',
 #             user=instance.user,
@@ -194,7 +199,7 @@ def telegram_message_created(sender, instance, created, **kwargs):
 def notification_created(sender, instance, created, **kwargs):
     """Событие при создании уведомления"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='notification_sent',
             description=f'Отправлено уведомление: {instance.title}',
             user=instance.user,
@@ -202,10 +207,10 @@ def notification_created(sender, instance, created, **kwargs):
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='notifications',
             name='total_notifications',
-            value=sender.objects.count(),
+            model=sender,
             unit='notifications'
         )
 
@@ -216,10 +221,10 @@ def system_event_created(sender, instance, created, **kwargs):
     """Событие при создании системного события"""
     if created:
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='events',
             name='total_system_events',
-            value=sender.objects.count(),
+            model=sender,
             unit='events'
         )
 
@@ -229,17 +234,17 @@ def system_event_created(sender, instance, created, **kwargs):
 def system_alert_created(sender, instance, created, **kwargs):
     """Событие при создании системного алерта"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='error_occurred',
             description=f'Создан алерт: {instance.title}',
             severity=instance.severity
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='alerts',
             name='total_system_alerts',
-            value=sender.objects.count(),
+            model=sender,
             unit='alerts'
         )
 
@@ -250,10 +255,10 @@ def integration_log_created(sender, instance, created, **kwargs):
     """Событие при создании лога интеграции"""
     if created:
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='logs',
             name='total_integration_logs',
-            value=sender.objects.count(),
+            model=sender,
             unit='logs'
         )
 
@@ -264,7 +269,7 @@ def system_metric_created(sender, instance, created, **kwargs):
     """Событие при создании системной метрики"""
     if created:
         # Логировать создание метрики
-        IntegrationLogService.log_action(
+        outbox.log_action(
             component='metrics',
             action='metric_created',
             status='success',
@@ -284,13 +289,13 @@ def health_check_created(sender, instance, created, **kwargs):
     """Событие при создании проверки здоровья"""
     if created:
         if instance.status == 'critical':
-            EventService.record_event(
+            outbox.record_event(
                 event_type='error_occurred',
                 description=f'Критическая ошибка здоровья системы: {instance.component} - {instance.error_message}',
                 severity='critical'
             )
         elif instance.status == 'warning':
-            EventService.record_event(
+            outbox.record_event(
                 event_type='error_occurred',
                 description=f'Предупреждение здоровья системы: {instance.component}',
                 severity='high'
@@ -302,13 +307,13 @@ def health_check_created(sender, instance, created, **kwargs):
 def data_sync_updated(sender, instance, **kwargs):
     """Событие при обновлении синхронизации данных"""
     if instance.status == 'failed':
-        EventService.record_event(
+        outbox.record_event(
             event_type='error_occurred',
             description=f'Ошибка синхронизации: {instance.source_component} → {instance.target_component}',
             severity='high'
         )
     elif instance.status == 'completed':
-        EventService.record_event(
+        outbox.record_event(
             event_type='data_updated',
             description=f'Синхронизация завершена: {instance.source_component} → {instance.target_component} ({instance.records_synced} записей)',
             severity='low'
@@ -321,10 +326,10 @@ def cache_entry_created_updated(sender, instance, created, **kwargs):
     """Событие при создании/обновлении записи кэша"""
     if created:
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='cache',
             name='total_cache_entries',
-            value=sender.objects.count(),
+            model=sender,
             unit='entries'
         )
 
@@ -333,10 +338,10 @@ def cache_entry_created_updated(sender, instance, created, **kwargs):
 def cache_entry_deleted(sender, instance, **kwargs):
     """Событие при удалении записи кэша"""
     # Записать метрику
-    MetricsService.record_metric(
+    outbox.refresh_metric(
         metric_type='cache',
         name='total_cache_entries',
-        value=sender.objects.count(),
+        model=sender,
         unit='entries'
     )
 
@@ -345,7 +350,7 @@ def cache_entry_deleted(sender, instance, **kwargs):
 @receiver(post_save, sender='integration.IntegrationConfig')
 def integration_config_updated(sender, instance, **kwargs):
     """Событие при обновлении конфигурации интеграции"""
-    EventService.record_event(
+    outbox.record_event(
         event_type='admin_action',
         description=f'Обновлена конфигурация интеграции: {instance.component}.{instance.key}',
         severity='low'
@@ -357,17 +362,17 @@ def integration_config_updated(sender, instance, **kwargs):
 def car_created_updated(sender, instance, created, **kwargs):
     """Событие при создании/обновлении автомобиля"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='data_created',
-            description=f'Добавлен новый автомобиль: {instance.brand} {instance.model}',
+            description=f'Добавлен новый автомобиль: {instance}',
             severity='medium'
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='cars',
             name='total_cars',
-            value=sender.objects.count(),
+            model=sender,
             unit='cars'
         )
 
@@ -377,17 +382,17 @@ def car_created_updated(sender, instance, created, **kwargs):
 def company_created_updated(sender, instance, created, **kwargs):
     """Событие при создании/обновлении компании"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='data_created',
             description=f'Добавлена новая компания: {instance.name}',
             severity='medium'
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='companies',
             name='total_companies',
-            value=sender.objects.count(),
+            model=sender,
             unit='companies'
         )
 
@@ -397,7 +402,7 @@ def company_created_updated(sender, instance, created, **kwargs):
 # def review_created_updated(sender, instance, created, **kwargs):
 #     """Событие при создании/обновлении отзыва"""
 #     if created:
-#         EventService.record_event(
+#         outbox.record_event(
 #             event_type='data_created',
 #             description=f'Добавлен новый отзыв от {instance.user.username}',
 #             user=instance.user,
@@ -418,7 +423,7 @@ def company_created_updated(sender, instance, created, **kwargs):
 # def news_created_updated(sender, instance, created, **kwargs):
 #     """Событие при создании/обновлении новости"""
 #     if created:
-#         EventService.record_event(
+#         outbox.record_event(
 #             event_type='data_created',
 #             description=f'Опубликована новость: {instance.title}',
 #             severity='medium'
@@ -438,7 +443,7 @@ def company_created_updated(sender, instance, created, **kwargs):
 # def error_log_created(sender, instance, created, **kwargs):
 #     """Событие при создании лога ошибки"""
 #     if created:
-#         EventService.record_event(
+#         outbox.record_event(
 #             event_type='error_occurred',
 #             description=f'Зафиксирована ошибка: {instance.error_type}',
 #             severity='high'
@@ -472,7 +477,7 @@ def company_created_updated(sender, instance, created, **kwargs):
 # def seo_metric_created(sender, instance, created, **kwargs):
 #     """Событие при создании SEO метрики"""
 #     if created:
-#         EventService.record_event(
+#         outbox.record_event(
 #             event_type='data_created',
 #             description=f'Обновлена SEO метрика: {instance.metric_name}',
 #             severity='low'
@@ -484,7 +489,7 @@ def company_created_updated(sender, instance, created, **kwargs):
 # def youtube_video_created_updated(sender, instance, created, **kwargs):
 #     """Событие при создании/обновлении видео YouTube"""
 #     if created:
-#         EventService.record_event(
+#         outbox.record_event(
 #             event_type='data_created',
 #             description=f'Добавлено видео YouTube: {instance.title}',
 #             severity='medium'
@@ -504,17 +509,17 @@ def company_created_updated(sender, instance, created, **kwargs):
 def telegram_notification_created(sender, instance, created, **kwargs):
     """Событие при создании уведомления Telegram"""
     if created:
-        EventService.record_event(
+        outbox.record_event(
             event_type='notification_sent',
             description=f'Отправлено уведомление Telegram: {instance.title}',
             severity='low'
         )
         
         # Записать метрику
-        MetricsService.record_metric(
+        outbox.refresh_metric(
             metric_type='telegram',
             name='total_telegram_notifications',
-            value=sender.objects.count(),
+            model=sender,
             unit='notifications'
         )
 
@@ -524,7 +529,7 @@ def telegram_notification_created(sender, instance, created, **kwargs):
 # def mini_app_session_created(sender, instance, created, **kwargs):
 #     """Событие при создании сессии Mini App"""
 #     if created:
-#         EventService.record_event(
+#         outbox.record_event(
 #             event_type='telegram_command',
 #             description=f'Создана сессия Mini App для пользователя {instance.user.username}',
 #             severity='low'
@@ -0,0 +1,32 @@
+import logging
+from celery import shared_task
+
+from .outbox import drain_outbox
+from .timeseries import rollup_metrics, apply_retention
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def deliver_outbox():
+    """Перенос сообщений outbox в события, метрики и логи интеграции"""
+    delivered = drain_outbox()
+    if delivered:
+        logger.info(f'Доставлено сообщений outbox: {delivered}')
+    return delivered
+
+
+@shared_task(ignore_result=True)
+def rollup_system_metrics():
+    """Понижение разрешения системных метрик: 1m, 1h, 1d"""
+    created = rollup_metrics()
+    logger.info(f'Агрегаты метрик обновлены: {created}')
+    return created
+
+
+@shared_task(ignore_result=True)
+def apply_metric_retention():
+    """Удаление метрик и агрегатов старше срока хранения"""
+    deleted = apply_retention()
+    logger.info(f'Удалено устаревших метрик: {deleted}')
+    return deleted
@@ -0,0 +1,115 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import outbox, timeseries
+from .models import OutboxMessage, SystemEvent, IntegrationLog, SystemMetric, SystemMetricRollup
+from .views import SystemMetricViewSet
+
+User = get_user_model()
+
+
+class OutboxDeliveryTest(TestCase):
+    """Тесты доставки сообщений outbox"""
+
+    def test_deleted_user_does_not_block_batch(self):
+        """Событие удаленного пользователя доставляется без ссылки на него"""
+        user = User.objects.create_user(username='removed', email='removed@example.com', password='testpass123')
+        outbox.record_event(event_type='data_updated', description='До удаления', user=user)
+        user.delete()
+        outbox.record_event(event_type='data_updated', description='Следующее', severity='low')
+
+        outbox.drain_outbox()
+        self.assertFalse(OutboxMessage.objects.exists())
+        event = SystemEvent.objects.get(description='До удаления')
+        self.assertIsNone(event.user_id)
+        self.assertTrue(SystemEvent.objects.filter(description='Следующее').exists())
+
+    def test_broken_message_is_set_aside(self):
+        """Сообщение с ошибкой откладывается, остальные доставляются"""
+        outbox.publish('event', {'event_type': 'data_updated', 'unknown_field': 1})
+        outbox.log_action('outbox', 'test', 'info', 'Следующее сообщение')
+
+        outbox.drain_outbox()
+        outbox.drain_outbox()
+
+        broken = OutboxMessage.objects.get()
+        self.assertIsNotNone(broken.failed_at)
+        self.assertIn('unknown_field', broken.error)
+        self.assertTrue(IntegrationLog.objects.filter(action='test').exists())
+
+
+class MetricRollupTest(TestCase):
+    """Тесты понижения разрешения метрик"""
+
+    def setUp(self):
+        self.now = timezone.localtime().replace(hour=12, minute=30, second=0, microsecond=0)
+
+    def record(self, value, timestamp):
+        # timestamp заполняется при создании, время замера задается отдельно
+        metric = SystemMetric.objects.create(metric_type='performance', name='response_time', value=value)
+        SystemMetric.objects.filter(pk=metric.pk).update(timestamp=timestamp)
+
+    def rollups(self, resolution):
+        return list(
+            SystemMetricRollup.objects.filter(resolution=resolution)
+            .order_by('bucket').values_list('count', 'sum', 'min', 'max')
+        )
+
+    def test_cascade_raw_to_days(self):
+        """Замеры сворачиваются в минуты, минуты - в часы, часы - в дни"""
+        self.record(1, self.now - timedelta(hours=2))
+        self.record(3, self.now - timedelta(hours=2) + timedelta(seconds=10))
+        self.record(5, self.now - timedelta(hours=1))
+
+        timeseries.rollup_metrics(self.now)
+
+        self.assertEqual(self.rollups('1m'), [(2, 4, 1, 3), (1, 5, 5, 5)])
+        self.assertEqual(self.rollups('1h'), [(2, 4, 1, 3), (1, 5, 5, 5)])
+        self.assertEqual(self.rollups('1d'), [(3, 9, 1, 5)])
+
+    def test_overlap_rebuild_picks_up_late_samples(self):
+        """Замер, зафиксированный после построения, попадает в агрегаты без дублей"""
+        self.record(1, self.now - timedelta(minutes=1))
+        timeseries.rollup_metrics(self.now)
+
+        # Транзакция, начатая до построения, зафиксировала замер позже
+        self.record(3, self.now - timedelta(minutes=2))
+        timeseries.rollup_metrics(self.now + timedelta(minutes=1))
+
+        self.assertEqual(self.rollups('1m'), [(1, 3, 3, 3), (1, 1, 1, 1)])
+        self.assertEqual(self.rollups('1h'), [(2, 4, 1, 3)])
+        self.assertEqual(self.rollups('1d'), [(2, 4, 1, 3)])
+
+    def test_choose_resolution(self):
+        """Разрешение подбирается по длине окна и сроку хранения его начала"""
+        now = self.now
+        self.assertIsNone(timeseries.choose_resolution(now - timedelta(minutes=30), now, now))
+        self.assertEqual(timeseries.choose_resolution(now - timedelta(days=1), now, now), '1m')
+        self.assertEqual(
+            timeseries.choose_resolution(now - timedelta(days=2), now - timedelta(days=2, minutes=-30), now), '1m'
+        )
+        self.assertEqual(timeseries.choose_resolution(now - timedelta(days=7), now, now), '1h')
+        self.assertEqual(
+            timeseries.choose_resolution(now - timedelta(days=200), now - timedelta(days=190), now), '1d'
+        )
+
+
+class SystemMetricViewSetTest(TestCase):
+    """Тесты API сырых метрик"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='metrics', email='metrics@example.com', password='testpass123')
+        self.factory = APIRequestFactory()
+
+    def get_list(self, hours):
+        request = self.factory.get('/metrics/', {'hours': hours})
+        force_authenticate(request, user=self.user)
+        return SystemMetricViewSet.as_view({'get': 'list'})(request)
+
+    def test_list_rejects_window_beyond_raw_retention(self):
+        """Окно длиннее срока хранения сырых замеров отклоняется"""
+        self.assertEqual(self.get_list(48).status_code, 400)
+        self.assertEqual(self.get_list(1).status_code, 200)
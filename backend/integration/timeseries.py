@@ -0,0 +1,213 @@
+from collections import namedtuple
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+from django.utils import timezone
+from .models import SystemMetric, SystemMetricRollup, MetricRollupState
+
+# Замеры, записанные незадолго до прошлого построения, перечитываются:
+# транзакции, начатые раньше, могли зафиксироваться уже после него
+ROLLUP_OVERLAP = timedelta(minutes=5)
+BATCH_SIZE = 1000
+# Не больше стольких точек в ответе на запрос ряда
+MAX_POINTS = 1500
+
+# Сырые замеры хранятся недолго и отдаются только для коротких окон
+RAW_RETENTION = timedelta(days=1)
+RAW_MAX_WINDOW = timedelta(hours=1)
+
+# Разрешение: длина интервала, функция усечения времени, срок хранения и
+# источник (None - сырые замеры, иначе агрегаты более мелкого разрешения)
+Resolution = namedtuple('Resolution', 'name step trunc retention source')
+
+RESOLUTIONS = [
+    Resolution('1m', timedelta(minutes=1), TruncMinute, timedelta(days=3), None),
+    Resolution('1h', timedelta(hours=1), TruncHour, timedelta(days=90), '1m'),
+    Resolution('1d', timedelta(days=1), TruncDay, timedelta(days=3 * 365), '1h'),
+]
+RESOLUTIONS_BY_NAME = {resolution.name: resolution for resolution in RESOLUTIONS}
+
+
+def bucket_start(value, resolution):
+    """Начало интервала разрешения, в который попадает value (в локальном времени)"""
+    value = timezone.localtime(value)
+    if resolution.name == '1m':
+        return value.replace(second=0, microsecond=0)
+    if resolution.name == '1h':
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def source_rows(resolution, since):
+    """Строки агрегатов разрешения за интервалы начиная с since, одним GROUP BY"""
+    if resolution.source is None:
+        queryset = SystemMetric.objects.filter(timestamp__gte=since)
+        time_field = 'timestamp'
+        aggregates = {'count': Count('id'), 'sum': Sum('value'), 'min': Min('value'), 'max': Max('value')}
+    else:
+        queryset = SystemMetricRollup.objects.filter(resolution=resolution.source, bucket__gte=since)
+        time_field = 'bucket'
+        aggregates = {'count': Sum('count'), 'sum': Sum('sum'), 'min': Min('min'), 'max': Max('max')}
+    return queryset.annotate(
+        interval=resolution.trunc(time_field)
+    ).values('metric_type', 'name', 'interval').annotate(unit=Max('unit'), **aggregates).order_by()
+
+
+def first_source_time(resolution):
+    if resolution.source is None:
+        return SystemMetric.objects.aggregate(first=Min('timestamp'))['first']
+    return SystemMetricRollup.objects.filter(resolution=resolution.source).aggregate(first=Min('bucket'))['first']
+
+
+def rollup_resolution(resolution, now):
+    """
+    Перестраивает агрегаты разрешения за интервалы, в которые могли
+    попасть новые данные источника. Возвращает количество строк.
+    """
+    MetricRollupState.objects.get_or_create(resolution=resolution.name)
+    with transaction.atomic():
+        state = MetricRollupState.objects.select_for_update().get(resolution=resolution.name)
+        since = state.rolled_until - ROLLUP_OVERLAP if state.rolled_until else first_source_time(resolution)
+        created = 0
+        if since is not None:
+            since = bucket_start(since, resolution)
+            SystemMetricRollup.objects.filter(resolution=resolution.name, bucket__gte=since).delete()
+            batch = []
+            for row in source_rows(resolution, since).iterator(chunk_size=BATCH_SIZE):
+                batch.append(SystemMetricRollup(
+                    resolution=resolution.name,
+                    bucket=row['interval'],
+                    metric_type=row['metric_type'],
+                    name=row['name'],
+                    unit=row['unit'],
+                    count=row['count'],
+                    sum=row['sum'] or 0,
+                    min=row['min'] or 0,
+                    max=row['max'] or 0,
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    SystemMetricRollup.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            SystemMetricRollup.objects.bulk_create(batch)
+            created += len(batch)
+        state.rolled_until = now
+        state.save(update_fields=['rolled_until', 'updated_at'])
+    return created
+
+
+def rollup_metrics(now=None):
+    """
+    Непрерывное понижение разрешения метрик: сырые замеры -> 1m -> 1h -> 1d.
+
+    Каждое разрешение строится из предыдущего и пересчитывает только
+    интервалы после прошлого построения (с перекрытием ROLLUP_OVERLAP),
+    поэтому повторный запуск безопасен. Возвращает {разрешение: строк}.
+    """
+    now = now or timezone.now()
+    return {resolution.name: rollup_resolution(resolution, now) for resolution in RESOLUTIONS}
+
+
+def apply_retention(now=None):
+    """
+    Удаление сырых замеров и агрегатов старше срока хранения.
+
+    Удаляется только хвост старше границы по индексу времени; задача
+    запускается часто, поэтому каждое удаление затрагивает примерно один
+    час данных, а не накопившуюся таблицу. Возвращает {разрешение: строк}.
+    """
+    now = now or timezone.now()
+    deleted = {'raw': SystemMetric.objects.filter(timestamp__lt=now - RAW_RETENTION).delete()[0]}
+    for resolution in RESOLUTIONS:
+        deleted[resolution.name] = SystemMetricRollup.objects.filter(
+            resolution=resolution.name, bucket__lt=now - resolution.retention
+        ).delete()[0]
+    return deleted
+
+
+def choose_resolution(start, end, now=None):
+    """
+    Разрешение для окна [start, end]: None - сырые замеры.
+
+    Берется самое мелкое разрешение, которое еще хранится для начала окна
+    и дает не больше MAX_POINTS точек.
+    """
+    now = now or timezone.now()
+    if end - start <= RAW_MAX_WINDOW and start >= now - RAW_RETENTION:
+        return None
+    for resolution in RESOLUTIONS:
+        if start >= now - resolution.retention and (end - start) / resolution.step <= MAX_POINTS:
+            return resolution.name
+    return RESOLUTIONS[-1].name
+
+
+def filter_metrics(queryset, metric_type=None, name=None):
+    if metric_type:
+        queryset = queryset.filter(metric_type=metric_type)
+    if name:
+        queryset = queryset.filter(name=name)
+    return queryset
+
+
+def get_series(start, end, metric_type=None, name=None, resolution=None):
+    """
+    Ряд метрики за окно в подходящем разрешении.
+
+    Возвращает (разрешение, точки), точка - словарь с metric_type, name,
+    bucket, count, avg, min, max. Для сырых замеров bucket - время замера.
+    """
+    if resolution is None:
+        resolution = choose_resolution(start, end)
+    if resolution is None:
+        samples = filter_metrics(
+            SystemMetric.objects.filter(timestamp__gte=start, timestamp__lte=end), metric_type, name
+        ).order_by('timestamp').values_list('metric_type', 'name', 'timestamp', 'value')
+        return None, [
+            {'metric_type': metric_type, 'name': name, 'bucket': timestamp,
+             'count': 1, 'avg': value, 'min': value, 'max': value}
+            for metric_type, name, timestamp, value in samples
+        ]
+
+    rollups = filter_metrics(
+        SystemMetricRollup.objects.filter(
+            resolution=resolution,
+            bucket__gte=bucket_start(start, RESOLUTIONS_BY_NAME[resolution]),
+            bucket__lte=end
+        ),
+        metric_type, name
+    ).order_by('bucket').values_list('metric_type', 'name', 'bucket', 'count', 'sum', 'min', 'max')
+    return resolution, [
+        {'metric_type': metric_type, 'name': name, 'bucket': bucket,
+         'count': count, 'avg': total / count if count else 0, 'min': minimum, 'max': maximum}
+        for metric_type, name, bucket, count, total, minimum, maximum in rollups
+    ]
+
+
+def summarize(start, end, group_by='metric_type'):
+    """
+    Сводка метрик за окно по группам: count, avg_value, min_value, max_value.
+
+    Считается по агрегатам подходящего разрешения, а не сканированием
+    сырых замеров.
+    """
+    resolution = choose_resolution(start, end)
+    if resolution is None:
+        rows = SystemMetric.objects.filter(timestamp__gte=start, timestamp__lte=end).values(group_by).annotate(
+            count=Count('id'), total=Sum('value'), min_value=Min('value'), max_value=Max('value')
+        )
+    else:
+        rows = SystemMetricRollup.objects.filter(
+            resolution=resolution,
+            bucket__gte=bucket_start(start, RESOLUTIONS_BY_NAME[resolution]),
+            bucket__lte=end
+        ).values(group_by).annotate(
+            count=Sum('count'), total=Sum('sum'), min_value=Min('min'), max_value=Max('max')
+        )
+
+    summary = []
+    for row in rows.order_by(group_by):
+        total = row.pop('total') or 0
+        row['avg_value'] = total / row['count'] if row['count'] else 0
+        summary.append(row)
+    return summary
@@ -23,6 +23,7 @@ from .services import (
     MetricsService, EventService, HealthCheckService, AlertService,
     CacheService, DataSyncService, IntegrationLogService, DashboardService
 )
+from . import timeseries
 
 
 class SystemMetricViewSet(viewsets.ModelViewSet):
@@ -50,6 +51,21 @@ class SystemMetricViewSet(viewsets.ModelViewSet):
         
         return queryset.order_by('-timestamp')
     
+    def list(self, request, *args, **kwargs):
+        # Сырые замеры старше RAW_RETENTION удаляются, длинные окна отдает series
+        try:
+            window = timedelta(hours=int(request.query_params.get('hours', 24)))
+        except ValueError:
+            window = None
+        if window is not None and window > timeseries.RAW_RETENTION:
+            return Response(
+                {'error': 'Сырые замеры хранятся не дольше '
+                          f'{int(timeseries.RAW_RETENTION.total_seconds() // 3600)} ч, '
+                          'для длинных окон используйте series'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().list(request, *args, **kwargs)
+    
     @action(detail=False, methods=['get'])
     def performance(self, request):
         """Получить метрики производительности"""
@@ -60,16 +76,26 @@ class SystemMetricViewSet(viewsets.ModelViewSet):
     def summary(self, request):
         """Получить сводку метрик"""
         hours = int(request.query_params.get('hours', 24))
+        now = timezone.now()
         
-        # Агрегированные метрики
-        summary = SystemMetric.objects.filter(
-            timestamp__gte=timezone.now() - timedelta(hours=hours)
-        ).values('metric_type').annotate(
-            count=Count('id'),
-            avg_value=Avg('value')
-        )
+        # Агрегированные метрики по агрегатам подходящего разрешения
+        summary = timeseries.summarize(now - timedelta(hours=hours), now)
         
         return Response(summary)
+    
+    @action(detail=False, methods=['get'])
+    def series(self, request):
+        """Ряд метрики за окно: разрешение подбирается по длине окна"""
+        hours = int(request.query_params.get('hours', 24))
+        now = timezone.now()
+        resolution, points = MetricsService.get_series(
+            now - timedelta(hours=hours),
+            now,
+            metric_type=request.query_params.get('metric_type'),
+            name=request.query_params.get('name')
+        )
+        
+        return Response({'resolution': resolution or 'raw', 'points': points})
 
 
 class SystemEventViewSet(viewsets.ModelViewSet):
@@ -429,14 +455,8 @@ class DashboardViewSet(viewsets.ViewSet):
         hours = int(request.query_params.get('hours', 24))
         
         # Метрики по типам
-        metrics_by_type = SystemMetric.objects.filter(
-            timestamp__gte=timezone.now() - timedelta(hours=hours)
-        ).values('metric_type').annotate(
-            count=Count('id'),
-            avg_value=Avg('value'),
-            max_value=Avg('value'),
-            min_value=Avg('value')
-        )
+        now = timezone.now()
+        metrics_by_type = timeseries.summarize(now - timedelta(hours=hours), now)
         
         # События по типам
         events_by_type = SystemEvent.objects.filter(
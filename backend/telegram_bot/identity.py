@@ -0,0 +1,194 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from veles_drive.services.redis_client import get_redis_connection_or_none
+from .models import TelegramUser, TelegramChat
+
+logger = logging.getLogger(__name__)
+
+# Кэш процесса (L1) короткий: так изменения из админки и других
+# процессов доходят до воркера не позже чем через минуту
+LOCAL_TIMEOUT = 60
+LOCAL_MAX_SIZE = 10000
+# Кэш Django (L2, Redis) сбрасывается сигналами при изменении строки
+SHARED_TIMEOUT = 24 * 60 * 60
+FLUSH_BATCH_SIZE = 500
+
+# Поля, которые не хранятся в карте и загружаются при обращении
+UNCACHED_FIELDS = ('created_at', 'updated_at')
+
+
+class LocalCache:
+    """Кэш в памяти процесса с вытеснением давно не использованных ключей"""
+
+    def __init__(self, timeout=LOCAL_TIMEOUT, max_size=LOCAL_MAX_SIZE):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return dict(value)
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.timeout, dict(value))
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+
+class IdentityMap:
+    """
+    Карта идентификатора Telegram в строку модели.
+
+    Поиск идет по кэшу процесса (L1), затем по кэшу Django (L2, Redis) и
+    только затем по базе, поэтому активные пользователи и чаты
+    определяются без запросов. Экземпляр модели собирается из кэша через
+    from_db. Изменения редко меняющихся полей профиля сразу попадают в
+    кэш, а в базу записываются пачками задачей flush_identity_updates
+    (без Redis - сразу).
+    """
+
+    def __init__(self, model, lookup, profile_fields):
+        self.model = model
+        self.lookup = lookup
+        self.profile_fields = profile_fields
+        self.fields = [
+            field.attname for field in model._meta.concrete_fields
+            if field.attname not in UNCACHED_FIELDS
+        ]
+        self.key_prefix = f'telegram_bot:identity:{model._meta.model_name}'
+        self.dirty_key = f'{self.key_prefix}:dirty'
+        self.flushing_key = f'{self.key_prefix}:flushing'
+        self.local = LocalCache()
+
+    def cache_key(self, value):
+        return f'{self.key_prefix}:{value}'
+
+    def resolve(self, value, profile, create):
+        """
+        Строка модели для идентификатора value; create() создает ее, если
+        строки нет. Отличающиеся от profile поля профиля обновляются.
+        """
+        fields = self.get(value)
+        if fields is None:
+            instance = self.model.objects.filter(**{self.lookup: value}).first() or create()
+            fields = {name: getattr(instance, name) for name in self.fields}
+            self.store(value, fields)
+
+        changed = {name: new for name, new in profile.items() if fields[name] != new}
+        if changed:
+            fields.update(changed)
+            self.store(value, fields)
+            self.mark_dirty(fields['id'], {name: fields[name] for name in self.profile_fields})
+        return self.build(fields)
+
+    def get(self, value):
+        key = self.cache_key(value)
+        fields = self.local.get(key)
+        if fields is None:
+            fields = cache.get(key)
+            if fields is not None:
+                self.local.set(key, fields)
+        return fields
+
+    def store(self, value, fields):
+        key = self.cache_key(value)
+        self.local.set(key, fields)
+        cache.set(key, fields, SHARED_TIMEOUT)
+
+    def invalidate(self, value):
+        key = self.cache_key(value)
+        self.local.delete(key)
+        cache.delete(key)
+
+    def build(self, fields):
+        """Экземпляр модели без запроса; неуказанные поля загрузятся при обращении"""
+        names = [field.attname for field in self.model._meta.concrete_fields if field.attname in fields]
+        return self.model.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+
+    def mark_dirty(self, pk, profile):
+        redis = get_redis_connection_or_none()
+        if redis is None:
+            self.model.objects.filter(pk=pk).update(updated_at=timezone.now(), **profile)
+            return
+        redis.hset(self.dirty_key, pk, json.dumps(profile))
+
+    def flush(self):
+        """
+        Запись накопленных изменений профилей через bulk_update.
+
+        Изменения переносятся в отдельный ключ переименованием, поэтому
+        новые изменения во время записи не теряются, а если воркер упадет,
+        следующий запуск допишет оставшиеся. Возвращает количество строк.
+        """
+        redis = get_redis_connection_or_none()
+        if redis is None:
+            return 0
+        if not redis.exists(self.flushing_key):
+            if not redis.exists(self.dirty_key):
+                return 0
+            redis.rename(self.dirty_key, self.flushing_key)
+
+        now = timezone.now()
+        rows = [
+            self.model(pk=int(pk), updated_at=now, **json.loads(profile))
+            for pk, profile in redis.hgetall(self.flushing_key).items()
+        ]
+        self.model.objects.bulk_update(
+            rows, list(self.profile_fields) + ['updated_at'], batch_size=FLUSH_BATCH_SIZE
+        )
+        redis.delete(self.flushing_key)
+        return len(rows)
+
+
+user_identities = IdentityMap(
+    TelegramUser, 'telegram_id', ('username', 'first_name', 'last_name', 'language_code')
+)
+chat_identities = IdentityMap(TelegramChat, 'chat_id', ('chat_type', 'title', 'username'))
+
+
+def user_profile(user_data):
+    """Поля профиля TelegramUser из объекта User Telegram"""
+    return {
+        'username': user_data.get('username'),
+        'first_name': user_data.get('first_name'),
+        'last_name': user_data.get('last_name'),
+        'language_code': user_data.get('language_code', 'ru'),
+    }
+
+
+def chat_profile(chat_data):
+    """Поля профиля TelegramChat из объекта Chat Telegram"""
+    return {
+        'chat_type': chat_data['type'],
+        'title': chat_data.get('title'),
+        'username': chat_data.get('username'),
+    }
+
+
+def flush_identity_updates():
+    return {
+        'users': user_identities.flush(),
+        'chats': chat_identities.flush(),
+    }
@@ -0,0 +1,85 @@
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from veles_drive.services.redis_client import get_redis_connection_or_none
+from telegram_bot.models import TelegramUser
+from telegram_bot.states import DatabaseStateBackend, RedisStateBackend, STATE_KEY, DIRTY_KEY
+
+# Идентификаторы пользователей бенчмарка не пересекаются с настоящими
+TELEGRAM_ID_BASE = 9_100_000_000
+
+
+class Command(BaseCommand):
+    help = 'Задержка одного шага диалога для хранилищ состояний Telegram: база и Redis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Количество пользователей')
+        parser.add_argument('--steps', type=int, default=5, help='Шагов диалога на пользователя')
+
+    def handle(self, *args, **options):
+        redis = get_redis_connection_or_none()
+        if redis is None:
+            raise CommandError('Кэш по умолчанию не использует Redis')
+
+        # Пользователи и состояния в базе откатываются
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            backends = [
+                ('база', DatabaseStateBackend()),
+                ('Redis', RedisStateBackend(redis, snapshot=False)),
+                ('Redis со снимками', RedisStateBackend(redis, snapshot=True)),
+            ]
+            try:
+                for name, backend in backends:
+                    latencies = self.run(backend, users, options['steps'])
+                    self.stdout.write(
+                        f'{name}: шаг p50 {statistics.median(latencies) * 1000:.3f} мс, '
+                        f'p99 {self.percentile(latencies, 0.99) * 1000:.3f} мс'
+                    )
+            finally:
+                redis.delete(*[STATE_KEY.format(user.pk) for user in users])
+                redis.srem(DIRTY_KEY, *[user.pk for user in users])
+                transaction.set_rollback(True)
+
+    def create_users(self, count):
+        django_users = get_user_model().objects.bulk_create([
+            get_user_model()(
+                username=f'telegram_benchmark_{index}', email=f'telegram_benchmark_{index}@example.com'
+            )
+            for index in range(count)
+        ])
+        django_users = get_user_model().objects.filter(
+            username__in=[user.username for user in django_users]
+        ).order_by('username')
+        return [
+            TelegramUser.objects.create(user=user, telegram_id=TELEGRAM_ID_BASE + index)
+            for index, user in enumerate(django_users)
+        ]
+
+    def run(self, backend, users, steps):
+        """
+        Шаг диалога - как в handle_text_message: чтение состояния и переход
+        (первый шаг задает состояние, следующие дополняют данные, последний
+        очищает).
+        """
+        latencies = []
+        for step in range(steps):
+            for user in users:
+                started = time.perf_counter()
+                backend.get_state(user)
+                if step == 0:
+                    backend.set_state(user, 'waiting_for_task_title', {'chat_id': user.telegram_id})
+                elif step == steps - 1:
+                    backend.clear_state(user)
+                else:
+                    backend.update_state_data(user, {f'field_{step}': f'Значение {step}'})
+                latencies.append(time.perf_counter() - started)
+        return latencies
+
+    @staticmethod
+    def percentile(values, fraction):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
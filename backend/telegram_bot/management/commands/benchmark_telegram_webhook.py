@@ -0,0 +1,135 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+
+from veles_drive.management.commands.benchmark_telegram_client import StandInTelegramHandler
+from veles_drive.services.redis_client import get_redis_connection_or_none
+from telegram_bot import updates
+from telegram_bot.models import TelegramBotSettings, TelegramUser, TelegramChat
+from telegram_bot.views import webhook_handler
+
+# Идентификаторы чатов бенчмарка не пересекаются с настоящими
+CHAT_ID_BASE = 9_000_000_000
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест webhook Telegram: время ответа webhook_handler и '
+        'устойчивая скорость обработки обновлений воркерами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--updates', type=int, default=2000, help='Количество обновлений')
+        parser.add_argument('--chats', type=int, default=200, help='Количество чатов')
+        parser.add_argument('--workers', type=int, default=4, help='Потоков-обработчиков шардов')
+        parser.add_argument(
+            '--duplicate-every', type=int, default=10,
+            help='Каждое N-е обновление присылается повторно, как при повторе Telegram'
+        )
+
+    def handle(self, *args, **options):
+        redis = get_redis_connection_or_none()
+        if redis is not None:
+            # Шарды заблокированы бенчмарком, поэтому задачи Celery не ставятся,
+            # а очереди разбирают потоки бенчмарка
+            tokens = {}
+            for shard in range(updates.UPDATE_SHARDS):
+                tokens[shard] = updates.acquire_shard(redis, shard)
+                if tokens[shard] is None:
+                    raise CommandError(f'Шард {shard} обрабатывается воркером, запустите тест на свободной очереди')
+            mode = 'очередь Redis'
+        else:
+            mode = 'без Redis: обработка в запросе'
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StandInTelegramHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        settings.TELEGRAM_API_URL = f'http://127.0.0.1:{server.server_address[1]}'
+        bot_settings = None
+        if not TelegramBotSettings.objects.filter(is_active=True).exists():
+            bot_settings = TelegramBotSettings.objects.create(bot_token='123456:benchmark', bot_username='benchmark_bot')
+
+        total = options['updates']
+        self.stdout.write(f'Режим: {mode}, обновлений: {total}, чатов: {options["chats"]}')
+        try:
+            latencies, duplicates = self.post_updates(total, options['chats'], options['duplicate_every'])
+            ack_elapsed = sum(latencies)
+            self.stdout.write(
+                f'Ответ webhook: p50 {statistics.median(latencies) * 1000:.2f} мс, '
+                f'p99 {self.percentile(latencies, 0.99) * 1000:.2f} мс, '
+                f'{len(latencies) / ack_elapsed:.0f} запросов/с, отброшено повторов: {duplicates}'
+            )
+            if redis is not None:
+                started = time.perf_counter()
+                processed = self.process_shards(options['workers'], tokens)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'Обработка: {processed} обновлений за {elapsed:.2f} с '
+                    f'({processed / elapsed:.0f} обновлений/с, потоков: {options["workers"]})'
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
+            self.cleanup(options['chats'], bot_settings)
+
+    def post_updates(self, total, chats, duplicate_every):
+        factory = RequestFactory()
+        update_base = int(time.time()) * 100_000
+        latencies = []
+        duplicates = 0
+        for index in range(total):
+            chat_id = CHAT_ID_BASE + index % chats
+            body = json.dumps({
+                'update_id': update_base + index,
+                'message': {
+                    'message_id': index + 1,
+                    'from': {'id': chat_id, 'first_name': 'Benchmark'},
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'text': f'Сообщение {index}',
+                },
+            })
+            repeats = 2 if duplicate_every and index % duplicate_every == 0 else 1
+            for _ in range(repeats):
+                request = factory.post('/telegram/webhook/', body, content_type='application/json')
+                started = time.perf_counter()
+                response = webhook_handler(request)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(f'Webhook ответил {response.status_code}: {response.content!r}')
+                duplicates += json.loads(response.content)['status'] == 'duplicate'
+        return latencies, duplicates
+
+    def process_shards(self, workers, tokens):
+        shards = list(range(updates.UPDATE_SHARDS))
+
+        def work(worker):
+            processed = 0
+            try:
+                for shard in shards[worker::workers]:
+                    processed += updates.process_shard(shard, tokens[shard], batch_size=10 ** 9)
+            finally:
+                connection.close()
+            return processed
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sum(executor.map(work, range(workers)))
+
+    def cleanup(self, chats, bot_settings):
+        chat_ids = [CHAT_ID_BASE + index for index in range(chats)]
+        TelegramChat.objects.filter(chat_id__in=chat_ids).delete()
+        TelegramUser.objects.filter(telegram_id__in=chat_ids).delete()
+        get_user_model().objects.filter(username__in=[f'telegram_{chat_id}' for chat_id in chat_ids]).delete()
+        if bot_settings is not None:
+            bot_settings.delete()
+
+    @staticmethod
+    def percentile(values, fraction):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
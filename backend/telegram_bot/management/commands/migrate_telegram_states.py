@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from veles_drive.services.redis_client import get_redis_connection_or_none
+from telegram_bot.states import RedisStateBackend, mark_all_states
+
+
+class Command(BaseCommand):
+    help = (
+        'Перенос состояний диалогов Telegram между базой и Redis: при переходе '
+        'на TELEGRAM_STATE_BACKEND=redis, обратно и после потери данных Redis'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--to',
+            choices=['redis', 'database'],
+            default='redis',
+            help='redis - загрузить TelegramUserState в Redis, database - записать состояния из Redis в базу'
+        )
+
+    def handle(self, *args, **options):
+        redis = get_redis_connection_or_none()
+        if redis is None:
+            raise CommandError('Кэш по умолчанию не использует Redis')
+        backend = RedisStateBackend(redis, snapshot=True)
+
+        if options['to'] == 'redis':
+            loaded = backend.load_from_database()
+            self.stdout.write(self.style.SUCCESS(f'Загружено состояний в Redis: {loaded}'))
+        else:
+            marked = mark_all_states(backend)
+            saved = backend.snapshot_states()
+            self.stdout.write(self.style.SUCCESS(
+                f'Состояний в Redis: {marked}, записано в базу: {saved}'
+            ))
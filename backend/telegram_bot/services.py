@@ -1,26 +1,50 @@
-import requests
 import json
 import hashlib
 import hmac
 import time
 from typing import Dict, List, Optional, Any
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+
+from veles_drive.services.telegram_client import get_telegram_client
+from .states import get_state_backend
 from .models import (
     TelegramBotSettings, TelegramUser, TelegramChat, TelegramMessage,
     TelegramNotification, TelegramInlineKeyboard, TelegramUserState, TelegramMiniAppSession
 )
 
 
+BOT_SETTINGS_CACHE_KEY = 'telegram_bot:settings'
+BOT_SETTINGS_CACHE_TIMEOUT = 60 * 60
+
+
+def get_bot_settings():
+    """
+    Активные настройки бота из кэша.
+
+    Кэш сбрасывается при сохранении и удалении TelegramBotSettings
+    (telegram_bot.signals), поэтому сервис не обращается к базе при
+    каждом создании.
+    """
+    bot_settings = cache.get(BOT_SETTINGS_CACHE_KEY)
+    if bot_settings is None:
+        bot_settings = TelegramBotSettings.objects.filter(is_active=True).first()
+        if bot_settings is not None:
+            cache.set(BOT_SETTINGS_CACHE_KEY, bot_settings, BOT_SETTINGS_CACHE_TIMEOUT)
+    return bot_settings
+
+
 class TelegramBotService:
     """Сервис для работы с Telegram Bot API"""
     
     def __init__(self):
-        self.settings = TelegramBotSettings.objects.filter(is_active=True).first()
+        self.settings = get_bot_settings()
         if not self.settings:
             raise ValueError("Telegram bot settings not found or inactive")
         
-        self.base_url = f"https://api.telegram.org/bot{self.settings.bot_token}"
+        # Общий для процесса клиент с пулом keep-alive соединений
+        self.client = get_telegram_client(self.settings.bot_token)
     
     def send_message(self, chat_id: int, text: str, **kwargs) -> Dict:
         """Отправка сообщения"""
@@ -36,7 +60,7 @@ class TelegramBotService:
         if 'reply_to_message_id' in kwargs:
             data['reply_to_message_id'] = kwargs['reply_to_message_id']
         
-        response = requests.post(f"{self.base_url}/sendMessage", data=data)
+        response = self.client.post('sendMessage', data=data)
         return response.json()
     
     def send_photo(self, chat_id: int, photo: str, caption: str = None, **kwargs) -> Dict:
@@ -53,7 +77,7 @@ class TelegramBotService:
         if 'reply_markup' in kwargs:
             data['reply_markup'] = json.dumps(kwargs['reply_markup'])
         
-        response = requests.post(f"{self.base_url}/sendPhoto", data=data)
+        response = self.client.post('sendPhoto', data=data)
         return response.json()
     
     def send_document(self, chat_id: int, document: str, caption: str = None, **kwargs) -> Dict:
@@ -70,7 +94,7 @@ class TelegramBotService:
         if 'reply_markup' in kwargs:
             data['reply_markup'] = json.dumps(kwargs['reply_markup'])
         
-        response = requests.post(f"{self.base_url}/sendDocument", data=data)
+        response = self.client.post('sendDocument', data=data)
         return response.json()
     
     def edit_message(self, chat_id: int, message_id: int, text: str, **kwargs) -> Dict:
@@ -85,7 +109,7 @@ class TelegramBotService:
         if 'reply_markup' in kwargs:
             data['reply_markup'] = json.dumps(kwargs['reply_markup'])
         
-        response = requests.post(f"{self.base_url}/editMessageText", data=data)
+        response = self.client.post('editMessageText', data=data)
         return response.json()
     
     def delete_message(self, chat_id: int, message_id: int) -> Dict:
@@ -95,7 +119,7 @@ class TelegramBotService:
             'message_id': message_id
         }
         
-        response = requests.post(f"{self.base_url}/deleteMessage", data=data)
+        response = self.client.post('deleteMessage', data=data)
         return response.json()
     
     def answer_callback_query(self, callback_query_id: str, text: str = None, **kwargs) -> Dict:
@@ -110,12 +134,12 @@ class TelegramBotService:
         if 'show_alert' in kwargs:
             data['show_alert'] = kwargs['show_alert']
         
-        response = requests.post(f"{self.base_url}/answerCallbackQuery", data=data)
+        response = self.client.post('answerCallbackQuery', data=data)
         return response.json()
     
     def get_me(self) -> Dict:
         """Получение информации о боте"""
-        response = requests.get(f"{self.base_url}/getMe")
+        response = self.client.get('getMe')
         return response.json()
     
     def set_webhook(self, url: str, **kwargs) -> Dict:
@@ -130,17 +154,22 @@ class TelegramBotService:
         if 'max_connections' in kwargs:
             data['max_connections'] = kwargs['max_connections']
         
-        response = requests.post(f"{self.base_url}/setWebhook", data=data)
+        # Секрет проверяется в webhook_handler
+        secret_token = kwargs.get('secret_token', getattr(settings, 'TELEGRAM_WEBHOOK_SECRET', ''))
+        if secret_token:
+            data['secret_token'] = secret_token
+        
+        response = self.client.post('setWebhook', data=data)
         return response.json()
     
     def delete_webhook(self) -> Dict:
         """Удаление webhook"""
-        response = requests.post(f"{self.base_url}/deleteWebhook")
+        response = self.client.post('deleteWebhook')
         return response.json()
     
     def get_webhook_info(self) -> Dict:
         """Получение информации о webhook"""
-        response = requests.get(f"{self.base_url}/getWebhookInfo")
+        response = self.client.get('getWebhookInfo')
         return response.json()
 
 
@@ -406,37 +435,23 @@ class TelegramKeyboardService:
 
 
 class TelegramStateService:
-    """Сервис для работы с состояниями пользователей"""
+    """Сервис для работы с состояниями пользователей (хранилище - telegram_bot.states)"""
     
     @staticmethod
     def set_state(user: TelegramUser, state: str, data: Dict = None) -> TelegramUserState:
         """Установка состояния пользователя"""
-        state_obj, created = TelegramUserState.objects.get_or_create(
-            user=user,
-            defaults={
-                'current_state': state,
-                'state_data': data or {}
-            }
-        )
-        
-        if not created:
-            state_obj.current_state = state
-            state_obj.state_data = data or {}
-            state_obj.save()
-        
-        return state_obj
+        return get_state_backend().set_state(user, state, data)
     
     @staticmethod
     def get_state(user: TelegramUser) -> Optional[TelegramUserState]:
         """Получение состояния пользователя"""
-        return TelegramUserState.objects.filter(user=user).first()
+        return get_state_backend().get_state(user)
     
     @staticmethod
     def clear_state(user: TelegramUser) -> bool:
         """Очистка состояния пользователя"""
         try:
-            TelegramUserState.objects.filter(user=user).delete()
-            return True
+            return get_state_backend().clear_state(user)
         except Exception:
             return False
     
@@ -444,11 +459,6 @@ class TelegramStateService:
     def update_state_data(user: TelegramUser, data: Dict) -> bool:
         """Обновление данных состояния"""
         try:
-            state = TelegramUserState.objects.filter(user=user).first()
-            if state:
-                state.state_data.update(data)
-                state.save()
-                return True
-            return False
+            return get_state_backend().update_state_data(user, data)
         except Exception:
-            return False 
\ No newline at end of file
+            return False
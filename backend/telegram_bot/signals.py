@@ -1,18 +1,38 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.core.cache import cache
 from django.utils import timezone
-from .models import TelegramUser, TelegramNotification
-from .services import TelegramNotificationService
+from .models import TelegramUser, TelegramChat, TelegramNotification, TelegramBotSettings
+from .identity import user_identities, chat_identities
+from .services import TelegramNotificationService, BOT_SETTINGS_CACHE_KEY
+
+
+@receiver([post_save, post_delete], sender=TelegramBotSettings)
+def invalidate_bot_settings(sender, instance, **kwargs):
+    """Сброс кэша настроек бота (get_bot_settings) при их изменении"""
+    cache.delete(BOT_SETTINGS_CACHE_KEY)
+
+
+@receiver([post_save, post_delete], sender=TelegramUser)
+def invalidate_user_identity(sender, instance, **kwargs):
+    """Сброс записи карты идентичностей (telegram_bot.identity) при изменении пользователя"""
+    user_identities.invalidate(instance.telegram_id)
+
+
+@receiver([post_save, post_delete], sender=TelegramChat)
+def invalidate_chat_identity(sender, instance, **kwargs):
+    """Сброс записи карты идентичностей при изменении чата"""
+    chat_identities.invalidate(instance.chat_id)
 
 
 @receiver(post_save, sender='erp.ProjectTask')
 def notify_task_assigned(sender, instance, created, **kwargs):
     """Уведомление о назначении задачи"""
-    if created and instance.assigned_to:
+    if created and instance.assignee_id:
         try:
             # Проверяем, есть ли у пользователя Telegram профиль
             telegram_user = TelegramUser.objects.filter(
-                user=instance.assigned_to,
+                user_id=instance.assignee_id,
                 is_active=True
             ).first()
             
@@ -35,11 +55,13 @@ def notify_task_assigned(sender, instance, created, **kwargs):
 @receiver(post_save, sender='erp.ProjectTask')
 def notify_task_completed(sender, instance, **kwargs):
     """Уведомление о завершении задачи"""
-    if instance.status == 'completed' and instance.assigned_to:
+    # Задача завершена, когда перемещена в колонку "Завершено"
+    moved = 'column' in getattr(instance, 'saved_changes', {})
+    if moved and instance.assignee_id and 'завершено' in instance.column.name.lower():
         try:
             # Проверяем, есть ли у пользователя Telegram профиль
             telegram_user = TelegramUser.objects.filter(
-                user=instance.assigned_to,
+                user_id=instance.assignee_id,
                 is_active=True
             ).first()
             
@@ -49,7 +71,7 @@ def notify_task_completed(sender, instance, **kwargs):
                 task_data = {
                     'title': instance.title,
                     'project': instance.column.board.name if instance.column else 'Без проекта',
-                    'completed_by': instance.assigned_to.username
+                    'completed_by': instance.assignee.username
                 }
                 
                 notification_service.send_task_completed_notification(telegram_user, task_data)
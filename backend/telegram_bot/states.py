@@ -0,0 +1,236 @@
+import json
+import logging
+from datetime import timedelta
+from typing import Dict, Optional
+from django.conf import settings
+from django.utils import timezone
+
+from veles_drive.services.redis_client import get_redis_connection_or_none
+from .models import TelegramUser, TelegramUserState
+
+logger = logging.getLogger(__name__)
+
+# Состояние диалога, которое не менялось столько секунд, истекает
+STATE_TIMEOUT = getattr(settings, 'TELEGRAM_STATE_TIMEOUT', 24 * 60 * 60)
+SNAPSHOT_BATCH_SIZE = 500
+
+STATE_KEY = 'telegram_bot:state:{}'
+DIRTY_KEY = 'telegram_bot:state:dirty'
+SNAPSHOTTING_KEY = 'telegram_bot:state:snapshotting'
+# Поле хэша с именем состояния; ключи данных хранятся в полях data:<ключ>
+STATE_FIELD = 'state'
+DATA_PREFIX = 'data:'
+
+# Слияние данных только для существующего состояния, одной командой
+UPDATE_DATA_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+if #KEYS > 1 then
+    redis.call('SADD', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+
+class DatabaseStateBackend:
+    """Состояния в таблице TelegramUserState"""
+
+    def set_state(self, user: TelegramUser, state: str, data: Dict = None) -> TelegramUserState:
+        state_obj, created = TelegramUserState.objects.update_or_create(
+            user=user,
+            defaults={'current_state': state, 'state_data': data or {}}
+        )
+        return state_obj
+
+    def get_state(self, user: TelegramUser) -> Optional[TelegramUserState]:
+        return TelegramUserState.objects.filter(user=user).first()
+
+    def clear_state(self, user: TelegramUser) -> bool:
+        TelegramUserState.objects.filter(user=user).delete()
+        return True
+
+    def update_state_data(self, user: TelegramUser, data: Dict) -> bool:
+        state = TelegramUserState.objects.filter(user=user).first()
+        if not state:
+            return False
+        state.state_data.update(data)
+        state.save(update_fields=['state_data', 'updated_at'])
+        return True
+
+
+class RedisStateBackend:
+    """
+    Состояния в хэшах Redis с истечением по TTL.
+
+    Каждый ключ данных - отдельное поле хэша, поэтому update_state_data
+    сливает данные атомарно, без чтения состояния. Возвращаются
+    несохраненные экземпляры TelegramUserState.
+
+    С snapshot=True измененные состояния отмечаются и задача
+    snapshot_states копирует их в TelegramUserState пачками: после потери
+    Redis состояния восстанавливаются командой migrate_telegram_states.
+    """
+
+    def __init__(self, redis, timeout=STATE_TIMEOUT, snapshot=True):
+        self.redis = redis
+        self.timeout = timeout
+        self.snapshot = snapshot
+        self._update_data = redis.register_script(UPDATE_DATA_SCRIPT)
+
+    def set_state(self, user: TelegramUser, state: str, data: Dict = None) -> TelegramUserState:
+        self.write(user.pk, state, data or {}, self.timeout, self.snapshot)
+        return TelegramUserState(user=user, current_state=state, state_data=data or {})
+
+    def get_state(self, user: TelegramUser) -> Optional[TelegramUserState]:
+        fields = self.redis.hgetall(STATE_KEY.format(user.pk))
+        if not fields:
+            return None
+        state, data = self.decode(fields)
+        return TelegramUserState(user=user, current_state=state, state_data=data)
+
+    def clear_state(self, user: TelegramUser) -> bool:
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(STATE_KEY.format(user.pk))
+        if self.snapshot:
+            pipe.sadd(DIRTY_KEY, user.pk)
+        pipe.execute()
+        return True
+
+    def update_state_data(self, user: TelegramUser, data: Dict) -> bool:
+        args = [self.timeout, user.pk]
+        for key, value in data.items():
+            args += [DATA_PREFIX + key, json.dumps(value)]
+        keys = [STATE_KEY.format(user.pk)]
+        if self.snapshot:
+            keys.append(DIRTY_KEY)
+        return bool(self._update_data(keys=keys, args=args))
+
+    def write(self, user_pk, state, data, timeout, mark_dirty):
+        """Замена состояния пользователя целиком"""
+        key = STATE_KEY.format(user_pk)
+        mapping = {STATE_FIELD: state}
+        mapping.update({DATA_PREFIX + name: json.dumps(value) for name, value in data.items()})
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, timeout)
+        if mark_dirty:
+            pipe.sadd(DIRTY_KEY, user_pk)
+        pipe.execute()
+
+    @staticmethod
+    def decode(fields):
+        state = None
+        data = {}
+        for name, value in fields.items():
+            name = name.decode()
+            if name == STATE_FIELD:
+                state = value.decode()
+            elif name.startswith(DATA_PREFIX):
+                data[name[len(DATA_PREFIX):]] = json.loads(value)
+        return state, data
+
+    def snapshot_states(self):
+        """
+        Копирование отмеченных состояний в TelegramUserState.
+
+        Существующие состояния записываются через bulk_create с
+        update_conflicts, очищенные удаляются. Истечение по TTL не
+        отмечается, поэтому снимки старше срока жизни удаляются отдельно.
+        Отметки переносятся в отдельный ключ переименованием, как в
+        telegram_bot.identity. Возвращает количество пользователей.
+        """
+        if not self.redis.exists(SNAPSHOTTING_KEY):
+            if not self.redis.exists(DIRTY_KEY):
+                return 0
+            self.redis.rename(DIRTY_KEY, SNAPSHOTTING_KEY)
+
+        user_pks = sorted(int(pk) for pk in self.redis.smembers(SNAPSHOTTING_KEY))
+        for start in range(0, len(user_pks), SNAPSHOT_BATCH_SIZE):
+            batch = user_pks[start:start + SNAPSHOT_BATCH_SIZE]
+            pipe = self.redis.pipeline(transaction=False)
+            for user_pk in batch:
+                pipe.hgetall(STATE_KEY.format(user_pk))
+            states = dict(zip(batch, pipe.execute()))
+
+            # Пользователь мог быть удален, пока состояние ждало записи
+            existing = set(TelegramUser.objects.filter(pk__in=batch).values_list('pk', flat=True))
+            rows = []
+            for user_pk, fields in states.items():
+                if fields and user_pk in existing:
+                    state, data = self.decode(fields)
+                    rows.append(TelegramUserState(user_id=user_pk, current_state=state, state_data=data))
+            TelegramUserState.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['current_state', 'state_data', 'updated_at']
+            )
+            TelegramUserState.objects.filter(
+                user_id__in=[user_pk for user_pk, fields in states.items() if not fields]
+            ).delete()
+        self.redis.delete(SNAPSHOTTING_KEY)
+        TelegramUserState.objects.filter(
+            updated_at__lt=timezone.now() - timedelta(seconds=self.timeout)
+        ).delete()
+        return len(user_pks)
+
+    def load_from_database(self, queryset=None):
+        """
+        Перенос состояний из TelegramUserState в Redis: переход с
+        хранения в базе и восстановление после потери Redis.
+
+        Состояние получает оставшийся срок жизни, истекшие пропускаются.
+        Уже существующие в Redis состояния не перезаписываются.
+        Возвращает количество перенесенных состояний.
+        """
+        now = timezone.now()
+        if queryset is None:
+            queryset = TelegramUserState.objects.all()
+        queryset = queryset.filter(updated_at__gt=now - timedelta(seconds=self.timeout))
+        loaded = 0
+        for state in queryset.iterator(chunk_size=SNAPSHOT_BATCH_SIZE):
+            if self.redis.exists(STATE_KEY.format(state.user_id)):
+                continue
+            remaining = self.timeout - int((now - state.updated_at).total_seconds())
+            # Без отметки: снимок в базе уже совпадает с состоянием
+            self.write(state.user_id, state.current_state, state.state_data, max(remaining, 1), False)
+            loaded += 1
+        return loaded
+
+
+_backend = None
+
+
+def get_state_backend():
+    """
+    Хранилище состояний из настройки TELEGRAM_STATE_BACKEND: 'redis'
+    (по умолчанию) или 'database'. Без Redis используется база.
+    """
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'TELEGRAM_STATE_BACKEND', 'redis')
+        redis = get_redis_connection_or_none() if name == 'redis' else None
+        if redis is not None:
+            _backend = RedisStateBackend(redis, snapshot=getattr(settings, 'TELEGRAM_STATE_SNAPSHOT', True))
+        else:
+            _backend = DatabaseStateBackend()
+    return _backend
+
+
+def mark_all_states(backend):
+    """Отметка всех состояний в Redis для снимка (переход на хранение в базе)"""
+    marked = 0
+    pipe = backend.redis.pipeline(transaction=False)
+    for key in backend.redis.scan_iter(match=STATE_KEY.format('*'), count=SNAPSHOT_BATCH_SIZE):
+        user_pk = key.decode().rsplit(':', 1)[1]
+        if user_pk.isdigit():
+            pipe.sadd(DIRTY_KEY, user_pk)
+            marked += 1
+    pipe.execute()
+    return marked
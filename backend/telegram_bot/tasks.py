@@ -0,0 +1,45 @@
+import logging
+from celery import shared_task
+
+from .identity import flush_identity_updates as flush_identities
+from .states import get_state_backend
+from .updates import process_shard, schedule_pending_updates as schedule_pending
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def process_update_shard(shard, token):
+    """Обработка очереди обновлений Telegram одного шарда держателем блокировки token"""
+    processed = process_shard(shard, token)
+    logger.debug(f'Шард {shard}: обработано обновлений {processed}')
+    return processed
+
+
+@shared_task(ignore_result=True)
+def schedule_pending_updates():
+    """Запуск обработки шардов, оставшихся без воркера (например, после его падения)"""
+    scheduled = schedule_pending()
+    if scheduled:
+        logger.warning(f'Перезапущена обработка шардов обновлений: {scheduled}')
+    return scheduled
+
+
+@shared_task(ignore_result=True)
+def flush_identity_updates():
+    """Запись в базу изменений профилей пользователей и чатов Telegram"""
+    flushed = flush_identities()
+    logger.info(f'Записаны изменения профилей Telegram: {flushed}')
+    return flushed
+
+
+@shared_task(ignore_result=True)
+def snapshot_states():
+    """Копирование измененных состояний диалогов из Redis в базу"""
+    backend = get_state_backend()
+    if not getattr(backend, 'snapshot', False):
+        return 0
+    saved = backend.snapshot_states()
+    if saved:
+        logger.info(f'Сохранено состояний диалогов: {saved}')
+    return saved
@@ -0,0 +1,226 @@
+import json
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from veles_drive.services.redis_client import get_redis_connection_or_none
+from . import states, updates
+from .identity import user_identities, user_profile
+from .models import TelegramUser, TelegramUserState
+from .services import TelegramStateService
+
+User = get_user_model()
+
+
+def make_update(update_id, chat_id=42):
+    return {'update_id': update_id, 'message': {'chat': {'id': chat_id}, 'text': f'сообщение {update_id}'}}
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class EnqueueWithoutRedisTest(TestCase):
+    """Тесты приема обновлений без Redis (locmem-кэш)"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_update_is_processed_inline(self):
+        """Без Redis обновление обрабатывается сразу"""
+        with mock.patch('telegram_bot.views.dispatch_update') as dispatch_update:
+            self.assertTrue(updates.enqueue_update(make_update(1)))
+        dispatch_update.assert_called_once_with(make_update(1))
+
+    def test_duplicate_update_id_is_skipped(self):
+        """Повторно присланный update_id не обрабатывается второй раз"""
+        with mock.patch('telegram_bot.views.dispatch_update') as dispatch_update:
+            self.assertTrue(updates.enqueue_update(make_update(2)))
+            self.assertFalse(updates.enqueue_update(make_update(2)))
+        self.assertEqual(dispatch_update.call_count, 1)
+
+    def test_processing_error_does_not_propagate(self):
+        """Ошибка обработки логируется, обновление считается принятым"""
+        with mock.patch('telegram_bot.views.dispatch_update', side_effect=ValueError('ошибка')):
+            with self.assertLogs('telegram_bot.updates', level='ERROR'):
+                self.assertTrue(updates.enqueue_update(make_update(3)))
+
+
+@skipUnless(get_redis_connection_or_none(), 'Очередь шардов требует django-redis')
+class ShardQueueTest(TestCase):
+    """Тесты очереди обновлений шарда в Redis"""
+
+    shard = 0
+
+    def setUp(self):
+        self.redis = get_redis_connection_or_none()
+        self.keys = [
+            updates.QUEUE_KEY.format(self.shard),
+            updates.LOCK_KEY.format(self.shard),
+            updates.PROCESSING_KEY.format(self.shard),
+            updates.DELIVERIES_KEY.format(self.shard),
+            updates.DEAD_LETTER_KEY,
+        ]
+        self.redis.delete(*self.keys)
+        self.addCleanup(self.redis.delete, *self.keys)
+
+    def push(self, *update_ids):
+        for update_id in update_ids:
+            self.redis.rpush(updates.QUEUE_KEY.format(self.shard), json.dumps(make_update(update_id, chat_id=16)))
+
+    def process(self, token):
+        with mock.patch('telegram_bot.views.dispatch_update') as dispatch_update:
+            processed = updates.process_shard(self.shard, token)
+        return processed, [call.args[0]['update_id'] for call in dispatch_update.call_args_list]
+
+    def test_updates_are_processed_in_order(self):
+        """Обновления шарда обрабатываются по порядку, блокировка снимается"""
+        self.push(1, 2, 3)
+        token = updates.acquire_shard(self.redis, self.shard)
+
+        self.assertEqual(self.process(token), (3, [1, 2, 3]))
+        self.assertEqual(self.redis.llen(updates.QUEUE_KEY.format(self.shard)), 0)
+        self.assertEqual(self.redis.llen(updates.PROCESSING_KEY.format(self.shard)), 0)
+        self.assertFalse(self.redis.exists(updates.LOCK_KEY.format(self.shard)))
+        self.assertFalse(self.redis.exists(updates.DELIVERIES_KEY.format(self.shard)))
+
+    def test_foreign_lock_stops_before_first_update(self):
+        """Задача с чужим токеном ничего не обрабатывает"""
+        self.push(1)
+        updates.acquire_shard(self.redis, self.shard)
+
+        self.assertEqual(self.process('stale-token'), (0, []))
+        self.assertEqual(self.redis.llen(updates.QUEUE_KEY.format(self.shard)), 1)
+
+    def test_expired_lock_is_taken_again(self):
+        """Продолжение, дождавшееся в брокере истечения блокировки, берет ее заново"""
+        self.push(1)
+
+        self.assertEqual(self.process('continuation-token'), (1, [1]))
+
+    def test_update_left_by_crashed_worker_is_processed_first(self):
+        """Обновление в обработке от упавшего воркера обрабатывается раньше очереди"""
+        self.redis.rpush(updates.PROCESSING_KEY.format(self.shard), json.dumps(make_update(1, chat_id=16)))
+        self.push(2)
+        token = updates.acquire_shard(self.redis, self.shard)
+
+        self.assertEqual(self.process(token), (2, [1, 2]))
+
+    def test_repeatedly_crashing_update_is_dead_lettered(self):
+        """Обновление, на котором воркер падал MAX_DELIVERIES раз, уходит в список необработанных"""
+        self.redis.rpush(updates.PROCESSING_KEY.format(self.shard), json.dumps(make_update(1, chat_id=16)))
+        self.redis.hset(updates.DELIVERIES_KEY.format(self.shard), 1, updates.MAX_DELIVERIES)
+        self.push(2)
+        token = updates.acquire_shard(self.redis, self.shard)
+
+        with self.assertLogs('telegram_bot.updates', level='ERROR'):
+            self.assertEqual(self.process(token), (1, [2]))
+        dead = [json.loads(raw)['update_id'] for raw in self.redis.lrange(updates.DEAD_LETTER_KEY, 0, -1)]
+        self.assertEqual(dead, [1])
+        self.assertEqual(self.redis.llen(updates.PROCESSING_KEY.format(self.shard)), 0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class IdentityMapTest(TestCase):
+    """Тесты карты идентификаторов Telegram (locmem-кэш, без Redis)"""
+
+    telegram_id = 1001
+
+    def setUp(self):
+        cache.clear()
+        user_identities.local.items.clear()
+        self.user = User.objects.create_user(username='telegram', email='telegram@example.com', password='testpass123')
+
+    def resolve(self, **user_data):
+        profile = user_profile({'username': 'ivan', 'first_name': 'Иван', **user_data})
+        return user_identities.resolve(
+            self.telegram_id, profile,
+            lambda: TelegramUser.objects.create(user=self.user, telegram_id=self.telegram_id, **profile)
+        )
+
+    def test_resolve_creates_and_caches(self):
+        """Первое обращение создает строку, следующие обходятся без запросов"""
+        created = self.resolve()
+        self.assertEqual(TelegramUser.objects.get(telegram_id=self.telegram_id).pk, created.pk)
+
+        with self.assertNumQueries(0):
+            cached = self.resolve()
+        self.assertEqual((cached.pk, cached.username), (created.pk, 'ivan'))
+
+    def test_profile_change_is_written_directly(self):
+        """Без Redis изменение профиля сразу записывается в базу и в кэш"""
+        self.resolve()
+
+        changed = self.resolve(username='ivan_new')
+        self.assertEqual(changed.username, 'ivan_new')
+        self.assertEqual(TelegramUser.objects.get(telegram_id=self.telegram_id).username, 'ivan_new')
+        self.assertEqual(user_identities.get(self.telegram_id)['username'], 'ivan_new')
+
+    def test_save_invalidates_cached_identity(self):
+        """Сохранение пользователя (например, в админке) сбрасывает запись карты"""
+        self.resolve()
+        self.assertIsNotNone(user_identities.get(self.telegram_id))
+
+        telegram_user = TelegramUser.objects.get(telegram_id=self.telegram_id)
+        telegram_user.is_active = False
+        telegram_user.save()
+
+        self.assertIsNone(user_identities.get(self.telegram_id))
+        self.assertFalse(self.resolve().is_active)
+
+
+class DatabaseStateBackendTest(TestCase):
+    """Тесты хранения состояний диалога в базе"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='state', email='state@example.com', password='testpass123')
+        self.telegram_user = TelegramUser.objects.create(user=user, telegram_id=2002)
+        self.backend = states.DatabaseStateBackend()
+
+    def test_state_lifecycle(self):
+        """Состояние устанавливается, дополняется данными и очищается"""
+        self.assertFalse(self.backend.update_state_data(self.telegram_user, {'step': 1}))
+
+        self.backend.set_state(self.telegram_user, 'search', {'brand': 'Toyota'})
+        self.assertTrue(self.backend.update_state_data(self.telegram_user, {'step': 2}))
+        state = self.backend.get_state(self.telegram_user)
+        self.assertEqual(state.current_state, 'search')
+        self.assertEqual(state.state_data, {'brand': 'Toyota', 'step': 2})
+
+        self.backend.set_state(self.telegram_user, 'menu')
+        self.assertEqual(TelegramUserState.objects.get(user=self.telegram_user).state_data, {})
+
+        self.assertTrue(self.backend.clear_state(self.telegram_user))
+        self.assertIsNone(self.backend.get_state(self.telegram_user))
+
+
+@override_settings(TELEGRAM_STATE_BACKEND='database')
+class TelegramStateServiceTest(TestCase):
+    """Тесты делегирования TelegramStateService хранилищу состояний"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='service', email='service@example.com', password='testpass123')
+        self.telegram_user = TelegramUser.objects.create(user=user, telegram_id=3003)
+        # Хранилище выбирается один раз на процесс
+        patcher = mock.patch.object(states, '_backend', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_service_uses_configured_backend(self):
+        """Вызовы сервиса доходят до хранилища из TELEGRAM_STATE_BACKEND"""
+        TelegramStateService.set_state(self.telegram_user, 'search', {'brand': 'Toyota'})
+        self.assertIsInstance(states.get_state_backend(), states.DatabaseStateBackend)
+        self.assertTrue(TelegramStateService.update_state_data(self.telegram_user, {'step': 2}))
+        self.assertEqual(
+            TelegramStateService.get_state(self.telegram_user).state_data, {'brand': 'Toyota', 'step': 2}
+        )
+
+        self.assertTrue(TelegramStateService.clear_state(self.telegram_user))
+        self.assertFalse(TelegramUserState.objects.filter(user=self.telegram_user).exists())
+
+    def test_backend_errors_are_reported_as_false(self):
+        """Ошибка хранилища при изменении состояния возвращается как False"""
+        backend = mock.Mock()
+        backend.clear_state.side_effect = ConnectionError
+        backend.update_state_data.side_effect = ConnectionError
+        with mock.patch('telegram_bot.services.get_state_backend', return_value=backend):
+            self.assertFalse(TelegramStateService.clear_state(self.telegram_user))
+            self.assertFalse(TelegramStateService.update_state_data(self.telegram_user, {'step': 1}))
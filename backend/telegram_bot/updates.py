@@ -0,0 +1,230 @@
+import json
+import logging
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+from veles_drive.services.redis_client import get_redis_connection_or_none
+
+logger = logging.getLogger(__name__)
+
+PROCESS_SHARD_TASK_NAME = 'telegram_bot.tasks.process_update_shard'
+
+# Обновления одного чата всегда попадают в один шард, а шард в каждый
+# момент обрабатывает один воркер, поэтому порядок внутри чата сохраняется
+UPDATE_SHARDS = getattr(settings, 'TELEGRAM_UPDATE_SHARDS', 16)
+# Telegram повторяет неподтвержденные обновления не дольше суток
+DEDUP_TIMEOUT = 24 * 60 * 60
+# Блокировка шарда хранит токен владельца и продлевается после каждого
+# обновления; если воркер упал, она истекает и шард подхватывает
+# schedule_pending_updates
+SHARD_LOCK_TIMEOUT = 60
+# Столько обновлений обрабатывает одна задача, затем ставит продолжение,
+# чтобы длинная очередь одного шарда не занимала воркер бесконечно
+SHARD_BATCH_SIZE = 500
+# Обновление, на котором воркер падал столько раз, уходит в DEAD_LETTER_KEY,
+# чтобы не блокировать очередь шарда
+MAX_DELIVERIES = 3
+
+DEDUP_KEY = 'telegram_bot:update:{}'
+QUEUE_KEY = 'telegram_bot:updates:{}'
+LOCK_KEY = 'telegram_bot:updates:{}:lock'
+# Обновление в обработке: переносится сюда из очереди через LMOVE и
+# удаляется после обработки; после падения воркера обрабатывается заново
+PROCESSING_KEY = 'telegram_bot:updates:{}:processing'
+# Количество выдач обновлений в обработку по update_id
+DELIVERIES_KEY = 'telegram_bot:updates:{}:deliveries'
+DEAD_LETTER_KEY = 'telegram_bot:updates:dead'
+
+# Выдача следующего обновления держателю блокировки: сначала оставшееся в
+# обработке от упавшего воркера, затем из очереди. Истекшая блокировка
+# (задача долго ждала в брокере) берется заново, если ее никто не занял.
+# Возвращает {0} - блокировка чужая, {1} - очередь пуста, {1, обновление}
+CLAIM_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if not owner then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+elseif owner ~= ARGV[1] then
+    return {0}
+else
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+local raw = redis.call('LINDEX', KEYS[2], 0)
+if not raw then
+    raw = redis.call('LMOVE', KEYS[3], KEYS[2], 'LEFT', 'RIGHT')
+end
+if not raw then
+    return {1}
+end
+return {1, raw}
+"""
+
+# Подтверждение обработанного обновления и продление блокировки, только
+# если блокировка все еще принадлежит этому воркеру; с KEYS[4] обновление
+# переносится в список необработанных
+ACK_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+local raw = redis.call('LPOP', KEYS[2])
+redis.call('HDEL', KEYS[3], ARGV[3])
+if #KEYS > 3 and raw then
+    redis.call('RPUSH', KEYS[4], raw)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def update_chat_id(update):
+    """Чат, к которому относится обновление (для callback query - чат сообщения)"""
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if key in update:
+            return update[key]['chat']['id']
+    callback_query = update.get('callback_query')
+    if callback_query:
+        if 'message' in callback_query:
+            return callback_query['message']['chat']['id']
+        return callback_query['from']['id']
+    return update['update_id']
+
+
+def shard_for(update):
+    return update_chat_id(update) % UPDATE_SHARDS
+
+
+def enqueue_update(update):
+    """
+    Постановка обновления в очередь шарда его чата.
+
+    Возвращает False для повторно присланного update_id. Без Redis
+    (например, locmem-кэш при разработке) обновление обрабатывается сразу.
+    """
+    dedup_key = DEDUP_KEY.format(update['update_id'])
+    if not cache.add(dedup_key, 1, DEDUP_TIMEOUT):
+        return False
+
+    redis = get_redis_connection_or_none()
+    if redis is None:
+        process_update(update)
+        return True
+
+    shard = shard_for(update)
+    try:
+        redis.rpush(QUEUE_KEY.format(shard), json.dumps(update))
+    except Exception:
+        # Telegram повторит обновление, и оно не должно считаться дублем
+        cache.delete(dedup_key)
+        raise
+    schedule_shard(redis, shard)
+    return True
+
+
+def acquire_shard(redis, shard):
+    """Блокировка шарда; возвращает токен владельца или None, если шард занят"""
+    token = uuid.uuid4().hex
+    if not redis.set(LOCK_KEY.format(shard), token, nx=True, ex=SHARD_LOCK_TIMEOUT):
+        return None
+    return token
+
+
+def release_shard(redis, shard, token):
+    """Снятие блокировки шарда, только своей"""
+    return bool(redis.register_script(RELEASE_SCRIPT)(keys=[LOCK_KEY.format(shard)], args=[token]))
+
+
+def schedule_shard(redis, shard):
+    """Ставит задачу обработки шарда, если шард сейчас никто не обрабатывает"""
+    token = acquire_shard(redis, shard)
+    if token is None:
+        return False
+    try:
+        from celery import current_app
+        current_app.send_task(PROCESS_SHARD_TASK_NAME, args=(shard, token))
+    except Exception as e:
+        # Шард подхватит периодическая schedule_pending_updates
+        release_shard(redis, shard, token)
+        logger.warning(f'Не удалось поставить обработку шарда {shard}: {e}')
+        return False
+    return True
+
+
+def schedule_pending_updates():
+    """Ставит обработку шардов с ожидающими обновлениями и без воркера"""
+    redis = get_redis_connection_or_none()
+    if redis is None:
+        return 0
+    return sum(
+        1 for shard in range(UPDATE_SHARDS)
+        if (redis.llen(QUEUE_KEY.format(shard)) or redis.llen(PROCESSING_KEY.format(shard)))
+        and schedule_shard(redis, shard)
+    )
+
+
+def process_update(update):
+    """Обработка одного обновления; ошибка не останавливает очередь шарда"""
+    from .views import dispatch_update
+    try:
+        dispatch_update(update)
+    except Exception:
+        logger.exception(f'Ошибка обработки обновления {update.get("update_id")}')
+
+
+def process_shard(shard, token, batch_size=SHARD_BATCH_SIZE):
+    """
+    Обработка очереди шарда по порядку. Вызывается держателем блокировки
+    с токеном token.
+
+    Обновление переносится в список обработки и удаляется из него только
+    после обработки, поэтому при падении воркера оно будет обработано
+    повторно, а не потеряно; после MAX_DELIVERIES выдач оно переносится в
+    DEAD_LETTER_KEY. Владение блокировкой проверяется перед каждым
+    обновлением: если шард взял другой воркер, обработка прекращается.
+    Возвращает количество обработанных обновлений.
+    """
+    redis = get_redis_connection_or_none()
+    queue_key = QUEUE_KEY.format(shard)
+    lock_key = LOCK_KEY.format(shard)
+    processing_key = PROCESSING_KEY.format(shard)
+    deliveries_key = DELIVERIES_KEY.format(shard)
+    claim = redis.register_script(CLAIM_SCRIPT)
+    ack = redis.register_script(ACK_SCRIPT)
+    processed = 0
+    while processed < batch_size:
+        claimed = claim(keys=[lock_key, processing_key, queue_key], args=[token, SHARD_LOCK_TIMEOUT])
+        if not claimed[0]:
+            logger.warning(f'Блокировка шарда {shard} перехвачена другим воркером')
+            return processed
+        if len(claimed) == 1:
+            release_shard(redis, shard, token)
+            # Обновление могло прийти между проверкой очереди и снятием блокировки
+            if redis.llen(queue_key) and redis.set(lock_key, token, nx=True, ex=SHARD_LOCK_TIMEOUT):
+                continue
+            return processed
+
+        raw = claimed[1]
+        update = json.loads(raw)
+        update_id = update['update_id']
+        keys = [lock_key, processing_key, deliveries_key]
+        if redis.hincrby(deliveries_key, update_id, 1) > MAX_DELIVERIES:
+            logger.error(f'Обновление {update_id} не обработано за {MAX_DELIVERIES} попытки, перенесено в {DEAD_LETTER_KEY}')
+            keys.append(DEAD_LETTER_KEY)
+        else:
+            process_update(update)
+            processed += 1
+        if not ack(keys=keys, args=[token, SHARD_LOCK_TIMEOUT, update_id]):
+            logger.warning(f'Блокировка шарда {shard} перехвачена другим воркером')
+            return processed
+
+    # Блокировка остается за продолжением; если она истечет, пока задача
+    # ждет в брокере, продолжение возьмет ее заново или уступит новому владельцу
+    from celery import current_app
+    current_app.send_task(PROCESS_SHARD_TASK_NAME, args=(shard, token))
+    return processed
@@ -1,5 +1,8 @@
+import hmac
 import json
 import logging
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
@@ -21,6 +24,8 @@ from .services import (
     TelegramBotService, TelegramNotificationService, TelegramMiniAppService,
     TelegramKeyboardService, TelegramStateService
 )
+from .identity import user_identities, chat_identities, user_profile, chat_profile
+from .updates import enqueue_update
 
 logger = logging.getLogger(__name__)
 
@@ -28,28 +33,42 @@ logger = logging.getLogger(__name__)
 @csrf_exempt
 @require_http_methods(["POST"])
 def webhook_handler(request):
-    """Обработчик webhook от Telegram"""
+    """
+    Прием webhook от Telegram.
+
+    Обновление проверяется, отбрасывается по update_id, если уже было
+    получено, и ставится в очередь (telegram_bot.updates); ответ уходит
+    сразу, обработка идет в воркерах.
+    """
+    secret = getattr(settings, 'TELEGRAM_WEBHOOK_SECRET', '')
+    if secret and not hmac.compare_digest(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret):
+        return JsonResponse({'status': 'forbidden'}, status=403)
+
     try:
         data = json.loads(request.body)
-        logger.info(f"Received webhook: {data}")
-        
-        # Обрабатываем различные типы обновлений
-        if 'message' in data:
-            return handle_message(data['message'])
-        elif 'callback_query' in data:
-            return handle_callback_query(data['callback_query'])
-        elif 'edited_message' in data:
-            return handle_edited_message(data['edited_message'])
-        else:
-            logger.warning(f"Unknown update type: {data}")
-            return JsonResponse({'status': 'unknown_update'})
-    
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, UnicodeDecodeError):
         logger.error("Invalid JSON in webhook")
         return JsonResponse({'status': 'invalid_json'}, status=400)
-    except Exception as e:
-        logger.error(f"Error processing webhook: {e}")
-        return JsonResponse({'status': 'error'}, status=500)
+    if not isinstance(data, dict) or not isinstance(data.get('update_id'), int):
+        return JsonResponse({'status': 'invalid_update'}, status=400)
+
+    if not enqueue_update(data):
+        logger.debug(f"Duplicate webhook update {data['update_id']}")
+        return JsonResponse({'status': 'duplicate'})
+    return JsonResponse({'status': 'ok'})
+
+
+def dispatch_update(data):
+    """Обработка обновления Telegram по его типу"""
+    if 'message' in data:
+        return handle_message(data['message'])
+    elif 'callback_query' in data:
+        return handle_callback_query(data['callback_query'])
+    elif 'edited_message' in data:
+        return handle_edited_message(data['edited_message'])
+    else:
+        logger.warning(f"Unknown update type: {data['update_id']}")
+        return JsonResponse({'status': 'unknown_update'})
 
 
 def handle_message(message_data):
@@ -76,6 +95,15 @@ def handle_message(message_data):
         return JsonResponse({'status': 'error'})
 
 
+def handle_edited_message(message_data):
+    """Обновление текста отредактированного сообщения"""
+    TelegramMessage.objects.filter(
+        message_id=message_data['message_id'],
+        chat__chat_id=message_data['chat']['id']
+    ).update(text=message_data.get('text', ''))
+    return JsonResponse({'status': 'ok'})
+
+
 def handle_callback_query(callback_data):
     """Обработка callback query"""
     try:
@@ -495,47 +523,48 @@ def show_settings(telegram_user, chat_id, message_id=None):
 
 # Вспомогательные функции
 def get_or_create_telegram_user(user_data):
-    """Получить или создать Telegram пользователя"""
+    """Получить или создать Telegram пользователя (через карту идентичностей)"""
+    return user_identities.resolve(
+        user_data['id'], user_profile(user_data), lambda: create_telegram_user(user_data)
+    )
+
+
+def create_telegram_user(user_data):
+    """Создать Telegram пользователя и пользователя Django для него"""
     telegram_id = user_data['id']
-    telegram_user = TelegramUser.objects.filter(telegram_id=telegram_id).first()
-    
-    if not telegram_user:
-        # Создаем пользователя Django если его нет
-        from django.contrib.auth.models import User
-        django_user, created = User.objects.get_or_create(
-            username=f"telegram_{telegram_id}",
-            defaults={
-                'first_name': user_data.get('first_name', ''),
-                'last_name': user_data.get('last_name', ''),
-                'email': f"telegram_{telegram_id}@example.com"
-            }
-        )
-        
-        telegram_user = TelegramUser.objects.create(
-            user=django_user,
-            telegram_id=telegram_id,
-            username=user_data.get('username'),
-            first_name=user_data.get('first_name'),
-            last_name=user_data.get('last_name'),
-            language_code=user_data.get('language_code', 'ru')
-        )
+    django_user, created = get_user_model().objects.get_or_create(
+        username=f"telegram_{telegram_id}",
+        defaults={
+            'first_name': user_data.get('first_name', ''),
+            'last_name': user_data.get('last_name', ''),
+            'email': f"telegram_{telegram_id}@example.com"
+        }
+    )
     
+    # get_or_create: тот же пользователь мог прийти в другом чате параллельно
+    telegram_user, created = TelegramUser.objects.get_or_create(
+        telegram_id=telegram_id,
+        defaults={
+            'user': django_user,
+            **user_profile(user_data)
+        }
+    )
     return telegram_user
 
 
 def get_or_create_telegram_chat(chat_data):
-    """Получить или создать Telegram чат"""
-    chat_id = chat_data['id']
-    chat = TelegramChat.objects.filter(chat_id=chat_id).first()
-    
-    if not chat:
-        chat = TelegramChat.objects.create(
-            chat_id=chat_id,
-            chat_type=chat_data['type'],
-            title=chat_data.get('title'),
-            username=chat_data.get('username')
-        )
-    
+    """Получить или создать Telegram чат (через карту идентичностей)"""
+    return chat_identities.resolve(
+        chat_data['id'], chat_profile(chat_data), lambda: create_telegram_chat(chat_data)
+    )
+
+
+def create_telegram_chat(chat_data):
+    """Создать Telegram чат"""
+    chat, created = TelegramChat.objects.get_or_create(
+        chat_id=chat_data['id'],
+        defaults=chat_profile(chat_data)
+    )
     return chat
 
 
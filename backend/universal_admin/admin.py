@@ -30,6 +30,9 @@ from erp.models import (
     ProjectBoard, ProjectColumn, ProjectTask, TaskComment, TaskAttachment, TaskHistory, TaskLabel
 )
 
+from .counters import get_dashboard_counters
+from .stats import calculate_growth
+
 from veles_drive.admin_actions import (
     approve_content, reject_content, verify_companies,
     unverify_companies, delete_spam, ban_users, unban_users,
@@ -137,67 +140,45 @@ class VelesAutoUniversalAdminSite(AdminSite):
         """Получение статистики для дашборда"""
         now = timezone.now()
         month_ago = now - timedelta(days=30)
-        
-        # Основная статистика
-        total_users = User.objects.count()
-        active_users = User.objects.filter(is_active=True).count()
-        total_companies = Company.objects.count()
-        verified_companies = Company.objects.filter(is_verified=True).count()
-        total_cars = Car.objects.count()
-        available_cars = Car.objects.filter(is_available=True).count()
-        
-        # ERP статистика
-        total_sales = Sale.objects.count()
-        monthly_sales = Sale.objects.filter(sale_date__gte=month_ago).count()
-        total_revenue = Sale.objects.aggregate(total=Sum('sale_price'))['total'] or 0
-        monthly_revenue = Sale.objects.filter(sale_date__gte=month_ago).aggregate(total=Sum('sale_price'))['total'] or 0
-        
-        total_projects = ProjectBoard.objects.count()
-        active_projects = ProjectBoard.objects.filter(is_archived=False).count()
-        total_tasks = ProjectTask.objects.count()
-        overdue_tasks = ProjectTask.objects.filter(due_date__lt=now, status__in=['todo', 'in_progress']).count()
-        
-        # Контент статистика
-        total_articles = Article.objects.count()
-        published_articles = Article.objects.filter(status='published').count()
-        # total_news = News.objects.count() # Удалено
-        # published_news = News.objects.filter(status='published').count() # Удалено
+        counters = get_dashboard_counters(month_ago, now)
+        users = counters['users']
+        companies = counters['companies']
+        cars = counters['cars']
+        sales = counters['sales']
         
         return {
             'stats': {
                 'users': {
-                    'total': total_users,
-                    'active': active_users,
-                    'growth': self.calculate_growth(User, 'date_joined')
+                    'total': users['total'],
+                    'active': users['active'],
+                    'growth': calculate_growth(users['period'], users['previous_period'])
                 },
                 'companies': {
-                    'total': total_companies,
-                    'verified': verified_companies,
-                    'growth': self.calculate_growth(Company, 'created_at')
+                    'total': companies['total'],
+                    'verified': companies['verified'],
+                    'growth': calculate_growth(companies['period'], companies['previous_period'])
                 },
                 'cars': {
-                    'total': total_cars,
-                    'available': available_cars,
-                    'growth': self.calculate_growth(Car, 'created_at')
+                    'total': cars['total'],
+                    'available': cars['available'],
+                    'growth': calculate_growth(cars['period'], cars['previous_period'])
                 },
                 'sales': {
-                    'total': total_sales,
-                    'monthly': monthly_sales,
-                    'revenue': total_revenue,
-                    'monthly_revenue': monthly_revenue,
-                    'growth': self.calculate_growth(Sale, 'sale_date')
+                    'total': sales['total'],
+                    'monthly': sales['period'],
+                    'revenue': sales['revenue'],
+                    'monthly_revenue': sales['period_revenue'],
+                    'growth': calculate_growth(sales['period'], sales['previous_period'])
                 },
                 'projects': {
-                    'total': total_projects,
-                    'active': active_projects,
-                    'tasks': total_tasks,
-                    'overdue': overdue_tasks
+                    'total': counters['boards']['total'],
+                    'active': counters['boards']['active'],
+                    'tasks': counters['tasks']['total'],
+                    'overdue': counters['tasks']['overdue']
                 },
                 'content': {
-                    'articles': total_articles,
-                    'published_articles': published_articles,
-                    # 'news': total_news, # Удалено
-                    # 'published_news': published_news # Удалено
+                    'articles': counters['articles']['total'],
+                    'published_articles': counters['articles']['published'],
                 }
             }
         }
@@ -326,20 +307,6 @@ class VelesAutoUniversalAdminSite(AdminSite):
         ]
         
         return actions
-    
-    def calculate_growth(self, model, date_field):
-        """Расчет роста за месяц"""
-        now = timezone.now()
-        month_ago = now - timedelta(days=30)
-        two_months_ago = now - timedelta(days=60)
-        
-        current_month = model.objects.filter(**{f'{date_field}__gte': month_ago}).count()
-        previous_month = model.objects.filter(**{f'{date_field}__gte': two_months_ago, f'{date_field}__lt': month_ago}).count()
-        
-        if previous_month == 0:
-            return 100 if current_month > 0 else 0
-        
-        return round(((current_month - previous_month) / previous_month) * 100, 1)
 
 
 # Создаем экземпляр универсальной админки
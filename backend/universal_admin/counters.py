@@ -0,0 +1,284 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from redis.exceptions import WatchError
+
+# Импорты моделей
+from cars.models import Vehicle
+from companies.models import Company
+from veles_drive.models import Article, PageView
+from veles_drive.services.redis_client import get_redis_connection_or_none
+from erp.models import Sale, ProjectBoard, ProjectTask
+
+from .stats import collect_dashboard_counters
+
+User = get_user_model()
+
+COUNTERS_KEY = 'dashboard:counters'
+DAILY_KEY_PREFIX = 'dashboard:daily:'
+# Метка первого пересчета: до нее разницы не применяются, а читатели
+# получают агрегацию по базе
+READY_KEY = 'dashboard:counters:ready'
+# Увеличивается каждой разницей, пересчет наблюдает за ним через WATCH
+VERSION_KEY = 'dashboard:counters:version'
+RECONCILE_ATTEMPTS = 3
+# Суммы хранятся в копейках, чтобы использовать целочисленный HINCRBY
+MONEY_SCALE = 100
+
+
+# Разницы применяются, только если счетчики уже инициализированы пересчетом;
+# KEYS[3..] - хэши, ARGV - пары (поле, разница) для них по порядку
+INCREMENT_SCRIPT = """
+redis.call('INCR', KEYS[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 3, #KEYS do
+    redis.call('HINCRBY', KEYS[i], ARGV[2 * i - 5], ARGV[2 * i - 4])
+end
+return 1
+"""
+
+
+class CounterSpec:
+    """
+    Описание живых счетчиков модели.
+
+    flags - {счетчик: (поле, значение)} для записей с заданным значением поля,
+    sums - {счетчик: денежное поле}, date_field - поле, по которому ведутся
+    дневные счетчики (количество и суммы) для расчета периода и роста.
+    """
+
+    def __init__(self, model, date_field=None, flags=None, sums=None):
+        self.model = model
+        self.date_field = date_field
+        self.flags = flags or {}
+        self.sums = sums or {}
+
+    @property
+    def fields(self):
+        fields = [field for field, _ in self.flags.values()] + list(self.sums.values())
+        if self.date_field:
+            fields.append(self.date_field)
+        return fields
+
+    def daily_key(self, name, field='count'):
+        key = f'{DAILY_KEY_PREFIX}{name}'
+        return key if field == 'count' else f'{key}:{field}'
+
+    def state(self, instance):
+        """Вклад объекта в счетчики"""
+        state = {'total': 1}
+        for name, (field, value) in self.flags.items():
+            state[name] = int(getattr(instance, field) == value)
+        for name, field in self.sums.items():
+            state[name] = int(Decimal(getattr(instance, field) or 0) * MONEY_SCALE)
+        if self.date_field:
+            value = getattr(instance, self.date_field)
+            state['day'] = timezone.localdate(value).isoformat() if value else None
+        return state
+
+
+COUNTER_SPECS = {
+    'users': CounterSpec(User, 'date_joined', flags={'active': ('is_active', True)}),
+    'companies': CounterSpec(Company, 'created_at', flags={'verified': ('is_verified', True)}),
+    'cars': CounterSpec(Vehicle, 'created_at', flags={'available': ('is_available', True)}),
+    'sales': CounterSpec(Sale, 'sale_date', sums={'revenue': 'sale_price'}),
+    'boards': CounterSpec(ProjectBoard, flags={'active': ('is_archived', False)}),
+    'tasks': CounterSpec(ProjectTask),
+    'articles': CounterSpec(Article, flags={'published': ('status', 'published')}),
+    'pageviews': CounterSpec(PageView, 'timestamp'),
+}
+
+
+def increment(connection, increments):
+    """Атомарные HINCRBY [(ключ, поле, разница)] одним скриптом"""
+    if not increments:
+        return
+    args = []
+    for key, field, delta in increments:
+        args += [field, delta]
+    script = connection.register_script(INCREMENT_SCRIPT)
+    script(keys=[READY_KEY, VERSION_KEY, *[key for key, field, delta in increments]], args=args)
+
+
+def apply_delta(name, old_state, new_state):
+    """
+    Применяет к счетчикам разницу между состояниями объекта.
+
+    old_state - None для нового объекта, new_state - None для удаленного.
+    Все изменения уходят одним скриптом атомарных HINCRBY, поэтому
+    параллельные сохранения не теряют обновлений. До первого пересчета
+    разницы не применяются.
+    """
+    connection = get_redis_connection_or_none()
+    if connection is None:
+        return
+    spec = COUNTER_SPECS[name]
+    totals = {}
+    daily = {}
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if not state:
+            continue
+        for field, value in state.items():
+            if field != 'day':
+                totals[field] = totals.get(field, 0) + sign * value
+        if state.get('day'):
+            for field in ['count', *spec.sums]:
+                key = (spec.daily_key(name, field), state['day'])
+                daily[key] = daily.get(key, 0) + sign * state.get(field, 1)
+
+    increments = [(COUNTERS_KEY, f'{name}:{field}', delta) for field, delta in totals.items() if delta]
+    increments += [(key, day, delta) for (key, day), delta in daily.items() if delta]
+    increment(connection, increments)
+
+
+def add_created(name, days):
+    """Учитывает объекты, созданные без сигналов (bulk_create): {день: количество}"""
+    connection = get_redis_connection_or_none()
+    if connection is None or not days:
+        return
+    increments = [(COUNTERS_KEY, f'{name}:total', sum(days.values()))]
+    increments += [(COUNTER_SPECS[name].daily_key(name), day, count) for day, count in days.items()]
+    increment(connection, increments)
+
+
+def read_counters(start_date, end_date):
+    """
+    Живые счетчики дашборда из Redis в формате collect_dashboard_counters.
+
+    Период и предыдущий период складываются из дневных счетчиков, поэтому
+    их границы округляются до календарных дней. Счетчики, зависящие от
+    текущего времени или колонки задачи (входившие пользователи,
+    завершенные и просроченные задачи), считаются отдельными запросами.
+    Возвращает None без Redis или если счетчики еще не инициализированы
+    пересчетом.
+    """
+    connection = get_redis_connection_or_none()
+    if connection is None:
+        return None
+
+    first_day = timezone.localdate(start_date)
+    length = (timezone.localdate(end_date) - first_day).days + 1
+    period_days = [(first_day + timedelta(days=offset)).isoformat() for offset in range(length)]
+    previous_days = [(first_day - timedelta(days=offset)).isoformat() for offset in range(1, length + 1)]
+
+    daily_fields = [
+        (name, field)
+        for name, spec in COUNTER_SPECS.items() if spec.date_field
+        for field in ['count', *spec.sums]
+    ]
+    pipe = connection.pipeline(transaction=False)
+    pipe.exists(READY_KEY)
+    pipe.hgetall(COUNTERS_KEY)
+    for name, field in daily_fields:
+        pipe.hmget(COUNTER_SPECS[name].daily_key(name, field), period_days + previous_days)
+    ready, counter_values, *results = pipe.execute()
+    if not ready:
+        return None
+
+    values = {key.decode(): int(value) for key, value in counter_values.items()}
+
+    counters = {}
+    for name, spec in COUNTER_SPECS.items():
+        counters[name] = {'total': values.get(f'{name}:total', 0)}
+        for field in spec.flags:
+            counters[name][field] = values.get(f'{name}:{field}', 0)
+        for field in spec.sums:
+            counters[name][field] = Decimal(values.get(f'{name}:{field}', 0)) / MONEY_SCALE
+    for (name, field), daily in zip(daily_fields, results):
+        daily = [int(value or 0) for value in daily]
+        if field == 'count':
+            counters[name]['period'] = sum(daily[:length])
+            counters[name]['previous_period'] = sum(daily[length:])
+        else:
+            counters[name][f'period_{field}'] = Decimal(sum(daily[:length])) / MONEY_SCALE
+
+    counters['users']['logged_in'] = User.objects.filter(last_login__gte=start_date).count()
+    # Статус задачи определяется колонкой, поэтому эти счетчики считаются запросом
+    counters['tasks'].update(ProjectTask.objects.aggregate(
+        completed=Count('pk', filter=Q(column__name__icontains='завершено')),
+        overdue=Count('pk', filter=Q(due_date__lt=end_date, column__name__icontains='в работе')),
+    ))
+    return counters
+
+
+def count_from_database():
+    """Итоги и дневные счетчики по базе: ({поле: значение}, {ключ: {день: значение}})"""
+    values = {}
+    daily = {}
+    for name, spec in COUNTER_SPECS.items():
+        aggregates = {'total': Count('pk')}
+        for field, (source, value) in spec.flags.items():
+            aggregates[field] = Count('pk', filter=Q(**{source: value}))
+        for field, source in spec.sums.items():
+            aggregates[field] = Sum(source)
+        for field, value in spec.model.objects.aggregate(**aggregates).items():
+            if field in spec.sums:
+                value = int(Decimal(value or 0) * MONEY_SCALE)
+            values[f'{name}:{field}'] = value
+
+        if spec.date_field:
+            day_aggregates = {'count': Count('pk')}
+            for field, source in spec.sums.items():
+                day_aggregates[field] = Sum(source)
+            rows = spec.model.objects.exclude(**{spec.date_field: None}).annotate(
+                day=TruncDate(spec.date_field)
+            ).values('day').annotate(**day_aggregates).order_by()
+            for row in rows:
+                day = row['day'].isoformat()
+                for field in day_aggregates:
+                    value = row[field] if field == 'count' else int(Decimal(row[field] or 0) * MONEY_SCALE)
+                    daily.setdefault(spec.daily_key(name, field), {})[day] = value
+    return values, daily
+
+
+def reconcile_counters():
+    """
+    Полный пересчет живых счетчиков по базе.
+
+    Исправляет расхождения после bulk-операций и QuerySet.update, которые
+    не отправляют сигналы. Счетчики заменяются атомарно, читатели не видят
+    частично пересчитанного состояния. Если за время подсчета пришла
+    разница (изменился VERSION_KEY), транзакция отменяется и подсчет
+    повторяется: иначе перезапись потеряла бы эту разницу. Возвращает
+    новые значения итогов.
+    """
+    connection = get_redis_connection_or_none()
+    if connection is None:
+        return None
+
+    daily_keys = [
+        spec.daily_key(name, field)
+        for name, spec in COUNTER_SPECS.items() if spec.date_field
+        for field in ['count', *spec.sums]
+    ]
+    for attempt in range(RECONCILE_ATTEMPTS):
+        with connection.pipeline(transaction=True) as pipe:
+            # Последняя попытка записывает без наблюдения: при постоянном
+            # потоке изменений расхождение исправит следующий пересчет
+            if attempt < RECONCILE_ATTEMPTS - 1:
+                pipe.watch(VERSION_KEY)
+            values, daily = count_from_database()
+            pipe.multi()
+            pipe.delete(COUNTERS_KEY, *daily_keys)
+            pipe.hset(COUNTERS_KEY, mapping=values)
+            for key, days in daily.items():
+                pipe.hset(key, mapping=days)
+            pipe.set(READY_KEY, 1)
+            try:
+                pipe.execute()
+            except WatchError:
+                continue
+        return values
+
+
+def get_dashboard_counters(start_date, end_date):
+    """Живые счетчики, а без Redis или до первого пересчета - агрегация по базе"""
+    counters = read_counters(start_date, end_date)
+    if counters is None:
+        counters = collect_dashboard_counters(start_date, end_date)
+    return counters
@@ -1,155 +1,108 @@
+from collections import Counter
+from types import SimpleNamespace
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.cache import cache
 from django.utils import timezone
-from django.contrib.auth import get_user_model
 from datetime import timedelta
 
 # Импорты моделей
-from veles_drive.models import (
-    Category, Tag, Article, ContentImage, Subscription, ContentView, Comment, Reaction, ContentRating,
-    YouTubeChannel, YouTubeVideo, YouTubePlaylist, SEOMetadata, PageView, UserSession, SearchQuery, Conversion,
-    ABTest, ABTestVariant, ABTestResult
-)
-from companies.models import Company
-from cars.models import Car
-
-from erp.models import (
-    Sale as ERPSale, ProjectTask, ProjectBoard
-)
-
-User = get_user_model()
-
-
-@receiver([post_save, post_delete], sender=User)
-def invalidate_user_stats(sender, instance, **kwargs):
-    """Инвалидация кэша статистики пользователей"""
-    cache_keys = [
-        'user_stats_total',
-        'user_stats_growth',
-        'user_stats_active',
-        'recent_activities'
-    ]
-    for key in cache_keys:
-        cache.delete(key)
-
-
-@receiver([post_save, post_delete], sender=Company)
-def invalidate_company_stats(sender, instance, **kwargs):
-    """Инвалидация кэша статистики компаний"""
-    cache_keys = [
-        'company_stats_total',
-        'company_stats_verified',
-        'company_stats_growth',
-        'top_companies_revenue',
-        'recent_activities'
-    ]
-    for key in cache_keys:
-        cache.delete(key)
-
-
-@receiver([post_save, post_delete], sender=Car)
-def invalidate_car_stats(sender, instance, **kwargs):
-    """Инвалидация кэша статистики автомобилей"""
-    cache_keys = [
-        'car_stats_total',
-        'car_stats_available',
-        'car_stats_growth',
-        'top_cars_views',
-        'recent_activities'
-    ]
-    for key in cache_keys:
-        cache.delete(key)
-
-
-@receiver([post_save, post_delete], sender=ERPSale)
-def invalidate_sale_stats(sender, instance, **kwargs):
-    """Инвалидация кэша статистики продаж"""
-    cache_keys = [
-        'sale_stats_total',
-        'sale_stats_revenue',
-        'sale_stats_growth',
-        'sales_chart_data',
-        'revenue_chart_data',
-        'recent_activities'
-    ]
-    for key in cache_keys:
-        cache.delete(key)
-
-
-@receiver([post_save, post_delete], sender=ProjectTask)
-def invalidate_project_stats(sender, instance, **kwargs):
-    """Инвалидация кэша статистики проектов"""
-    cache_keys = [
-        'project_stats_total',
-        'project_stats_tasks',
-        'project_stats_completed',
-        'recent_activities'
-    ]
-    for key in cache_keys:
-        cache.delete(key)
-
-
-@receiver([post_save, post_delete], sender=ProjectBoard)
-def invalidate_board_stats(sender, instance, **kwargs):
-    """Инвалидация кэша статистики досок проектов"""
-    cache_keys = [
-        'project_stats_total',
-        'project_stats_active',
-        'recent_activities'
-    ]
-    for key in cache_keys:
-        cache.delete(key)
-
-
-@receiver([post_save, post_delete], sender=Article)
-def invalidate_content_stats(sender, instance, **kwargs):
-    """Инвалидация кэша статистики контента"""
-    cache_keys = [
-        'content_stats_articles',
-        'content_stats_published',
-        'recent_activities'
-    ]
-    for key in cache_keys:
-        cache.delete(key)
-
-
-# @receiver([post_save, post_delete], sender=News)
-# def invalidate_news_stats(sender, instance, **kwargs):
-#     """Инвалидация кэша статистики новостей"""
-#     cache_keys = [
-#         'content_stats_news',
-#         'content_stats_published_news',
-#         'recent_activities'
-#     ]
-#     for key in cache_keys:
-#         cache.delete(key)
-
-
-@receiver([post_save, post_delete], sender=PageView)
-def invalidate_pageview_stats(sender, instance, **kwargs):
-    """Инвалидация кэша статистики просмотров"""
-    cache_keys = [
-        'pageview_stats_total',
-        'pageview_stats_growth',
-        'pageviews_chart_data',
-        'top_cars_views'
-    ]
-    for key in cache_keys:
-        cache.delete(key)
+from veles_drive.models import PageView
+from veles_drive.services.ingestion import page_views_flushed
+
+from .counters import COUNTER_SPECS, apply_delta, add_created, read_counters
+from .stats import collect_dashboard_counters
+
+# Имя счетчиков по модели
+COUNTER_NAMES = {spec.model: name for name, spec in COUNTER_SPECS.items()}
+
+
+def get_saved_state(spec, instance, overrides=None):
+    """
+    Вклад объекта в счетчики по значениям, загруженным из базы.
+
+    Значения берутся из ChangeTrackingMixin без повторного чтения, overrides
+    подменяет значения записанных полей. None, если какое-то из полей
+    счетчиков не было загружено.
+    """
+    overrides = overrides or {}
+    loaded = instance.get_loaded_values() if spec.fields else {}
+    values = {}
+    for field in spec.fields:
+        if field in overrides:
+            values[field] = overrides[field]
+        elif field in loaded:
+            values[field] = loaded[field]
+        else:
+            return None
+    return spec.state(SimpleNamespace(**values))
+
+
+def update_counters_on_save(sender, instance, created, **kwargs):
+    """Инкрементальное обновление счетчиков дашборда при сохранении"""
+    name = COUNTER_NAMES[sender]
+    spec = COUNTER_SPECS[name]
+    if sender is not PageView:
+        cache.delete('recent_activities')
+    if created:
+        old_state, new_state = None, spec.state(instance)
+    else:
+        # saved_changes учитывает update_fields, остальные поля остаются как в базе
+        changes = {
+            field: new_value for field, (old_value, new_value) in getattr(instance, 'saved_changes', {}).items()
+            if field in spec.fields
+        }
+        if not changes:
+            # Поля счетчиков не менялись
+            return
+        old_state = get_saved_state(spec, instance)
+        new_state = get_saved_state(spec, instance, changes)
+        if old_state is None:
+            # Прежнее состояние неизвестно, расхождение исправит пересчет
+            return
+    transaction.on_commit(lambda: apply_delta(name, old_state, new_state))
+
+
+def update_counters_on_delete(sender, instance, **kwargs):
+    """Инкрементальное обновление счетчиков дашборда при удалении"""
+    name = COUNTER_NAMES[sender]
+    old_state = get_saved_state(COUNTER_SPECS[name], instance)
+    if old_state is None:
+        return
+    transaction.on_commit(lambda: apply_delta(name, old_state, None))
+    if sender is not PageView:
+        cache.delete('recent_activities')
+
+
+for model, name in COUNTER_NAMES.items():
+    post_save.connect(update_counters_on_save, sender=model, dispatch_uid=f'dashboard_counters_save_{name}')
+    post_delete.connect(update_counters_on_delete, sender=model, dispatch_uid=f'dashboard_counters_delete_{name}')
+
+
+@receiver(page_views_flushed, sender=PageView)
+def count_flushed_page_views(sender, page_views, **kwargs):
+    """Учет просмотров, записанных пачкой через bulk_create"""
+    days = Counter(timezone.localdate(page_view.timestamp).isoformat() for page_view in page_views)
+    transaction.on_commit(lambda: add_created('pageviews', dict(days)))
 
 
 def get_cached_stats(period_days=30):
-    """Получение кэшированной статистики"""
+    """Получение статистики: живые счетчики, без них - кэшированный пересчет"""
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=period_days)
+    counters = read_counters(start_date, end_date)
+    if counters is not None:
+        from .views import build_analytics_stats
+        return build_analytics_stats(counters)
+
     cache_key = f'analytics_stats_{period_days}'
     stats = cache.get(cache_key)
     
     if stats is None:
         # Если кэш пустой, вычисляем статистику
-        from .views import get_analytics_stats
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=period_days)
-        stats = get_analytics_stats(start_date, end_date)
+        from .views import build_analytics_stats
+        stats = build_analytics_stats(collect_dashboard_counters(start_date, end_date))
         
         # Кэшируем на 5 минут
         cache.set(cache_key, stats, 300)
@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Sum, Q
+
+# Импорты моделей
+from cars.models import Vehicle
+from companies.models import Company
+from veles_drive.models import Article, PageView
+from erp.models import Sale, ProjectBoard, ProjectTask
+
+User = get_user_model()
+
+
+def calculate_growth(current, previous):
+    """Рост текущего периода относительно предыдущего, %"""
+    if previous == 0:
+        return 100 if current > 0 else 0
+    return round(((current - previous) / previous) * 100, 1)
+
+
+def period_counters(date_field, start_date, end_date):
+    """Условные счетчики за период и за предыдущий период такой же длительности"""
+    previous_start = start_date - (end_date - start_date)
+    return {
+        'period': Count('pk', filter=Q(**{f'{date_field}__gte': start_date})),
+        'previous_period': Count('pk', filter=Q(**{
+            f'{date_field}__gte': previous_start,
+            f'{date_field}__lt': start_date
+        })),
+    }
+
+
+def collect_dashboard_counters(start_date, end_date):
+    """
+    Счетчики дашборда: по одному запросу с условной агрегацией на модель.
+
+    Все COUNT/SUM по модели, включая данные для расчета роста, считаются
+    за один проход по таблице вместо отдельного запроса на каждую цифру.
+    """
+    counters = {
+        'users': User.objects.aggregate(
+            total=Count('pk'),
+            active=Count('pk', filter=Q(is_active=True)),
+            logged_in=Count('pk', filter=Q(last_login__gte=start_date)),
+            **period_counters('date_joined', start_date, end_date)
+        ),
+        'companies': Company.objects.aggregate(
+            total=Count('pk'),
+            verified=Count('pk', filter=Q(is_verified=True)),
+            **period_counters('created_at', start_date, end_date)
+        ),
+        'cars': Vehicle.objects.aggregate(
+            total=Count('pk'),
+            available=Count('pk', filter=Q(is_available=True)),
+            **period_counters('created_at', start_date, end_date)
+        ),
+        'sales': Sale.objects.aggregate(
+            total=Count('pk'),
+            revenue=Sum('sale_price'),
+            period_revenue=Sum('sale_price', filter=Q(sale_date__gte=start_date)),
+            **period_counters('sale_date', start_date, end_date)
+        ),
+        'boards': ProjectBoard.objects.aggregate(
+            total=Count('pk'),
+            active=Count('pk', filter=Q(is_archived=False)),
+        ),
+        'tasks': ProjectTask.objects.aggregate(
+            total=Count('pk'),
+            completed=Count('pk', filter=Q(column__name__icontains='завершено')),
+            overdue=Count('pk', filter=Q(due_date__lt=end_date, column__name__icontains='в работе')),
+        ),
+        'articles': Article.objects.aggregate(
+            total=Count('pk'),
+            published=Count('pk', filter=Q(status='published')),
+        ),
+        'pageviews': PageView.objects.aggregate(
+            total=Count('pk'),
+            **period_counters('timestamp', start_date, end_date)
+        ),
+    }
+    for name in ('revenue', 'period_revenue'):
+        counters['sales'][name] = counters['sales'][name] or 0
+    return counters
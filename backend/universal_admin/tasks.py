@@ -0,0 +1,17 @@
+import logging
+from celery import shared_task
+
+from .counters import reconcile_counters
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def reconcile_dashboard_counters():
+    """Сверка живых счетчиков дашборда с базой"""
+    values = reconcile_counters()
+    if values is None:
+        logger.info('Живые счетчики дашборда отключены: кэш не Redis')
+    else:
+        logger.info(f'Счетчики дашборда пересчитаны: {values}')
+    return values
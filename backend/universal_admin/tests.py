@@ -0,0 +1,109 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .admin import universal_admin_site
+from .stats import collect_dashboard_counters
+
+User = get_user_model()
+
+# Один запрос с условной агрегацией на каждую модель дашборда
+DASHBOARD_QUERY_LIMIT = 8
+
+
+class DashboardStatsQueryCountTest(TestCase):
+    """Тесты количества запросов статистики дашборда"""
+
+    def setUp(self):
+        now = timezone.now()
+        for index in range(3):
+            User.objects.create_user(
+                username=f'user{index}',
+                email=f'user{index}@example.com',
+                password='testpass123'
+            )
+        # Пользователь, зарегистрированный в предыдущем периоде
+        User.objects.filter(username='user0').update(date_joined=now - timedelta(days=45))
+
+    def test_dashboard_counters_query_count(self):
+        """Тест: счетчики дашборда считаются фиксированным числом запросов"""
+        end_date = timezone.now()
+        start_date = end_date - timedelta(days=30)
+
+        with self.assertNumQueries(DASHBOARD_QUERY_LIMIT):
+            counters = collect_dashboard_counters(start_date, end_date)
+
+        self.assertEqual(counters['users']['total'], 3)
+        self.assertEqual(counters['users']['period'], 2)
+        self.assertEqual(counters['users']['previous_period'], 1)
+
+    def test_dashboard_stats_query_count(self):
+        """Тест: статистика главной страницы админки считается фиксированным числом запросов"""
+        with self.assertNumQueries(DASHBOARD_QUERY_LIMIT):
+            stats = universal_admin_site.get_dashboard_stats()['stats']
+
+        self.assertEqual(stats['users']['total'], 3)
+        self.assertEqual(stats['users']['active'], 3)
+
+
+class DashboardCountersSignalsTest(TestCase):
+    """Тесты инкрементального обновления живых счетчиков"""
+
+    def test_counters_follow_user_changes(self):
+        """Тест: сигналы передают разницу состояний без повторного чтения объекта"""
+        with mock.patch('universal_admin.signals.apply_delta') as apply_delta:
+            with self.captureOnCommitCallbacks(execute=True):
+                user = User.objects.create_user(username='counted', email='counted@example.com', password='testpass123')
+            name, old_state, new_state = apply_delta.call_args.args
+            self.assertEqual(name, 'users')
+            self.assertIsNone(old_state)
+            self.assertEqual(new_state['active'], 1)
+
+            user = User.objects.get(pk=user.pk)
+            user.is_active = False
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                user.save()
+            # Другие обработчики (outbox интеграции) могут писать, но объект не перечитывается
+            self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+            _, old_state, new_state = apply_delta.call_args.args
+            self.assertEqual((old_state['active'], new_state['active']), (1, 0))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                user.delete()
+            self.assertEqual(apply_delta.call_args.args[2], None)
+
+    def test_deferred_fields_are_skipped(self):
+        """Тест: объекты с отложенными полями не учитываются, их исправит пересчет"""
+        User.objects.create_user(username='deferred', email='deferred@example.com', password='testpass123')
+        with mock.patch('universal_admin.signals.apply_delta') as apply_delta:
+            with self.captureOnCommitCallbacks(execute=True):
+                User.objects.only('username').get(username='deferred').save()
+        apply_delta.assert_not_called()
+
+    def test_refreshed_object_uses_refreshed_state(self):
+        """Тест: после refresh_from_db разница считается от перечитанных значений"""
+        user = User.objects.create_user(username='refreshed', email='refreshed@example.com', password='testpass123')
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        user.refresh_from_db()
+        with mock.patch('universal_admin.signals.apply_delta') as apply_delta:
+            user.is_active = True
+            with self.captureOnCommitCallbacks(execute=True):
+                user.save()
+        _, old_state, new_state = apply_delta.call_args.args
+        self.assertEqual((old_state['active'], new_state['active']), (0, 1))
+
+    def test_unsaved_fields_are_not_counted(self):
+        """Тест: поля вне update_fields не попадают в разницу"""
+        user = User.objects.create_user(username='partial', email='partial@example.com', password='testpass123')
+        with mock.patch('universal_admin.signals.apply_delta') as apply_delta:
+            user.is_active = False
+            user.date_joined = timezone.now() - timedelta(days=400)
+            with self.captureOnCommitCallbacks(execute=True):
+                user.save(update_fields=['is_active'])
+        _, old_state, new_state = apply_delta.call_args.args
+        self.assertEqual((old_state['active'], new_state['active']), (1, 0))
+        self.assertEqual(old_state['day'], new_state['day'])
@@ -5,19 +5,21 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Count, Sum, Avg, Q
 from django.utils import timezone
-from django.contrib.auth.models import User
+from django.contrib.auth import get_user_model
 from datetime import timedelta, datetime
 from django.db.models.functions import TruncDate, TruncMonth, TruncYear
 
 # Импорты моделей
-from veles_drive.models import (
-    Company, Car, Review, Article, News, PageView, UserSession, 
-    SearchQuery, Conversion, ABTest, ABTestResult
-)
+from cars.models import Car
+from companies.models import Company
+from veles_drive.models import PageView
+from erp.models import Sale, ProjectTask
 
-from erp.models import (
-    Sale, ServiceOrder, Financial, ProjectBoard, ProjectTask
-)
+from .counters import get_dashboard_counters
+from .signals import get_cached_stats
+from .stats import calculate_growth
+
+User = get_user_model()
 
 
 @staff_member_required
@@ -39,7 +41,7 @@ def analytics_dashboard(request):
     start_date = end_date - timedelta(days=days)
     
     # Основная статистика
-    stats = get_analytics_stats(start_date, end_date)
+    stats = get_cached_stats(days)
     
     # Графики
     charts = get_analytics_charts(start_date, end_date)
@@ -88,10 +90,7 @@ def api_stats(request):
     else:
         days = 30
     
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=days)
-    
-    stats = get_analytics_stats(start_date, end_date)
+    stats = get_cached_stats(days)
     
     return JsonResponse(stats)
 
@@ -130,86 +129,57 @@ def api_charts(request):
 
 def get_analytics_stats(start_date, end_date):
     """Получение аналитической статистики"""
-    
-    # Пользователи
-    total_users = User.objects.count()
-    new_users = User.objects.filter(date_joined__gte=start_date).count()
-    active_users = User.objects.filter(last_login__gte=start_date).count()
-    
-    # Компании
-    total_companies = Company.objects.count()
-    new_companies = Company.objects.filter(created_at__gte=start_date).count()
-    verified_companies = Company.objects.filter(is_verified=True).count()
-    
-    # Автомобили
-    total_cars = Car.objects.count()
-    new_cars = Car.objects.filter(created_at__gte=start_date).count()
-    available_cars = Car.objects.filter(is_available=True).count()
-    
-    # Продажи
-    total_sales = Sale.objects.count()
-    period_sales = Sale.objects.filter(sale_date__gte=start_date).count()
-    total_revenue = Sale.objects.aggregate(total=Sum('sale_price'))['total'] or 0
-    period_revenue = Sale.objects.filter(sale_date__gte=start_date).aggregate(total=Sum('sale_price'))['total'] or 0
-    
-    # Проекты
-    total_projects = ProjectBoard.objects.count()
-    active_projects = ProjectBoard.objects.filter(is_archived=False).count()
-    total_tasks = ProjectTask.objects.count()
-    completed_tasks = ProjectTask.objects.filter(status='completed').count()
-    
-    # Контент
-    total_articles = Article.objects.count()
-    published_articles = Article.objects.filter(status='published').count()
-    total_news = News.objects.count()
-    published_news = News.objects.filter(status='published').count()
-    
-    # Просмотры
-    total_pageviews = PageView.objects.count()
-    period_pageviews = PageView.objects.filter(timestamp__gte=start_date).count()
+    return build_analytics_stats(get_dashboard_counters(start_date, end_date))
+
+
+def build_analytics_stats(counters):
+    """Аналитическая статистика из счетчиков дашборда"""
+    users = counters['users']
+    companies = counters['companies']
+    cars = counters['cars']
+    sales = counters['sales']
+    pageviews = counters['pageviews']
     
     return {
         'users': {
-            'total': total_users,
-            'new': new_users,
-            'active': active_users,
-            'growth': calculate_growth(User, 'date_joined', start_date, end_date)
+            'total': users['total'],
+            'new': users['period'],
+            'active': users['logged_in'],
+            'growth': calculate_growth(users['period'], users['previous_period'])
         },
         'companies': {
-            'total': total_companies,
-            'new': new_companies,
-            'verified': verified_companies,
-            'growth': calculate_growth(Company, 'created_at', start_date, end_date)
+            'total': companies['total'],
+            'new': companies['period'],
+            'verified': companies['verified'],
+            'growth': calculate_growth(companies['period'], companies['previous_period'])
         },
         'cars': {
-            'total': total_cars,
-            'new': new_cars,
-            'available': available_cars,
-            'growth': calculate_growth(Car, 'created_at', start_date, end_date)
+            'total': cars['total'],
+            'new': cars['period'],
+            'available': cars['available'],
+            'growth': calculate_growth(cars['period'], cars['previous_period'])
         },
         'sales': {
-            'total': total_sales,
-            'period': period_sales,
-            'revenue': total_revenue,
-            'period_revenue': period_revenue,
-            'growth': calculate_growth(Sale, 'sale_date', start_date, end_date)
+            'total': sales['total'],
+            'period': sales['period'],
+            'revenue': sales['revenue'],
+            'period_revenue': sales['period_revenue'],
+            'growth': calculate_growth(sales['period'], sales['previous_period'])
         },
         'projects': {
-            'total': total_projects,
-            'active': active_projects,
-            'tasks': total_tasks,
-            'completed': completed_tasks
+            'total': counters['boards']['total'],
+            'active': counters['boards']['active'],
+            'tasks': counters['tasks']['total'],
+            'completed': counters['tasks']['completed']
         },
         'content': {
-            'articles': total_articles,
-            'published_articles': published_articles,
-            'news': total_news,
-            'published_news': published_news
+            'articles': counters['articles']['total'],
+            'published_articles': counters['articles']['published']
         },
         'pageviews': {
-            'total': total_pageviews,
-            'period': period_pageviews,
-            'growth': calculate_growth(PageView, 'timestamp', start_date, end_date)
+            'total': pageviews['total'],
+            'period': pageviews['period'],
+            'growth': calculate_growth(pageviews['period'], pageviews['previous_period'])
         }
     }
 
@@ -370,20 +340,3 @@ def get_recent_activities():
     # Сортируем по дате
     activities.sort(key=lambda x: x['date'], reverse=True)
     return activities[:10]
-
-
-def calculate_growth(model, date_field, start_date, end_date):
-    """Расчет роста за период"""
-    current_period = model.objects.filter(**{f'{date_field}__gte': start_date}).count()
-    
-    # Предыдущий период такой же длительности
-    period_duration = end_date - start_date
-    previous_start = start_date - period_duration
-    previous_end = start_date
-    
-    previous_period = model.objects.filter(**{f'{date_field}__gte': previous_start, f'{date_field}__lt': previous_end}).count()
-    
-    if previous_period == 0:
-        return 100 if current_period > 0 else 0
-    
-    return round(((current_period - previous_period) / previous_period) * 100, 1) 
\ No newline at end of file
@@ -2,6 +2,8 @@ from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from core.mixins import ChangeTrackingMixin
+
 class Role(models.Model):
     """Модель ролей пользователей"""
     name = models.CharField('Название', max_length=100, unique=True)
@@ -23,8 +25,11 @@ class Role(models.Model):
     def __str__(self):
         return self.name
 
-class User(AbstractUser):
+class User(ChangeTrackingMixin, AbstractUser):
     """Пользователь с дополнительными полями"""
+    # Поля счетчиков дашборда
+    tracked_fields = ['is_active', 'date_joined']
+
     email = models.EmailField('Email адрес', unique=True, default='unknown@example.com')
     phone = models.CharField('Номер телефона', max_length=15, blank=True, default='0000000000')
     avatar = models.ImageField('Аватар', upload_to='avatars/', null=True, blank=True)
@@ -37,6 +37,59 @@ app.conf.beat_schedule = {
         'task': 'veles_drive.tasks.optimize_seo_metadata',
         'schedule': crontab(hour=0, minute=0),  # Run daily at midnight
     },
+    'flush-page-views': {
+        'task': 'veles_drive.tasks.flush_page_views',
+        'schedule': 10.0,  # Every 10 seconds, in addition to flushes on full batches
+    },
+    'update-analytics-rollups': {
+        'task': 'veles_drive.tasks.update_analytics_rollups',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'refresh-erp-report-snapshots': {
+        'task': 'erp.tasks.refresh_report_snapshots',
+        'schedule': crontab(minute='*/5'),  # Каждые 5 минут: пересчет измененных дней
+    },
+    'rebuild-erp-report-snapshots': {
+        'task': 'erp.tasks.refresh_report_snapshots',
+        'schedule': crontab(hour=3, minute=0),  # Каждую ночь: полная сверка снимков
+        'kwargs': {'full': True},
+    },
+    'recover-erp-report-jobs': {
+        'task': 'erp.tasks.recover_report_jobs',
+        'schedule': crontab(minute='*/10'),  # Каждые 10 минут: задания, брошенные упавшими воркерами
+    },
+    'reconcile-dashboard-counters': {
+        'task': 'universal_admin.tasks.reconcile_dashboard_counters',
+        'schedule': crontab(minute=30),  # Каждый час: исправляет расхождения после bulk-операций
+    },
+    'deliver-integration-outbox': {
+        'task': 'integration.tasks.deliver_outbox',
+        'schedule': 5.0,  # Каждые 5 секунд: события и метрики интеграции из outbox
+    },
+    'rollup-system-metrics': {
+        'task': 'integration.tasks.rollup_system_metrics',
+        'schedule': 60.0,  # Каждую минуту: агрегаты метрик 1m/1h/1d
+    },
+    'apply-metric-retention': {
+        'task': 'integration.tasks.apply_metric_retention',
+        'schedule': crontab(minute=15),  # Каждый час: удаление метрик старше срока хранения
+    },
+    'resume-telegram-broadcasts': {
+        'task': 'veles_drive.tasks.resume_broadcasts',
+        'schedule': 60.0,  # Every minute: resume broadcast chunks of crashed workers
+    },
+    'schedule-telegram-updates': {
+        'task': 'telegram_bot.tasks.schedule_pending_updates',
+        'schedule': 30.0,  # Каждые 30 секунд: очереди обновлений Telegram без воркера
+    },
+    'flush-telegram-identity-updates': {
+        'task': 'telegram_bot.tasks.flush_identity_updates',
+        'schedule': 30.0,  # Каждые 30 секунд: изменения профилей пользователей и чатов Telegram
+    },
+    'snapshot-telegram-states': {
+        'task': 'telegram_bot.tasks.snapshot_states',
+        'schedule': 60.0,  # Каждую минуту: снимок состояний диалогов Telegram в базу
+    },
 }
 
 @app.task(bind=True)
@@ -0,0 +1,92 @@
+import json
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from django.core.management.base import BaseCommand
+from veles_drive.services.telegram_client import TelegramClient
+
+BENCHMARK_TOKEN = '123456:benchmark'
+
+
+class StandInTelegramHandler(BaseHTTPRequestHandler):
+    """Answers every Bot API method with a successful sendMessage result"""
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in one packet, so keep-alive requests do not
+    # stall on Nagle's algorithm and delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'ok': True, 'result': {'message_id': 1, 'chat': {'id': 1}}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Measure Telegram messages/sec against a local stand-in Bot API: bare requests.post vs the pooled client'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help='Messages per mode')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent senders')
+        parser.add_argument(
+            '--certfile',
+            help='PEM file with certificate and key to serve over TLS, so handshakes are included'
+        )
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StandInTelegramHandler)
+        scheme = 'http'
+        if options['certfile']:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(options['certfile'])
+            server.socket = context.wrap_socket(server.socket, server_side=True)
+            scheme = 'https'
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_url = f'{scheme}://127.0.0.1:{server.server_address[1]}'
+        base_url = f'{api_url}/bot{BENCHMARK_TOKEN}'
+        total = options['messages']
+        threads = options['threads']
+        self.stdout.write(f'Stand-in Bot API at {api_url}, messages per mode: {total}, threads: {threads}')
+
+        # The stand-in certificate is self-signed
+        verify = scheme == 'http'
+        try:
+            def bare(index):
+                # Previous behaviour: a new connection for every message
+                return requests.post(
+                    f'{base_url}/sendMessage', data={'chat_id': index, 'text': 'benchmark'}, verify=verify
+                )
+
+            client = TelegramClient(BENCHMARK_TOKEN, api_url=api_url, pool_size=threads)
+
+            def pooled(index):
+                return client.post('sendMessage', data={'chat_id': index, 'text': 'benchmark'}, verify=verify)
+
+            before = self.run(bare, total, threads)
+            after = self.run(pooled, total, threads)
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(f'requests.post per message: {before:.0f} messages/sec')
+        self.stdout.write(f'pooled TelegramClient: {after:.0f} messages/sec (x{after / before:.1f})')
+
+    def run(self, send, total, threads):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for response in executor.map(send, range(total)):
+                response.raise_for_status()
+        return total / (time.perf_counter() - started)
@@ -0,0 +1,69 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from veles_drive.middleware import AnalyticsMiddleware
+from veles_drive.models import PageView
+from veles_drive.services.ingestion import PageViewBuffer
+
+class DirectPageViewBuffer(PageViewBuffer):
+    """Baseline: one INSERT per request, as before buffering was introduced"""
+
+    def push(self, page_view):
+        PageView.objects.create(**page_view)
+        return True
+
+    def touch_session(self, session_id, timestamp=None):
+        pass
+
+class Command(BaseCommand):
+    help = 'Measure request latency through AnalyticsMiddleware with analytics disabled, buffered and direct'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients')
+
+    def handle(self, *args, **options):
+        self.factory = RequestFactory()
+        total = options['requests']
+        threads = options['threads']
+
+        self.stdout.write(f'Requests per mode: {total}, threads: {threads}')
+        with override_settings(ANALYTICS_ENABLED=False):
+            self.report('disabled', self.run(self.build_chain(), total, threads))
+        self.report('buffered', self.run(self.build_chain(), total, threads))
+
+        started = time.perf_counter()
+        written = PageViewBuffer().flush()
+        self.stdout.write(f'Flushed {written} buffered page views in {(time.perf_counter() - started) * 1000:.0f} ms')
+
+        self.report('direct INSERT', self.run(self.build_chain(DirectPageViewBuffer()), total, threads))
+
+    def build_chain(self, buffer=None):
+        analytics = AnalyticsMiddleware(lambda request: HttpResponse('ok'))
+        if buffer is not None:
+            analytics.buffer = buffer
+        return SessionMiddleware(AuthenticationMiddleware(analytics))
+
+    def run(self, chain, total, threads):
+        def request(index):
+            http_request = self.factory.get(f'/cars/{index % 100}/', HTTP_USER_AGENT='loadtest')
+            started = time.perf_counter()
+            chain(http_request)
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(request, range(total)))
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+        quantiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(
+            f'{label}: mean {statistics.mean(timings) * 1000:.2f} ms, '
+            f'p50 {quantiles[49] * 1000:.2f} ms, p95 {quantiles[94] * 1000:.2f} ms, '
+            f'p99 {quantiles[98] * 1000:.2f} ms'
+        )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from veles_drive.services.analytics import _start_of_day
+from veles_drive.services.rollups import ROLLUP_SPECS, count_unique_users, rollup_totals
+from veles_drive.services.sketches import sketches_enabled
+
+class Command(BaseCommand):
+    help = 'Compare HyperLogLog unique-user estimates with exact counts on real analytics data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Period length in days')
+        parser.add_argument('--limit', type=int, default=20, help='Dimensions reported per metric')
+
+    def handle(self, *args, **options):
+        with override_settings(ANALYTICS_UNIQUE_USERS_MODE='approximate'):
+            if not sketches_enabled():
+                raise CommandError('Approximate mode requires django-redis as the default cache')
+
+        start = _start_of_day(options['days'])
+        worst = 0.0
+        for metric in ROLLUP_SPECS:
+            totals = rollup_totals(metric, start)
+            dimensions = sorted(totals, key=lambda dimension: -totals[dimension]['count'])[:options['limit']]
+            with override_settings(ANALYTICS_UNIQUE_USERS_MODE='approximate'):
+                approximate = count_unique_users(metric, start, dimensions)
+            with override_settings(ANALYTICS_UNIQUE_USERS_MODE='exact'):
+                exact = count_unique_users(metric, start, dimensions)
+
+            self.stdout.write(f'{metric}:')
+            for dimension in dimensions:
+                expected = exact.get(dimension, 0)
+                estimate = approximate.get(dimension, 0)
+                error = abs(estimate - expected) / expected * 100 if expected else 0.0
+                worst = max(worst, error)
+                self.stdout.write(f'  {dimension or "-"}: exact {expected}, estimate {estimate}, error {error:.2f}%')
+
+        self.stdout.write(self.style.SUCCESS(f'Worst relative error: {worst:.2f}%'))
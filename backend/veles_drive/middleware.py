@@ -1,34 +1,38 @@
+from django.conf import settings
 from django.utils import timezone
-from .models import PageView, UserSession
+from .services.ingestion import PageViewBuffer
 import uuid
 
 class AnalyticsMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.buffer = PageViewBuffer()
 
     def __call__(self, request):
+        if not getattr(settings, 'ANALYTICS_ENABLED', True):
+            return self.get_response(request)
+
         # Get or create session ID
         if 'session_id' not in request.session:
             request.session['session_id'] = str(uuid.uuid4())
 
-        # Record page view
+        # Record page view (written in batches by flush_page_views)
         if not request.path.startswith(('/admin/', '/static/', '/media/', '/api/')):
-            PageView.objects.create(
-                path=request.path,
-                user=request.user if request.user.is_authenticated else None,
-                ip_address=self.get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                referrer=request.META.get('HTTP_REFERER', ''),
-                session_id=request.session['session_id']
-            )
+            self.buffer.push({
+                'path': request.path[:255],
+                'user_id': request.user.pk if request.user.is_authenticated else None,
+                'ip_address': self.get_client_ip(request),
+                'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+                'referrer': request.META.get('HTTP_REFERER', ''),
+                'session_id': request.session['session_id'],
+                'timestamp': timezone.now().isoformat(),
+            })
 
         response = self.get_response(request)
 
         # Update session end time
         if request.user.is_authenticated:
-            UserSession.objects.filter(
-                session_id=request.session['session_id']
-            ).update(end_time=timezone.now())
+            self.buffer.touch_session(request.session['session_id'])
 
         return response
 
@@ -7,6 +7,8 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.db.models import Avg
 
+from core.mixins import ChangeTrackingMixin
+
 User = get_user_model()
 
 class Brand(models.Model):
@@ -126,8 +128,11 @@ class ContentBase(models.Model):
         ).count()
         self.save(update_fields=['comments_count', 'reactions_count'])
 
-class Article(ContentBase):
+class Article(ChangeTrackingMixin, ContentBase):
     """Article model"""
+    # Fields of the dashboard counters
+    tracked_fields = ['status']
+
     reading_time = models.PositiveIntegerField(help_text='Estimated reading time in minutes')
     is_featured = models.BooleanField(default=False)
     views_count = models.PositiveIntegerField(default=0)
@@ -135,6 +140,14 @@ class Article(ContentBase):
     def __str__(self):
         return self.title
 
+    class Meta(ContentBase.Meta):
+        indexes = [
+            # Keyset pagination on (ordering field, id)
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['updated_at', 'id']),
+            models.Index(fields=['views_count', 'id']),
+        ]
+
 class ContentImage(models.Model):
     """Image model for articles and news"""
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
@@ -343,15 +356,19 @@ class SEOMetadata(models.Model):
     class Meta:
         unique_together = ['content_type', 'object_id']
 
-class PageView(models.Model):
+class PageView(ChangeTrackingMixin, models.Model):
     """Page view analytics"""
+    # Fields of the dashboard counters
+    tracked_fields = ['timestamp']
+
     path = models.CharField(max_length=255)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     ip_address = models.GenericIPAddressField()
     user_agent = models.TextField()
     referrer = models.URLField(blank=True)
     session_id = models.CharField(max_length=100)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # default instead of auto_now_add: buffered views keep the request time
+    timestamp = models.DateTimeField(default=timezone.now)
     duration = models.PositiveIntegerField(default=0)  # Time spent on page in seconds
     is_bounce = models.BooleanField(default=False)
 
@@ -420,6 +437,92 @@ class Conversion(models.Model):
     class Meta:
         ordering = ['-timestamp']
 
+class AnalyticsRollup(models.Model):
+    """Pre-aggregated analytics counters per hour or day (see services.rollups)"""
+    PERIOD_HOUR = 'hour'
+    PERIOD_DAY = 'day'
+    PERIODS = [
+        (PERIOD_HOUR, 'Hour'),
+        (PERIOD_DAY, 'Day'),
+    ]
+
+    metric = models.CharField(max_length=50)
+    period = models.CharField(max_length=10, choices=PERIODS)
+    bucket = models.DateTimeField()  # Start of the hour or day
+    dimension = models.CharField(max_length=255, blank=True)  # Path, referrer, conversion type
+    count = models.PositiveBigIntegerField(default=0)
+    value_sum = models.DecimalField(max_digits=20, decimal_places=2, default=0)  # Duration, results, value
+    flag_sum = models.PositiveBigIntegerField(default=0)  # Bounces, successful searches
+
+    def __str__(self):
+        return f"{self.metric} {self.period} {self.bucket:%Y-%m-%d %H:%M} {self.dimension}"
+
+    class Meta:
+        unique_together = ('metric', 'period', 'bucket', 'dimension')
+        indexes = [
+            models.Index(fields=['metric', 'period', 'bucket']),
+        ]
+
+class AnalyticsWatermark(models.Model):
+    """Last raw row id already folded into AnalyticsRollup for a metric"""
+    metric = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    # Missing ids up to settled_id belong to rolled back transactions
+    settled_id = models.BigIntegerField(default=0)
+    # Highest id seen at pending_since; it becomes settled_id once ROLLUP_SETTLE passes
+    pending_high_id = models.BigIntegerField(default=0)
+    pending_since = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.metric}: {self.last_id}"
+
+class TelegramBroadcast(models.Model):
+    """Message sent to many Telegram chats in chunks (see services.broadcast)"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUSES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+    ]
+
+    message = models.TextField()
+    parse_mode = models.CharField(max_length=20, default='HTML')
+    status = models.CharField(max_length=20, choices=STATUSES, default=STATUS_PENDING)
+    total = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Broadcast {self.pk} to {self.total} chats ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+
+class TelegramBroadcastChunk(models.Model):
+    """Slice of broadcast recipients sent by one Celery task; position is the resume point"""
+    broadcast = models.ForeignKey(TelegramBroadcast, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    recipients = models.JSONField(default=list)  # Chat ids
+    position = models.PositiveIntegerField(default=0)  # Recipients already processed
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)  # Last errors, capped
+    status = models.CharField(max_length=20, choices=TelegramBroadcast.STATUSES, default=TelegramBroadcast.STATUS_PENDING)
+    heartbeat = models.DateTimeField(null=True, blank=True)  # Refreshed by the running task while it sends
+    claim_token = models.CharField(max_length=32, blank=True)  # Identifies the task that claimed the chunk
+
+    def __str__(self):
+        return f"Broadcast {self.broadcast_id} chunk {self.index}: {self.position}/{len(self.recipients)}"
+
+    class Meta:
+        unique_together = ('broadcast', 'index')
+        indexes = [
+            models.Index(fields=['status', 'heartbeat']),
+        ]
+
 class ABTest(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -1,23 +1,41 @@
 from django.db.models import Count, Avg, Sum
 from django.utils import timezone
 from datetime import timedelta
-from ..models import PageView, UserSession, SearchQuery, Conversion
+from ..models import UserSession, AnalyticsRollup
+from .rollups import rollup_totals, rollup_buckets, count_unique_users, average
+
+def _start_of_day(days):
+    """Start of the local day N days ago - the boundary of daily rollups"""
+    start = timezone.localtime() - timedelta(days=days)
+    return start.replace(hour=0, minute=0, second=0, microsecond=0)
 
 class AnalyticsService:
+    """
+    Analytics over daily rollups (services.rollups) merged with raw rows that
+    have not been rolled up yet. Periods start at local midnight N days ago.
+    Sessions and retention read UserSession directly: its rows are updated
+    after insert and cannot be folded incrementally. unique_users is exact or
+    HyperLogLog-estimated depending on ANALYTICS_UNIQUE_USERS_MODE.
+    """
+
     @staticmethod
     def get_page_views_stats(days=30):
         """Get page views statistics for the last N days"""
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        return PageView.objects.filter(
-            timestamp__range=(start_date, end_date)
-        ).values('path').annotate(
-            views=Count('id'),
-            unique_users=Count('user', distinct=True),
-            avg_duration=Avg('duration'),
-            bounce_rate=Avg('is_bounce') * 100
-        ).order_by('-views')
+        start_date = _start_of_day(days)
+        totals = rollup_totals('page_views', start_date)
+        unique_users = count_unique_users('page_views', start_date, totals)
+
+        stats = [
+            {
+                'path': path,
+                'views': total['count'],
+                'unique_users': unique_users.get(path, 0),
+                'avg_duration': average(total, 'value_sum'),
+                'bounce_rate': average(total, 'flag_sum', 100),
+            }
+            for path, total in totals.items()
+        ]
+        return sorted(stats, key=lambda item: -item['views'])
 
     @staticmethod
     def get_user_sessions_stats(days=30):
@@ -38,80 +56,94 @@ class AnalyticsService:
     @staticmethod
     def get_search_stats(days=30):
         """Get search statistics for the last N days"""
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        return SearchQuery.objects.filter(
-            timestamp__range=(start_date, end_date)
-        ).aggregate(
-            total_searches=Count('id'),
-            unique_users=Count('user', distinct=True),
-            avg_results=Avg('results_count'),
-            success_rate=Avg('is_successful') * 100
-        )
+        start_date = _start_of_day(days)
+        total = rollup_totals('searches', start_date).get('', {'count': 0})
+
+        return {
+            'total_searches': total['count'],
+            'unique_users': count_unique_users('searches', start_date).get('', 0),
+            'avg_results': average(total, 'value_sum'),
+            'success_rate': average(total, 'flag_sum', 100),
+        }
 
     @staticmethod
     def get_conversion_stats(days=30):
         """Get conversion statistics for the last N days"""
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        return Conversion.objects.filter(
-            timestamp__range=(start_date, end_date)
-        ).values('conversion_type').annotate(
-            count=Count('id'),
-            total_value=Sum('value'),
-            unique_users=Count('user', distinct=True)
-        ).order_by('-count')
+        start_date = _start_of_day(days)
+        totals = rollup_totals('conversions', start_date)
+        unique_users = count_unique_users('conversions', start_date, totals)
+
+        stats = [
+            {
+                'conversion_type': conversion_type,
+                'count': total['count'],
+                'total_value': total['value_sum'],
+                'unique_users': unique_users.get(conversion_type, 0),
+            }
+            for conversion_type, total in totals.items()
+        ]
+        return sorted(stats, key=lambda item: -item['count'])
 
     @staticmethod
     def get_traffic_sources(days=30):
         """Get traffic sources statistics for the last N days"""
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        return PageView.objects.filter(
-            timestamp__range=(start_date, end_date)
-        ).exclude(
-            referrer=''
-        ).values('referrer').annotate(
-            visits=Count('id'),
-            unique_users=Count('user', distinct=True)
-        ).order_by('-visits')
+        start_date = _start_of_day(days)
+        totals = rollup_totals('referrers', start_date)
+        unique_users = count_unique_users('referrers', start_date, totals)
+
+        stats = [
+            {
+                'referrer': referrer,
+                'visits': total['count'],
+                'unique_users': unique_users.get(referrer, 0),
+            }
+            for referrer, total in totals.items()
+        ]
+        return sorted(stats, key=lambda item: -item['visits'])
 
     @staticmethod
     def get_user_behavior(days=30):
         """Get user behavior statistics for the last N days"""
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
+        start_date = _start_of_day(days)
+
+        def total_count(metric):
+            return sum(total['count'] for total in rollup_totals(metric, start_date).values())
+
         return {
-            'page_views': PageView.objects.filter(
-                timestamp__range=(start_date, end_date)
-            ).count(),
+            'page_views': total_count('page_views'),
             'sessions': UserSession.objects.filter(
-                start_time__range=(start_date, end_date)
-            ).count(),
-            'searches': SearchQuery.objects.filter(
-                timestamp__range=(start_date, end_date)
+                start_time__gte=start_date
             ).count(),
-            'conversions': Conversion.objects.filter(
-                timestamp__range=(start_date, end_date)
-            ).count()
+            'searches': total_count('searches'),
+            'conversions': total_count('conversions')
         }
 
     @staticmethod
     def get_popular_content(days=30, limit=10):
         """Get most popular content for the last N days"""
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        return PageView.objects.filter(
-            timestamp__range=(start_date, end_date)
-        ).values('path').annotate(
-            views=Count('id'),
-            avg_duration=Avg('duration')
-        ).order_by('-views')[:limit]
+        start_date = _start_of_day(days)
+        totals = rollup_totals('page_views', start_date)
+
+        stats = [
+            {
+                'path': path,
+                'views': total['count'],
+                'avg_duration': average(total, 'value_sum'),
+            }
+            for path, total in totals.items()
+        ]
+        return sorted(stats, key=lambda item: -item['views'])[:limit]
+
+    @staticmethod
+    def get_hourly_page_views(hours=24):
+        """Get page views per hour for the last N hours, including rows not yet rolled up"""
+        start_date = (timezone.now() - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+        totals = rollup_buckets('page_views', start_date, AnalyticsRollup.PERIOD_HOUR)
+
+        return [
+            {'bucket': bucket, 'views': total['count']}
+            for bucket, total in sorted(totals.items())
+        ]
 
     @staticmethod
     def get_user_retention(days=30):
@@ -0,0 +1,337 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from typing import Iterable, Optional
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from ..models import TelegramBroadcast, TelegramBroadcastChunk
+from .redis_client import get_redis_connection_or_none
+from .telegram_client import get_telegram_client
+
+logger = logging.getLogger(__name__)
+
+SEND_CHUNK_TASK_NAME = 'veles_drive.tasks.send_broadcast_chunk'
+
+# Telegram limits: about 30 messages/sec per bot and 1 message/sec per chat
+GLOBAL_RATE = 30
+CHAT_INTERVAL = 1.0
+# Tokens the global bucket can hold; a small burst keeps any one-second
+# window close to GLOBAL_RATE
+GLOBAL_BURST = 3
+CHUNK_SIZE = 500
+# Concurrent senders per chunk task; the global bucket caps the total rate
+SENDER_THREADS = 8
+# Progress is saved after every window of recipients, so a crashed task
+# resends at most one window
+PROGRESS_WINDOW = 50
+MAX_ERRORS = 100
+# The sending task refreshes its heartbeat this often (in seconds), even
+# while its senders wait on the rate limits
+HEARTBEAT_INTERVAL = 30
+# A running chunk whose heartbeat is older than this is considered crashed
+STALE_AFTER = timedelta(minutes=2)
+
+# Token bucket shared by all workers. Uses the Redis clock, so workers with
+# skewed clocks agree. Returns the number of seconds to wait (0 when a token
+# was taken) as a string, since Lua numbers are truncated to integers.
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'paused_until')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+local paused_until = tonumber(state[3]) or 0
+if now < paused_until then
+    return tostring(paused_until - now)
+end
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], 60)
+return tostring(wait)
+"""
+
+PAUSE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local until_ts = now + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0
+if until_ts > current then
+    redis.call('HSET', KEYS[1], 'paused_until', tostring(until_ts))
+end
+redis.call('EXPIRE', KEYS[1], 60 + math.ceil(tonumber(ARGV[1])))
+return 1
+"""
+
+
+class BroadcastRateLimiter:
+    """
+    Global and per-chat rate limits for broadcast senders.
+
+    The global limit is a token bucket holding GLOBAL_BURST tokens that
+    refill at GLOBAL_RATE per second; the per-chat limit is a key that expires after
+    CHAT_INTERVAL. Both live in Redis, so every worker and thread sending a
+    broadcast shares them. A 429 from Telegram pauses the global bucket for
+    the retry_after period, which stops all senders rather than just the one
+    that was throttled.
+
+    Without Redis the limits are kept in process memory and only apply to
+    the threads of one worker.
+    """
+    bucket_key = 'telegram:broadcast:bucket'
+    chat_key = 'telegram:broadcast:chat:{}'
+
+    _local_lock = threading.Lock()
+    _local_tokens = float(GLOBAL_BURST)
+    _local_updated = time.monotonic()
+    _local_paused_until = 0.0
+    _local_chats = {}
+
+    def __init__(self, rate: int = GLOBAL_RATE, burst: int = GLOBAL_BURST, chat_interval: float = CHAT_INTERVAL):
+        self.rate = rate
+        self.burst = burst
+        self.chat_interval = chat_interval
+        self.redis = get_redis_connection_or_none()
+        if self.redis is not None:
+            self._take_token = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+            self._pause = self.redis.register_script(PAUSE_SCRIPT)
+
+    def acquire(self, chat_id):
+        """Block until a message may be sent to chat_id"""
+        while True:
+            wait = self._chat_wait(chat_id)
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        while True:
+            wait = self._global_wait()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Stop all senders for seconds, e.g. after a 429 with retry_after"""
+        if self.redis is not None:
+            self._pause(keys=[self.bucket_key], args=[seconds])
+            return
+        with self._local_lock:
+            until = time.monotonic() + seconds
+            BroadcastRateLimiter._local_paused_until = max(self._local_paused_until, until)
+
+    def _global_wait(self) -> float:
+        if self.redis is not None:
+            return float(self._take_token(keys=[self.bucket_key], args=[self.rate, self.burst]))
+        with self._local_lock:
+            now = time.monotonic()
+            if now < self._local_paused_until:
+                return self._local_paused_until - now
+            tokens = min(self.burst, self._local_tokens + (now - self._local_updated) * self.rate)
+            BroadcastRateLimiter._local_updated = now
+            if tokens >= 1:
+                BroadcastRateLimiter._local_tokens = tokens - 1
+                return 0
+            BroadcastRateLimiter._local_tokens = tokens
+            return (1 - tokens) / self.rate
+
+    def _chat_wait(self, chat_id) -> float:
+        if self.redis is not None:
+            key = self.chat_key.format(chat_id)
+            if self.redis.set(key, 1, px=int(self.chat_interval * 1000), nx=True):
+                return 0
+            return max(self.redis.pttl(key), 1) / 1000
+        with self._local_lock:
+            now = time.monotonic()
+            next_allowed = self._local_chats.get(chat_id, 0)
+            if now >= next_allowed:
+                self._local_chats[chat_id] = now + self.chat_interval
+                return 0
+            return next_allowed - now
+
+
+def start_broadcast(chat_ids: Iterable[int], message: str, parse_mode: str = 'HTML',
+                    chunk_size: int = CHUNK_SIZE) -> TelegramBroadcast:
+    """
+    Create a broadcast and queue one Celery task per chunk of recipients.
+
+    Duplicate chat ids are sent once. Tasks are queued after the transaction
+    commits, so workers always find the chunks they were given.
+    """
+    chat_ids = list(dict.fromkeys(chat_ids))
+    with transaction.atomic():
+        broadcast = TelegramBroadcast.objects.create(
+            message=message,
+            parse_mode=parse_mode,
+            total=len(chat_ids),
+            status=TelegramBroadcast.STATUS_RUNNING if chat_ids else TelegramBroadcast.STATUS_COMPLETED,
+            finished_at=None if chat_ids else timezone.now()
+        )
+        TelegramBroadcastChunk.objects.bulk_create([
+            TelegramBroadcastChunk(broadcast=broadcast, index=index, recipients=chat_ids[start:start + chunk_size])
+            for index, start in enumerate(range(0, len(chat_ids), chunk_size))
+        ])
+        chunk_ids = list(broadcast.chunks.values_list('pk', flat=True))
+        transaction.on_commit(lambda: queue_chunks(chunk_ids))
+    return broadcast
+
+
+def queue_chunks(chunk_ids: Iterable[int]):
+    try:
+        from celery import current_app
+        for chunk_id in chunk_ids:
+            current_app.send_task(SEND_CHUNK_TASK_NAME, args=(chunk_id,))
+    except Exception as e:
+        # resume_broadcasts picks pending chunks up
+        logger.warning(f'Failed to queue broadcast chunks: {e}')
+
+
+def claim_chunk(chunk_id: int) -> Optional[str]:
+    """
+    Mark a chunk as running if it is pending or its previous task crashed.
+
+    The conditional UPDATE makes sure only one task sends a chunk at a time.
+    Returns the claim token that the task's later updates are conditional
+    on, or None if the chunk is taken.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    claimed = TelegramBroadcastChunk.objects.filter(
+        Q(status=TelegramBroadcast.STATUS_PENDING) |
+        Q(status=TelegramBroadcast.STATUS_RUNNING, heartbeat__lt=now - STALE_AFTER) |
+        Q(status=TelegramBroadcast.STATUS_RUNNING, heartbeat__isnull=True),
+        pk=chunk_id
+    ).update(status=TelegramBroadcast.STATUS_RUNNING, heartbeat=now, claim_token=token)
+    return token if claimed else None
+
+
+def send_chunk(chunk_id: int, limiter: Optional[BroadcastRateLimiter] = None,
+               threads: int = SENDER_THREADS) -> int:
+    """
+    Send one chunk of a broadcast, resuming from its saved position.
+
+    Recipients are sent concurrently by a thread pool over the shared
+    keep-alive client, each send waiting for the global and per-chat rate
+    limits. Position and counters are saved after every PROGRESS_WINDOW
+    recipients, and the heartbeat is refreshed every HEARTBEAT_INTERVAL
+    while a window is in flight. Every update is conditional on the claim
+    token: if resume_broadcasts handed the chunk to another task, this one
+    stops. Returns the number of recipients processed by this call.
+    """
+    token = claim_chunk(chunk_id)
+    if token is None:
+        return 0
+    chunk = TelegramBroadcastChunk.objects.select_related('broadcast').get(pk=chunk_id)
+    broadcast = chunk.broadcast
+    owned = TelegramBroadcastChunk.objects.filter(pk=chunk.pk, claim_token=token)
+    limiter = limiter or BroadcastRateLimiter()
+    client = get_telegram_client(settings.TELEGRAM_BOT_TOKEN)
+    lost = threading.Event()
+
+    def send_one(chat_id):
+        limiter.acquire(chat_id)
+        if lost.is_set():
+            return None
+        try:
+            response = client.post('sendMessage', json={
+                'chat_id': chat_id,
+                'text': broadcast.message,
+                'parse_mode': broadcast.parse_mode
+            }, on_retry_after=limiter.pause)
+            result = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return f'User {chat_id}: {str(e)}'
+        if result.get('ok'):
+            return None
+        return f'User {chat_id}: {result.get("description", response.status_code)}'
+
+    processed = 0
+    position = chunk.position
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while position < len(chunk.recipients):
+            window = chunk.recipients[position:position + PROGRESS_WINDOW]
+            futures = [executor.submit(send_one, chat_id) for chat_id in window]
+            # Database writes stay on this thread; senders only talk to Telegram
+            while wait(futures, timeout=HEARTBEAT_INTERVAL).not_done:
+                if not owned.update(heartbeat=timezone.now()):
+                    lost.set()
+            if lost.is_set():
+                break
+            errors = [error for error in (future.result() for future in futures) if error]
+            position += len(window)
+            chunk.errors = (chunk.errors + errors)[:MAX_ERRORS]
+            if not owned.update(
+                position=position,
+                sent=F('sent') + len(window) - len(errors),
+                failed=F('failed') + len(errors),
+                errors=chunk.errors,
+                heartbeat=timezone.now()
+            ):
+                lost.set()
+                break
+            processed += len(window)
+
+    if lost.is_set():
+        logger.warning(f'Broadcast chunk {chunk_id} was claimed by another task, stopping')
+        return processed
+    owned.update(status=TelegramBroadcast.STATUS_COMPLETED)
+    finish_broadcast(broadcast.pk)
+    return processed
+
+
+def finish_broadcast(broadcast_id: int):
+    """Mark the broadcast completed once none of its chunks are left"""
+    unfinished = TelegramBroadcastChunk.objects.filter(broadcast_id=broadcast_id).exclude(
+        status=TelegramBroadcast.STATUS_COMPLETED
+    )
+    if not unfinished.exists():
+        TelegramBroadcast.objects.filter(pk=broadcast_id).exclude(
+            status=TelegramBroadcast.STATUS_COMPLETED
+        ).update(status=TelegramBroadcast.STATUS_COMPLETED, finished_at=timezone.now())
+
+
+def resume_broadcasts() -> int:
+    """
+    Requeue chunks whose task crashed or was never delivered to a worker.
+
+    Returns the number of chunks queued again.
+    """
+    now = timezone.now()
+    chunk_ids = list(TelegramBroadcastChunk.objects.filter(
+        Q(status=TelegramBroadcast.STATUS_RUNNING, heartbeat__lt=now - STALE_AFTER) |
+        Q(status=TelegramBroadcast.STATUS_PENDING, broadcast__created_at__lt=now - STALE_AFTER)
+    ).values_list('pk', flat=True))
+    queue_chunks(chunk_ids)
+    return len(chunk_ids)
+
+
+def broadcast_stats(broadcast: TelegramBroadcast) -> dict:
+    """Live delivery stats of a broadcast, summed over its chunks"""
+    totals = broadcast.chunks.aggregate(processed=Sum('position'), success=Sum('sent'), failed=Sum('failed'))
+    processed = totals['processed'] or 0
+    elapsed = ((broadcast.finished_at or timezone.now()) - broadcast.created_at).total_seconds()
+    errors = []
+    for chunk_errors in broadcast.chunks.order_by('index').values_list('errors', flat=True):
+        errors.extend(chunk_errors)
+    return {
+        'broadcast_id': broadcast.pk,
+        'status': broadcast.status,
+        'total': broadcast.total,
+        'processed': processed,
+        'pending': broadcast.total - processed,
+        'success': totals['success'] or 0,
+        'failed': totals['failed'] or 0,
+        'errors': errors[:MAX_ERRORS],
+        'messages_per_second': round(processed / elapsed, 2) if elapsed > 0 else 0,
+    }
@@ -0,0 +1,213 @@
+import json
+import logging
+import threading
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from ..models import PageView, UserSession
+from .redis_client import get_redis_connection_or_none
+
+logger = logging.getLogger(__name__)
+
+FLUSH_TASK_NAME = 'veles_drive.tasks.flush_page_views'
+
+# bulk_create does not send post_save; receivers get the written batch as page_views
+page_views_flushed = Signal()
+
+# One flush drains the buffer at a time; the lock is extended after every batch
+FLUSH_LOCK_TIMEOUT = 60
+
+# Drop a written batch from the head of the list, only while holding the lock
+ACK_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('LTRIM', KEYS[2], ARGV[2], -1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class PageViewBuffer:
+    """
+    Bounded buffer of page views written to the database in batches.
+
+    Page views are pushed to a Redis list by AnalyticsMiddleware and drained
+    with bulk_create by the flush_page_views Celery task. The buffer is
+    bounded by ANALYTICS_BUFFER_MAX_SIZE: when the worker falls behind, new
+    page views are dropped and counted instead of slowing requests down.
+    Session end times are collapsed in a hash, so each session is updated
+    once per flush regardless of how many requests it made.
+
+    A batch stays at the head of the list until its insert has committed,
+    so a failed or crashed flush leaves it for the next one. Flushes take a
+    lock, because a batch is identified by its position in the list.
+
+    Without Redis (e.g. locmem cache in development) the buffer lives in
+    process memory and is flushed inline by the request that fills a batch.
+    """
+    page_views_key = 'analytics:page_views'
+    sessions_key = 'analytics:session_ends'
+    dropped_key = 'analytics:page_views_dropped'
+    flush_lock_key = 'analytics:page_views_flush_lock'
+
+    _local_page_views = deque()
+    _local_sessions = {}
+    _local_dropped = 0
+    _local_lock = threading.Lock()
+    _local_flush_lock = threading.Lock()
+
+    def __init__(self, max_size: Optional[int] = None, batch_size: Optional[int] = None):
+        self.max_size = max_size or getattr(settings, 'ANALYTICS_BUFFER_MAX_SIZE', 10000)
+        self.batch_size = batch_size or getattr(settings, 'ANALYTICS_FLUSH_BATCH_SIZE', 500)
+        self.redis = get_redis_connection_or_none()
+
+    def push(self, page_view: Dict[str, Any]) -> bool:
+        """Buffer a page view; returns False if it was dropped because the buffer is full"""
+        payload = json.dumps(page_view)
+        if self.redis is None:
+            with self._local_lock:
+                if len(self._local_page_views) >= self.max_size:
+                    PageViewBuffer._local_dropped += 1
+                    return False
+                self._local_page_views.append(payload)
+                length = len(self._local_page_views)
+        else:
+            length = self.redis.rpush(self.page_views_key, payload)
+            if length > self.max_size:
+                # Backpressure: undo the push instead of growing without bound
+                pipe = self.redis.pipeline()
+                pipe.rpop(self.page_views_key)
+                pipe.incr(self.dropped_key)
+                pipe.execute()
+                return False
+
+        if length % self.batch_size == 0:
+            self.schedule_flush()
+        return True
+
+    def touch_session(self, session_id: str, timestamp=None):
+        """Remember the latest activity time of a session"""
+        value = (timestamp or timezone.now()).isoformat()
+        if self.redis is None:
+            with self._local_lock:
+                self._local_sessions[session_id] = value
+        else:
+            self.redis.hset(self.sessions_key, session_id, value)
+
+    def schedule_flush(self):
+        if self.redis is None:
+            self.flush()
+            return
+        try:
+            from celery import current_app
+            current_app.send_task(FLUSH_TASK_NAME)
+        except Exception as e:
+            # The periodic flush will pick the batch up
+            logger.warning(f'Failed to schedule page view flush: {e}')
+
+    def acquire_flush_lock(self) -> Optional[str]:
+        """Returns a lock token, or None while another flush is running"""
+        if self.redis is None:
+            return 'local' if self._local_flush_lock.acquire(blocking=False) else None
+        token = uuid.uuid4().hex
+        if not self.redis.set(self.flush_lock_key, token, nx=True, ex=FLUSH_LOCK_TIMEOUT):
+            return None
+        return token
+
+    def release_flush_lock(self, token: str):
+        if self.redis is None:
+            self._local_flush_lock.release()
+        else:
+            self.redis.register_script(RELEASE_SCRIPT)(keys=[self.flush_lock_key], args=[token])
+
+    def peek_batch(self) -> List[Dict[str, Any]]:
+        """The oldest buffered page views, left in the buffer until ack_batch"""
+        if self.redis is None:
+            with self._local_lock:
+                items = list(islice(self._local_page_views, self.batch_size))
+        else:
+            items = self.redis.lrange(self.page_views_key, 0, self.batch_size - 1)
+        return [json.loads(item) for item in items]
+
+    def ack_batch(self, token: str, count: int) -> bool:
+        """Remove a written batch; False if the flush lock expired meanwhile"""
+        if self.redis is None:
+            with self._local_lock:
+                for _ in range(count):
+                    self._local_page_views.popleft()
+            return True
+        ack = self.redis.register_script(ACK_SCRIPT)
+        return bool(ack(keys=[self.flush_lock_key, self.page_views_key], args=[token, count, FLUSH_LOCK_TIMEOUT]))
+
+    def pop_sessions(self) -> Dict[str, str]:
+        if self.redis is None:
+            with self._local_lock:
+                sessions = dict(self._local_sessions)
+                self._local_sessions.clear()
+            return sessions
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hgetall(self.sessions_key)
+        pipe.delete(self.sessions_key)
+        sessions = pipe.execute()[0]
+        return {key.decode(): value.decode() for key, value in sessions.items()}
+
+    def dropped_count(self) -> int:
+        if self.redis is None:
+            return self._local_dropped
+        return int(self.redis.get(self.dropped_key) or 0)
+
+    def flush(self, max_batches: Optional[int] = None) -> int:
+        """Write buffered page views and session end times, returns the number of page views written"""
+        token = self.acquire_flush_lock()
+        if token is None:
+            # The running flush drains the buffer
+            return 0
+        written = 0
+        batches = 0
+        try:
+            while max_batches is None or batches < max_batches:
+                batch = self.peek_batch()
+                if not batch:
+                    break
+                with transaction.atomic():
+                    page_views = PageView.objects.bulk_create([
+                        PageView(
+                            path=item['path'],
+                            user_id=item['user_id'],
+                            ip_address=item['ip_address'],
+                            user_agent=item['user_agent'],
+                            referrer=item['referrer'],
+                            session_id=item['session_id'],
+                            timestamp=parse_datetime(item['timestamp']),
+                        )
+                        for item in batch
+                    ], batch_size=self.batch_size)
+                    page_views_flushed.send(sender=PageView, page_views=page_views)
+                written += len(batch)
+                batches += 1
+                if not self.ack_batch(token, len(batch)):
+                    logger.warning('Page view flush lock expired, leaving the rest to the next flush')
+                    break
+
+            sessions = self.pop_sessions()
+            if sessions:
+                user_sessions = list(UserSession.objects.filter(session_id__in=sessions))
+                for user_session in user_sessions:
+                    user_session.end_time = parse_datetime(sessions[user_session.session_id])
+                UserSession.objects.bulk_update(user_sessions, ['end_time'], batch_size=self.batch_size)
+        finally:
+            self.release_flush_lock(token)
+        return written
@@ -0,0 +1,7 @@
+def get_redis_connection_or_none():
+    """Redis connection behind the default cache, or None for non-Redis caches"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
@@ -0,0 +1,248 @@
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum, Value
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from ..models import (
+    PageView, SearchQuery, Conversion, AnalyticsRollup, AnalyticsWatermark
+)
+from . import sketches
+
+# How a raw table is folded into AnalyticsRollup: grouping dimension,
+# summed value and counted boolean flag (None when not applicable)
+RollupSpec = namedtuple('RollupSpec', 'model dimension value flag exclude')
+
+ROLLUP_SPECS = {
+    'page_views': RollupSpec(PageView, 'path', 'duration', 'is_bounce', None),
+    'referrers': RollupSpec(PageView, 'referrer', None, None, Q(referrer='')),
+    'searches': RollupSpec(SearchQuery, None, 'results_count', 'is_successful', None),
+    'conversions': RollupSpec(Conversion, 'conversion_type', 'value', None, None),
+}
+
+# Raw ids are allocated before their transaction commits, so a lower id can
+# appear after a higher one was folded. The watermark stops below a missing
+# id until at least ROLLUP_SETTLE has passed since it was first seen: by then
+# its transaction has committed or rolled back (as in integration.timeseries)
+ROLLUP_SETTLE = timedelta(minutes=5)
+
+PERIOD_TRUNCATES = (
+    (AnalyticsRollup.PERIOD_HOUR, TruncHour),
+    (AnalyticsRollup.PERIOD_DAY, TruncDay),
+)
+
+def _grouped(spec, queryset, *extra_fields):
+    """Count, value sum and flag count of raw rows grouped by the spec dimension"""
+    if spec.exclude is not None:
+        queryset = queryset.exclude(spec.exclude)
+    fields = list(extra_fields)
+    if spec.dimension:
+        fields.append(spec.dimension)
+    aggregates = {'count': Count('id')}
+    if spec.value:
+        aggregates['value_sum'] = Sum(spec.value)
+    if spec.flag:
+        aggregates['flag_sum'] = Count('id', filter=Q(**{spec.flag: True}))
+    return queryset.order_by().values(*fields).annotate(**aggregates)
+
+def _rollup_chunk(metric, spec, low_id, high_id):
+    raw = spec.model.objects.filter(id__gt=low_id, id__lte=high_id)
+    for period, truncate in PERIOD_TRUNCATES:
+        groups = {}
+        for row in _grouped(spec, raw.annotate(bucket=truncate('timestamp')), 'bucket'):
+            key = (row['bucket'], row.get(spec.dimension, '') if spec.dimension else '')
+            groups[key] = row
+
+        existing = {
+            (rollup.bucket, rollup.dimension): rollup
+            for rollup in AnalyticsRollup.objects.filter(
+                metric=metric,
+                period=period,
+                bucket__in={bucket for bucket, _ in groups},
+                dimension__in={dimension for _, dimension in groups},
+            )
+        }
+        to_create = []
+        for key, row in groups.items():
+            rollup = existing.get(key)
+            if rollup is None:
+                rollup = AnalyticsRollup(metric=metric, period=period, bucket=key[0], dimension=key[1])
+                to_create.append(rollup)
+            rollup.count += row['count']
+            rollup.value_sum += Decimal(row.get('value_sum') or 0)
+            rollup.flag_sum += row.get('flag_sum') or 0
+
+        to_update = [rollup for key, rollup in existing.items() if key in groups]
+        AnalyticsRollup.objects.bulk_update(to_update, ['count', 'value_sum', 'flag_sum'], batch_size=1000)
+        AnalyticsRollup.objects.bulk_create(to_create, batch_size=1000)
+
+    if sketches.sketches_enabled():
+        users = _users(spec, raw).annotate(day=TruncDay('timestamp')).values_list('day', 'dimension', 'user_id')
+        sketches.add_users(metric, (
+            (timezone.localtime(day).date(), dimension or '', user_id)
+            for day, dimension, user_id in users.distinct()
+        ))
+
+def _users(spec, queryset):
+    """Raw rows with a user, annotated with the spec dimension as 'dimension'"""
+    queryset = queryset.filter(user__isnull=False).order_by()
+    if spec.exclude is not None:
+        queryset = queryset.exclude(spec.exclude)
+    return queryset.annotate(dimension=F(spec.dimension) if spec.dimension else Value(''))
+
+def _settle(metric: str, high_id: int, now) -> None:
+    """Promote the id seen ROLLUP_SETTLE ago to settled_id and start a new observation"""
+    with transaction.atomic():
+        watermark = AnalyticsWatermark.objects.select_for_update().get(metric=metric)
+        if watermark.pending_since is not None and watermark.pending_since > now - ROLLUP_SETTLE:
+            return
+        if watermark.pending_since is not None:
+            watermark.settled_id = max(watermark.settled_id, watermark.pending_high_id)
+        watermark.pending_high_id = high_id
+        watermark.pending_since = now
+        watermark.save(update_fields=['settled_id', 'pending_high_id', 'pending_since', 'updated_at'])
+
+def _contiguous_end(spec, low_id: int, high_id: int) -> int:
+    """Highest id up to high_id such that every id above low_id up to it exists"""
+    expected = low_id + 1
+    ids = spec.model.objects.filter(id__gt=low_id, id__lte=high_id).order_by('id').values_list('id', flat=True)
+    for row_id in ids.iterator():
+        if row_id != expected:
+            break
+        expected += 1
+    return expected - 1
+
+def update_rollups(chunk_size: int = 50000) -> Dict[str, int]:
+    """
+    Fold raw rows added since the watermark into hourly and daily rollups.
+
+    Every metric is processed in id chunks; each chunk and the watermark
+    advance are committed together, so an interrupted run resumes where it
+    stopped and rows are never counted twice. The watermark row is locked
+    for the duration of a chunk, so concurrent runs wait for each other.
+    Above settled_id the watermark only advances over contiguous ids, so a
+    row whose transaction is still in flight is folded once it commits.
+    Returns how far the watermark advanced (in ids) per metric.
+    """
+    processed = {}
+    now = timezone.now()
+    for metric, spec in ROLLUP_SPECS.items():
+        AnalyticsWatermark.objects.get_or_create(metric=metric)
+        high_id = spec.model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        _settle(metric, high_id, now)
+        processed[metric] = 0
+        while True:
+            with transaction.atomic():
+                watermark = AnalyticsWatermark.objects.select_for_update().get(metric=metric)
+                if watermark.last_id >= high_id:
+                    break
+                chunk_end = min(watermark.last_id + chunk_size, high_id)
+                if chunk_end > watermark.settled_id:
+                    chunk_end = _contiguous_end(spec, max(watermark.last_id, watermark.settled_id), chunk_end)
+                    if chunk_end <= watermark.last_id:
+                        # Held below an id that may still commit
+                        break
+                _rollup_chunk(metric, spec, watermark.last_id, chunk_end)
+                processed[metric] += chunk_end - watermark.last_id
+                watermark.last_id = chunk_end
+                watermark.save(update_fields=['last_id', 'updated_at'])
+    return processed
+
+def get_watermark(metric: str) -> int:
+    return AnalyticsWatermark.objects.filter(metric=metric).values_list('last_id', flat=True).first() or 0
+
+def rollup_totals(metric: str, start, period: str = AnalyticsRollup.PERIOD_DAY) -> Dict[str, dict]:
+    """
+    Totals per dimension since start: rollups plus raw rows after the watermark.
+
+    start must be aligned to the period (start of a day for daily rollups).
+    Only rows not yet folded into rollups - normally the last few minutes of
+    the current day - are aggregated from the raw table.
+    """
+    spec = ROLLUP_SPECS[metric]
+    totals = {}
+
+    def add(dimension, count, value_sum, flag_sum):
+        total = totals.setdefault(dimension, {'count': 0, 'value_sum': Decimal(0), 'flag_sum': 0})
+        total['count'] += count
+        total['value_sum'] += Decimal(value_sum or 0)
+        total['flag_sum'] += flag_sum or 0
+
+    rollups = AnalyticsRollup.objects.filter(
+        metric=metric, period=period, bucket__gte=start
+    ).values('dimension').annotate(
+        count=Sum('count'), value_sum=Sum('value_sum'), flag_sum=Sum('flag_sum')
+    ).order_by()
+    for row in rollups:
+        add(row['dimension'], row['count'], row['value_sum'], row['flag_sum'])
+
+    raw = spec.model.objects.filter(id__gt=get_watermark(metric), timestamp__gte=start)
+    for row in _grouped(spec, raw):
+        dimension = row[spec.dimension] if spec.dimension else ''
+        add(dimension, row['count'], row.get('value_sum'), row.get('flag_sum'))
+    return totals
+
+def rollup_buckets(metric: str, start, period: str = AnalyticsRollup.PERIOD_HOUR) -> Dict:
+    """
+    Totals per bucket since start: rollups plus raw rows after the watermark.
+
+    Same merge as rollup_totals, keyed by the bucket start instead of the
+    dimension, so the current bucket includes rows not yet folded.
+    """
+    spec = ROLLUP_SPECS[metric]
+    truncate = dict(PERIOD_TRUNCATES)[period]
+    totals = {}
+
+    def add(bucket, count, value_sum, flag_sum):
+        total = totals.setdefault(bucket, {'count': 0, 'value_sum': Decimal(0), 'flag_sum': 0})
+        total['count'] += count
+        total['value_sum'] += Decimal(value_sum or 0)
+        total['flag_sum'] += flag_sum or 0
+
+    rollups = AnalyticsRollup.objects.filter(
+        metric=metric, period=period, bucket__gte=start
+    ).values('bucket').annotate(
+        count=Sum('count'), value_sum=Sum('value_sum'), flag_sum=Sum('flag_sum')
+    ).order_by()
+    for row in rollups:
+        add(row['bucket'], row['count'], row['value_sum'], row['flag_sum'])
+
+    raw = spec.model.objects.filter(id__gt=get_watermark(metric), timestamp__gte=start)
+    for row in _grouped(spec, raw.annotate(bucket=truncate('timestamp')), 'bucket'):
+        add(row['bucket'], row['count'], row.get('value_sum'), row.get('flag_sum'))
+    return totals
+
+def average(total: dict, field: str, scale: int = 1) -> Optional[float]:
+    if not total['count']:
+        return None
+    return float(total[field]) / total['count'] * scale
+
+def count_unique_users(metric: str, start, dimensions: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """
+    Distinct users per dimension since start.
+
+    In approximate mode (ANALYTICS_UNIQUE_USERS_MODE, Redis required) daily
+    HyperLogLog sketches are merged with the users of raw rows after the
+    watermark; the standard error is about 0.81%. In exact mode, or without
+    Redis, COUNT(DISTINCT user) runs over the raw table.
+    """
+    spec = ROLLUP_SPECS[metric]
+    raw = spec.model.objects.filter(timestamp__gte=start)
+
+    if not sketches.sketches_enabled():
+        rows = _users(spec, raw).values('dimension').annotate(unique_users=Count('user', distinct=True))
+        return {row['dimension']: row['unique_users'] for row in rows}
+
+    if dimensions is None:
+        dimensions = [''] if spec.dimension is None else []
+    first_day = timezone.localtime(start).date()
+    today = timezone.localdate()
+    days = [first_day + timedelta(days=offset) for offset in range((today - first_day).days + 1)]
+
+    extra_users = {}
+    tail = _users(spec, raw.filter(id__gt=get_watermark(metric))).values_list('dimension', 'user_id').distinct()
+    for dimension, user_id in tail:
+        extra_users.setdefault(dimension, []).append(user_id)
+    return sketches.count_users(metric, days, dimensions, extra_users)
@@ -0,0 +1,80 @@
+import hashlib
+import uuid
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from .redis_client import get_redis_connection_or_none
+
+HLL_KEY_PREFIX = 'analytics:hll'
+
+def sketches_enabled() -> bool:
+    """HyperLogLog counting is used in approximate mode when Redis is available"""
+    mode = getattr(settings, 'ANALYTICS_UNIQUE_USERS_MODE', 'approximate')
+    return mode == 'approximate' and get_redis_connection_or_none() is not None
+
+def sketch_key(metric: str, day: date, dimension: str) -> str:
+    # Paths and referrers can be long, the key stores a digest instead
+    digest = hashlib.md5(dimension.encode()).hexdigest()
+    return f'{HLL_KEY_PREFIX}:{metric}:{day:%Y-%m-%d}:{digest}'
+
+def add_users(metric: str, entries: Iterable[Tuple[date, str, int]]) -> int:
+    """
+    Add user ids to the daily sketches of (day, dimension).
+
+    PFADD is idempotent, so re-processing a chunk after a failed
+    transaction does not inflate the counts. Returns the number of
+    sketches touched.
+    """
+    connection = get_redis_connection_or_none()
+    if connection is None:
+        return 0
+
+    users: Dict[str, List[int]] = {}
+    for day, dimension, user_id in entries:
+        users.setdefault(sketch_key(metric, day, dimension), []).append(user_id)
+
+    ttl = getattr(settings, 'ANALYTICS_SKETCH_TTL_DAYS', 400) * 86400
+    pipe = connection.pipeline(transaction=False)
+    for key, user_ids in users.items():
+        pipe.pfadd(key, *user_ids)
+        pipe.expire(key, ttl)
+    pipe.execute()
+    return len(users)
+
+def count_users(metric: str, days: List[date], dimensions: Iterable[str],
+                extra_users: Optional[Dict[str, List[int]]] = None) -> Dict[str, int]:
+    """
+    Estimated distinct users per dimension over the given days.
+
+    PFCOUNT over several keys counts their union, so any date range is
+    answered by merging daily sketches. extra_users (raw rows that are not
+    in the sketches yet) are added through a temporary sketch.
+    """
+    connection = get_redis_connection_or_none()
+    extra_users = extra_users or {}
+    dimensions = list(dimensions)
+
+    pipe = connection.pipeline(transaction=False)
+    temporary_keys = []
+    for dimension in dimensions:
+        keys = [sketch_key(metric, day, dimension) for day in days]
+        user_ids = extra_users.get(dimension)
+        if user_ids:
+            temporary_key = f'{HLL_KEY_PREFIX}:tmp:{uuid.uuid4().hex}'
+            temporary_keys.append(temporary_key)
+            pipe.pfadd(temporary_key, *user_ids)
+            keys.append(temporary_key)
+        pipe.pfcount(*keys)
+    if temporary_keys:
+        pipe.delete(*temporary_keys)
+    results = pipe.execute()
+
+    # Skip the PFADD replies of temporary sketches, keep PFCOUNT replies
+    counts = []
+    position = 0
+    for dimension in dimensions:
+        if extra_users.get(dimension):
+            position += 1
+        counts.append(results[position])
+        position += 1
+    return dict(zip(dimensions, counts))
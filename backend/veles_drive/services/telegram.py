@@ -4,6 +4,8 @@ from typing import Optional, List
 import requests
 from django.conf import settings
 
+from .telegram_client import get_telegram_client
+
 logger = logging.getLogger(__name__)
 
 class TelegramService:
@@ -13,15 +15,13 @@ class TelegramService:
         self.bot_token = settings.TELEGRAM_BOT_TOKEN
         self.channel_id = settings.TELEGRAM_CHANNEL_ID
         self.channel_username = settings.TELEGRAM_CHANNEL_USERNAME
-        self.base_url = f'https://api.telegram.org/bot{self.bot_token}'
+        # Shared keep-alive client: no new TLS handshake per message
+        self.client = get_telegram_client(self.bot_token)
         
     def _make_request(self, method: str, data: dict) -> Optional[dict]:
         """Make request to Telegram API"""
         try:
-            response = requests.post(
-                f'{self.base_url}/{method}',
-                json=data
-            )
+            response = self.client.post(method, json=data)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -223,21 +223,13 @@ class TelegramService:
         return bool(result and result.get('ok'))
 
     def send_broadcast(self, user_ids: List[int], message: str, parse_mode: str = 'HTML') -> dict:
-        """Send broadcast message to multiple users"""
-        results = {
-            'success': 0,
-            'failed': 0,
-            'errors': []
-        }
-        
-        for user_id in user_ids:
-            try:
-                if self.send_notification(user_id, message, parse_mode):
-                    results['success'] += 1
-                else:
-                    results['failed'] += 1
-            except Exception as e:
-                results['failed'] += 1
-                results['errors'].append(f'User {user_id}: {str(e)}')
-                
-        return results 
\ No newline at end of file
+        """
+        Queue a broadcast message to multiple users.
+
+        Recipients are split into chunks sent concurrently by Celery workers
+        under Telegram's rate limits (see services.broadcast). Returns the
+        broadcast's stats; poll broadcast_stats for live progress.
+        """
+        from .broadcast import start_broadcast, broadcast_stats
+        broadcast = start_broadcast(user_ids, message, parse_mode)
+        return broadcast_stats(broadcast)
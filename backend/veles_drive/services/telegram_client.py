@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = 'https://api.telegram.org'
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (3.05, 15)
+POOL_SIZE = 20
+# Give up on 429 responses that ask to wait longer than this
+MAX_RETRY_AFTER = 30
+
+
+class TelegramClient:
+    """
+    Keep-alive HTTP client for one Telegram bot token.
+
+    All calls share one requests.Session whose connection pool keeps TLS
+    connections open between messages. Connection failures are retried by
+    urllib3 with backoff; 429 responses are retried after the delay from
+    Telegram's retry_after parameter.
+    """
+
+    def __init__(self, token, api_url=None, timeout=DEFAULT_TIMEOUT, max_retries=3, pool_size=POOL_SIZE):
+        api_url = api_url or getattr(settings, 'TELEGRAM_API_URL', TELEGRAM_API_URL)
+        self.base_url = f'{api_url.rstrip("/")}/bot{token}'
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        # Only connection errors are retried here: a read timeout may mean
+        # the message was already delivered
+        retry = Retry(total=max_retries, connect=max_retries, read=0, status=0, backoff_factor=0.3)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, http_method, method, on_retry_after=None, **kwargs):
+        """
+        Call a Bot API method and return the requests.Response.
+
+        on_retry_after(seconds) is called before sleeping on a 429, so callers
+        sharing a rate limit can pause their other senders too.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        url = f'{self.base_url}/{method}'
+        for attempt in range(self.max_retries + 1):
+            response = self.session.request(http_method, url, **kwargs)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            retry_after = self._retry_after(response)
+            if retry_after > MAX_RETRY_AFTER:
+                return response
+            logger.warning(f'Telegram API rate limit on {method}, retrying in {retry_after}s')
+            if on_retry_after is not None:
+                on_retry_after(retry_after)
+            time.sleep(retry_after)
+        return response
+
+    def post(self, method, **kwargs):
+        return self.request('POST', method, **kwargs)
+
+    def get(self, method, **kwargs):
+        return self.request('GET', method, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return int(response.json().get('parameters', {}).get('retry_after', 1))
+        except (ValueError, AttributeError):
+            return int(response.headers.get('Retry-After', 1))
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_telegram_client(token):
+    """
+    Shared client for a bot token in the current process.
+
+    Clients are keyed by process id as well, so a worker forked after a
+    client was created does not reuse the parent's sockets.
+    """
+    key = (os.getpid(), token)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = TelegramClient(token)
+    return client
@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',  # Full-text and trigram vehicle search
 
     # Third party apps
     'rest_framework',
@@ -175,6 +176,16 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Europe/Moscow'
 
+# Analytics ingestion (see veles_drive.services.ingestion.PageViewBuffer)
+ANALYTICS_ENABLED = os.getenv('ANALYTICS_ENABLED', 'True') == 'True'
+ANALYTICS_BUFFER_MAX_SIZE = 10000  # Page views kept before new ones are dropped
+ANALYTICS_FLUSH_BATCH_SIZE = 500  # Page views per bulk_create
+ANALYTICS_UNIQUE_USERS_MODE = os.getenv('ANALYTICS_UNIQUE_USERS_MODE', 'approximate')  # 'approximate' (HyperLogLog) or 'exact'
+ANALYTICS_SKETCH_TTL_DAYS = 400  # Daily unique-user sketches kept in Redis
+
+# Отчеты ERP по дневным снимкам (см. erp.snapshots)
+ERP_REPORT_SNAPSHOTS = os.getenv('ERP_REPORT_SNAPSHOTS', 'True') == 'True'
+
 # Redis settings
 CACHES = {
     'default': {
@@ -186,6 +197,13 @@ CACHES = {
     }
 }
 
+# Stale responses may be served for 1 minute while one worker recomputes them
+CACHE_STALE_TTL = 60
+CACHE_LOCK_TIMEOUT = 30
+
+# Cached response bodies larger than 1 KB are stored zlib-compressed
+CACHE_COMPRESS_MIN_SIZE = 1024
+
 # Session settings
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
@@ -265,6 +283,15 @@ if not DEBUG:
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
 TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID', '')
 TELEGRAM_CHANNEL_USERNAME = os.getenv('TELEGRAM_CHANNEL_USERNAME', '@veles_drive')
+# Sent by Telegram in X-Telegram-Bot-Api-Secret-Token with every webhook update
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')
+# Webhook updates are queued in this many Redis lists, each processed in order
+TELEGRAM_UPDATE_SHARDS = int(os.getenv('TELEGRAM_UPDATE_SHARDS', '16'))
+# Conversation state store: 'redis' or 'database' (see telegram_bot.states)
+TELEGRAM_STATE_BACKEND = os.getenv('TELEGRAM_STATE_BACKEND', 'redis')
+TELEGRAM_STATE_TIMEOUT = int(os.getenv('TELEGRAM_STATE_TIMEOUT', str(24 * 60 * 60)))
+# Copy Redis states to TelegramUserState every minute for durability
+TELEGRAM_STATE_SNAPSHOT = os.getenv('TELEGRAM_STATE_SNAPSHOT', 'True') == 'True'
 
 LOGGING = {
     'version': 1,
@@ -15,6 +15,9 @@ import logging
 from typing import List, Optional
 from .services.telegram import TelegramService
 from .services.seo import SEOService
+from .services.ingestion import PageViewBuffer
+from .services.rollups import update_rollups
+from .services import broadcast
 
 logger = logging.getLogger(__name__)
 
@@ -415,4 +418,36 @@ def optimize_seo_metadata():
     # Optimize news
     news_items = News.objects.all()
     for news in news_items:
-        SEOService.optimize_content_seo('news', news.id) 
\ No newline at end of file
+        SEOService.optimize_content_seo('news', news.id) 
+
+@shared_task(ignore_result=True)
+def flush_page_views(max_batches: Optional[int] = None):
+    """Write page views buffered by AnalyticsMiddleware with bulk_create"""
+    buffer = PageViewBuffer()
+    written = buffer.flush(max_batches=max_batches)
+    if written:
+        logger.info(f'Flushed {written} page views, dropped so far: {buffer.dropped_count()}')
+    return written
+
+@shared_task(ignore_result=True)
+def update_analytics_rollups():
+    """Fold new analytics rows into hourly and daily rollups"""
+    processed = update_rollups()
+    logger.info(f'Analytics rollups updated: {processed}')
+    return processed
+
+@shared_task(ignore_result=True, acks_late=True)
+def send_broadcast_chunk(chunk_id: int):
+    """Send one chunk of a Telegram broadcast, resuming from its saved position"""
+    processed = broadcast.send_chunk(chunk_id)
+    if processed:
+        logger.info(f'Broadcast chunk {chunk_id}: {processed} recipients processed')
+    return processed
+
+@shared_task(ignore_result=True)
+def resume_broadcasts():
+    """Requeue broadcast chunks whose worker crashed"""
+    resumed = broadcast.resume_broadcasts()
+    if resumed:
+        logger.warning(f'Requeued {resumed} broadcast chunks')
+    return resumed
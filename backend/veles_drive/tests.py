@@ -0,0 +1,73 @@
+import random
+from datetime import date, timedelta
+from unittest import skipUnless
+from django.test import SimpleTestCase, TestCase
+from .models import PageView
+from .services.analytics import AnalyticsService
+from .services.redis_client import get_redis_connection_or_none
+from .services.rollups import get_watermark, update_rollups
+from .services.sketches import HLL_KEY_PREFIX, add_users, count_users
+
+@skipUnless(get_redis_connection_or_none(), 'HyperLogLog sketches require django-redis')
+class UniqueUsersSketchAccuracyTest(SimpleTestCase):
+    """Accuracy of unique-user estimates merged from daily sketches"""
+
+    metric = 'accuracy_test'
+    days = [date(2024, 1, 1) + timedelta(days=offset) for offset in range(30)]
+    # Redis HLL standard error is 0.81%, allow about three standard errors
+    max_error = 0.025
+
+    def tearDown(self):
+        connection = get_redis_connection_or_none()
+        keys = list(connection.scan_iter(f'{HLL_KEY_PREFIX}:{self.metric}:*'))
+        if keys:
+            connection.delete(*keys)
+
+    def test_merged_estimate_error_by_cardinality(self):
+        """Estimates over a 30-day range stay within the error bound at every cardinality"""
+        rng = random.Random(42)
+        report = []
+        for cardinality in (100, 1000, 10000, 100000):
+            dimension = f'/cardinality/{cardinality}/'
+            users = range(cardinality * 1000, cardinality * 1001)
+            # Every user visits on a few random days: sketches overlap heavily
+            entries = [
+                (day, dimension, user_id)
+                for user_id in users
+                for day in rng.sample(self.days, 3)
+            ]
+            add_users(self.metric, entries)
+
+            estimate = count_users(self.metric, self.days, [dimension])[dimension]
+            error = abs(estimate - cardinality) / cardinality
+            report.append(f'{cardinality}: estimate {estimate}, error {error:.2%}')
+            self.assertLessEqual(error, self.max_error, '\n'.join(report))
+
+    def test_extra_users_are_merged_without_double_counting(self):
+        """Users of rows not yet in sketches are merged with the sketches as a union"""
+        dimension = '/tail/'
+        add_users(self.metric, [(self.days[0], dimension, user_id) for user_id in range(500)])
+
+        estimate = count_users(
+            self.metric, self.days, [dimension], extra_users={dimension: list(range(250, 750))}
+        )[dimension]
+
+        self.assertLessEqual(abs(estimate - 750) / 750, self.max_error)
+
+class HourlyPageViewsTest(TestCase):
+    """Hourly page views merge rollups with raw rows above the watermark"""
+
+    def create_page_view(self):
+        return PageView.objects.create(
+            path='/cars/', ip_address='127.0.0.1', user_agent='test', session_id='session'
+        )
+
+    def test_raw_tail_is_included(self):
+        self.create_page_view()
+        self.create_page_view()
+        update_rollups()
+        self.assertEqual(get_watermark('page_views'), PageView.objects.latest('id').id)
+        self.create_page_view()
+
+        stats = AnalyticsService.get_hourly_page_views(hours=1)
+        self.assertEqual(sum(row['views'] for row in stats), 3)
@@ -27,6 +27,8 @@ from .services.youtube import YouTubeService
 from .services.analytics import AnalyticsService
 from .services.seo import RobotsTxtService
 from .services.ab_testing import ABTestingService
+from core.decorators import queryset_etag_response
+from core.pagination import CatalogPagination
 from django.http import HttpResponse
 
 class BrandViewSet(viewsets.ModelViewSet):
@@ -76,6 +78,8 @@ class CarViewSet(viewsets.ModelViewSet):
     queryset = Car.objects.all()
     serializer_class = CarSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = CatalogPagination
+    ordering_fields = ['created_at', 'price', 'year', 'mileage']
 
     def get_queryset(self):
         queryset = Car.objects.all()
@@ -184,6 +188,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
     queryset = Article.objects.filter(status='published')
     serializer_class = ArticleSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+    pagination_class = CatalogPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'tags', 'author', 'is_featured']
     search_fields = ['title', 'content', 'excerpt']
@@ -195,6 +200,14 @@ class ArticleViewSet(viewsets.ModelViewSet):
             return Article.objects.all()
         return queryset
 
+    @queryset_etag_response()
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @queryset_etag_response()
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -608,6 +621,13 @@ class AnalyticsViewSet(viewsets.ViewSet):
         stats = AnalyticsService.get_user_retention(days)
         return Response(stats)
 
+    @action(detail=False, methods=['get'])
+    def hourly_page_views(self, request):
+        """Get page views per hour"""
+        hours = int(request.query_params.get('hours', 24))
+        stats = AnalyticsService.get_hourly_page_views(hours)
+        return Response(stats)
+
 class SEOMetadataViewSet(viewsets.ModelViewSet):
     queryset = SEOMetadata.objects.all()
     serializer_class = SEOMetadataSerializer